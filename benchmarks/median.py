@@ -0,0 +1,38 @@
+"""Compare the running median methods of `hloopy.median` with
+scipy.signal.medfilt on this installation, to check (or tune)
+`hloopy.median.WAVELET_KS_PER_BIT`.
+
+    python benchmarks/median.py
+"""
+import time
+import numpy as np
+from scipy.signal import medfilt
+from hloopy.median import running_median
+
+# (shape of the traces, kernel size)
+CASES = [((1, 10**5), 5), ((1, 10**5), 17), ((1, 10**5), 101),
+         ((1, 10**5), 1001), ((400, 10**3), 5), ((400, 10**3), 51)]
+
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    res = func(*args, **kwargs)
+    return time.time() - start, res
+
+
+def main():
+    rng = np.random.RandomState(0)
+    print('{:>14} {:>6} {:>9} {:>9} {:>9}'.format(
+        'shape', 'ks', 'medfilt', 'ndimage', 'wavelet'))
+    for shape, ks in CASES:
+        a = rng.randn(*shape)
+        t_med, _ = timed(lambda: [medfilt(r, ks) for r in a])
+        t_nd, r_nd = timed(running_median, a, ks, 'constant', 'ndimage')
+        t_wv, r_wv = timed(running_median, a, ks, 'constant', 'wavelet')
+        assert np.array_equal(r_nd, r_wv)
+        print('{:>14} {:>6} {:9.3f} {:9.3f} {:9.3f}'.format(
+            str(shape), ks, t_med, t_nd, t_wv))
+
+
+if __name__ == '__main__':
+    main()
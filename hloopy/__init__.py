@@ -2,7 +2,9 @@ from . import extract
 from . import util
 from . import plotters
 from . import transformations
-from hloopy.hloop import HLoop, HLoopGrid
+from hloopy.hloop import HLoop, HLoopGrid, HLoopList
+from hloopy.stack import HLoopStack
+from hloopy.table import ExtractTable
 import os
 from os import path as _path
 import sys
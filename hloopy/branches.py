@@ -0,0 +1,134 @@
+"""Sweep structure of hysteresis loops: where the field is ascending or
+descending, the turning points between sweeps and the cycle boundaries.
+
+Measured fields are noisy, so the sign of `diff(x)` flips many times on
+every sweep. A turning point is therefore only accepted at the extreme of
+a visit to the top or bottom `zone` (a fraction of the field range) of the
+loop. Finding the turning points is a single vectorized O(N) pass and works
+the same on one loop or on a 2d array of loops.
+"""
+import numpy as np
+
+ZONE = 0.25
+
+
+def turning_points_rows(x, zone=ZONE):
+    """Turning points of each row of the 2d array `x`.
+
+    Args:
+        x (ndarray): Array of shape (nloops, npoints).
+        zone (float): Fraction of the field range at the top and bottom of
+            a loop in which its turning points are looked for.
+
+    Returns:
+        (rows, cols, kinds): Flat arrays giving the position of every
+            turning point in row order. `kinds` is +1 for a maximum (the
+            field descends after it) and -1 for a minimum.
+    """
+    x = np.atleast_2d(x)
+    n, N = x.shape
+    empty = np.array([], dtype=np.intp)
+    if x.size == 0:
+        return empty, empty, np.array([], dtype=np.int8)
+    lo, hi = x.min(axis=1), x.max(axis=1)
+    span = (hi - lo) * zone
+    state = np.zeros(x.shape, dtype=np.int8)
+    state[x <= (lo + span)[:, None]] = -1
+    state[x >= (hi - span)[:, None]] = 1
+    state[hi == lo] = 0
+    # Carry the last visited zone forward, so each row is split into runs
+    # that start on entering the top or bottom zone.
+    cols = np.arange(N)
+    last = np.where(state != 0, cols, -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    rows = np.arange(n)[:, None]
+    visited = state[rows, np.maximum(last, 0)]
+    visited[last < 0] = 0
+    new_run = np.ones(x.shape, dtype=bool)
+    new_run[:, 1:] = visited[:, 1:] != visited[:, :-1]
+    visited = visited.ravel()
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.append(starts, x.size))
+    # The turning point of a run is the first point of its extreme.
+    v = x.ravel() * visited
+    run_max = np.maximum.reduceat(v, starts)
+    cand = np.flatnonzero(v == np.repeat(run_max, lengths))
+    run_ids, first = np.unique(np.searchsorted(starts, cand, 'right') - 1,
+                               return_index=True)
+    tps = cand[first][visited[starts[run_ids]] != 0]
+    # The last point of a loop is not a turning point, the sweep simply
+    # stops there.
+    tps = tps[(tps % N) != N - 1]
+    return tps // N, tps % N, visited[tps]
+
+
+def directions_rows(x, zone=ZONE, turning_points=None):
+    """Sweep direction of every point of each row of the 2d array `x`:
+    +1 ascending, -1 descending, and 0 for loops with a constant field.
+    A turning point belongs to the sweep that starts at it.
+
+    Args:
+        turning_points: Result of `turning_points_rows(x, zone)`, if
+            already computed.
+    """
+    x = np.atleast_2d(x)
+    n, N = x.shape
+    if turning_points is None:
+        turning_points = turning_points_rows(x, zone)
+    rows, cols, kinds = turning_points
+    marker = np.zeros(x.shape, dtype=np.int8)
+    marker[rows, cols] = -kinds
+    last = np.where(marker != 0, np.arange(N), -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    r = np.arange(n)[:, None]
+    direction = marker[r, np.maximum(last, 0)]
+    # Points before the first turning point sweep the other way.
+    first = marker[np.arange(n), np.argmax(marker != 0, axis=1)]
+    before = last < 0
+    direction[before] = np.broadcast_to(-first[:, None], x.shape)[before]
+    return direction
+
+
+class Branches:
+    """Sweep structure of a single loop, see the module docstring.
+
+    Attributes:
+        turning_points (ndarray): Indices at which a sweep starts, in
+            order. A loop starting at a field extreme has a turning point
+            at index 0.
+        kinds (ndarray): +1 for each turning point that is a maximum,
+            -1 for a minimum.
+        direction (ndarray): +1 for points on an ascending sweep, -1 on a
+            descending sweep.
+    """
+    def __init__(self, x, zone=ZONE):
+        x = np.asarray(x)
+        tps = turning_points_rows(x[None, :], zone)
+        self.size = len(x)
+        self.turning_points = tps[1]
+        self.kinds = tps[2]
+        self.direction = directions_rows(x[None, :], turning_points=tps)[0]
+        self.direction.flags.writeable = False
+
+    def ascending(self):
+        """Boolean mask of the points on ascending sweeps."""
+        return self.direction == 1
+
+    def descending(self):
+        """Boolean mask of the points on descending sweeps."""
+        return self.direction == -1
+
+    def segments(self):
+        """List of (start, stop, direction), one for each sweep."""
+        bounds = np.unique(np.concatenate(([0], self.turning_points,
+                                           [self.size])))
+        return [(start, stop, int(self.direction[start]))
+                for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def cycle_boundaries(self):
+        """Indices at which each full cycle starts: every turning point of
+        the same kind as the first one.
+        """
+        if len(self.kinds) == 0:
+            return self.turning_points
+        return self.turning_points[self.kinds == self.kinds[0]]
@@ -0,0 +1,471 @@
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from os.path import join, abspath, expanduser, getsize, getmtime
+import numpy as np
+
+
+class SidecarCache:
+    """On-disk cache of parsed datafiles. The numeric columns of a parsed
+    datafile are written to a binary `.npy` file so that later reads can
+    memory-map them instead of parsing the text file again.
+
+    Entries are keyed on the absolute path of the datafile and the reader
+    options. The size and modification time of the datafile are stored
+    alongside each entry; if either has changed the entry is stale and is
+    removed the next time it is looked up. When the cache grows beyond
+    `max_bytes` the least recently used entries are evicted. The size of
+    the cache is tracked as entries are stored, the directory is only
+    scanned again when that goes over `max_bytes`.
+
+    Args:
+        cachedir (str): Directory to store the cache in. Default is
+            `~/.cache/hloopy`.
+        max_bytes (int): Size bound for the cache directory. `None` means
+            unbounded.
+    """
+    def __init__(self, cachedir=None, max_bytes=2**30):
+        if cachedir is None:
+            cachedir = join(expanduser('~'), '.cache', 'hloopy')
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cachedir, exist_ok=True)
+        # Size of the cache directory, found on the first store().
+        self._nbytes = None
+
+    def key(self, fpath, read_kwargs):
+        """Cache key of the datafile `fpath` read with `read_kwargs`."""
+        kw = sorted((k, repr(v)) for k, v in read_kwargs.items())
+        s = repr((abspath(fpath), kw))
+        return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        base = join(self.cachedir, key)
+        return base + '.npy', base + '.json'
+
+    def _stamp(self, fpath):
+        return getsize(fpath), getmtime(fpath)
+
+    def meta(self, fpath, read_kwargs):
+        """Metadata (`columns`, `shape`, ...) of a fresh cache entry, or
+        `None` if there is no fresh entry. Stale entries are removed.
+        """
+        key = self.key(fpath, read_kwargs)
+        npypath, metapath = self._paths(key)
+        try:
+            with open(metapath) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        size, mtime = self._stamp(fpath)
+        if meta['size'] != size or meta['mtime'] != mtime:
+            self.remove(key)
+            return None
+        return meta
+
+    def load(self, fpath, read_kwargs):
+        """Memory-map the cached data of `fpath`.
+
+        Returns:
+            (data, meta): A 2d array (copy-on-write memmap) and the entry's
+                metadata (see `meta()`), or `None` if the entry is missing
+                or stale.
+        """
+        meta = self.meta(fpath, read_kwargs)
+        if meta is None:
+            return None
+        npypath, metapath = self._paths(self.key(fpath, read_kwargs))
+        try:
+            data = np.load(npypath, mmap_mode='c')
+        except (OSError, ValueError):
+            self.remove(self.key(fpath, read_kwargs))
+            return None
+        # Touch the entry so that eviction is least recently used.
+        os.utime(metapath, None)
+        return data, meta
+
+    def store(self, fpath, read_kwargs, df, header=None):
+        """Write the columns of `df`, parsed from `fpath`, to the cache.
+        Frames whose columns are not all of the same numeric dtype (they
+        are stored as one 2d array) or that have a non-default index are
+        not cached. A `header` line read along with the data is kept in
+        the metadata.
+
+        Returns:
+            True if the frame was cached.
+        """
+        if not self.cacheable(df):
+            return False
+        key = self.key(fpath, read_kwargs)
+        npypath, metapath = self._paths(key)
+        size, mtime = self._stamp(fpath)
+        meta = {'fpath': abspath(fpath), 'size': size, 'mtime': mtime,
+                'columns': [str(c) for c in df.columns],
+                'shape': list(df.shape), 'header': header}
+        # Write to temporary files and rename so that a half written entry
+        # is never seen by another process. The names are unique, also
+        # between threads storing the same key.
+        fd, tmpnpy = tempfile.mkstemp(prefix=key + '.', suffix='.tmp.npy',
+                                      dir=self.cachedir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.ascontiguousarray(df.values))
+        fd, tmpmeta = tempfile.mkstemp(prefix=key + '.', suffix='.tmp.json',
+                                       dir=self.cachedir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        added = getsize(tmpnpy) + getsize(tmpmeta)
+        if self._nbytes is None:
+            self._nbytes = self.nbytes()
+        self._nbytes -= self._entry_nbytes(key)
+        os.replace(tmpnpy, npypath)
+        os.replace(tmpmeta, metapath)
+        self._nbytes += added
+        if self.max_bytes is not None and self._nbytes > self.max_bytes:
+            self.evict()
+        return True
+
+    @staticmethod
+    def cacheable(df):
+        index = df.index
+        if not (index.dtype.kind == 'i' and index.is_monotonic_increasing
+                and (len(index) == 0 or
+                     (index[0] == 0 and index[-1] == len(index) - 1))):
+            return False
+        if not all(str(c) == c for c in df.columns):
+            return False
+        dtypes = set(df.dtypes)
+        return len(dtypes) <= 1 and all(dt.kind in 'biuf' for dt in dtypes)
+
+    def _entry_nbytes(self, key):
+        n = 0
+        for p in self._paths(key):
+            try:
+                n += getsize(p)
+            except OSError:
+                pass
+        return n
+
+    def remove(self, key):
+        """Remove the entry `key` from the cache."""
+        if self._nbytes is not None:
+            self._nbytes -= self._entry_nbytes(key)
+        for p in self._paths(key):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def entries(self):
+        """List of (key, nbytes, last_used) for all entries."""
+        res = []
+        for name in os.listdir(self.cachedir):
+            if not name.endswith('.json') or name.endswith('.tmp.json'):
+                continue
+            key = name[:-len('.json')]
+            npypath, metapath = self._paths(key)
+            try:
+                nbytes = getsize(npypath) + getsize(metapath)
+                last_used = getmtime(metapath)
+            except OSError:
+                continue
+            res.append((key, nbytes, last_used))
+        return res
+
+    def nbytes(self):
+        """Total size of the cache in bytes."""
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache is smaller
+        than `max_bytes`.
+        """
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        self._nbytes = sum(e[1] for e in entries)
+        if self.max_bytes is None:
+            return
+        for key, nbytes, _ in entries:
+            if self._nbytes <= self.max_bytes:
+                break
+            self.remove(key)
+
+    def clear(self):
+        """Remove all entries."""
+        for key, _, _ in self.entries():
+            self.remove(key)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """The SidecarCache used by `HLoop(..., cache=True)`."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SidecarCache()
+    return _default_cache
+
+
+class ExtractCache:
+    """In-memory LRU cache of extracts, shared by the plotters and
+    `ExtractWriter` (see `hloopy.extract.cached_extract`).
+
+    Entries are keyed on the extract class (or function), its keyword
+    parameters and the loop. Loops are keyed either by identity (the
+    default, `HLoop.cache_key()`, which changes when `setas()` is called)
+    or by a hash of their x and y data.
+
+    The cache only holds weak references to the loops, and the entries of
+    a loop are dropped once it is garbage collected (so a new loop that
+    gets its id can't be given them). Extract objects do hold their loop
+    (`extract.hloop`), so the memory of the loop is counted towards
+    `max_bytes` for those.
+
+    Args:
+        maxsize (int): Maximum number of entries. `None` for no limit.
+        max_bytes (int): Approximate bound on the memory held by cached
+            extracts, including the loops they keep alive (the parsed data
+            of each loop is counted once, when it is first cached). `None`
+            for no limit.
+        key_by (str): 'identity' or 'content'.
+    """
+    def __init__(self, maxsize=4096, max_bytes=None, key_by='identity'):
+        if key_by not in ('identity', 'content'):
+            raise ValueError('Arg "key_by" must be "identity" or "content"')
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.key_by = key_by
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        # id(hloop) -> [weakref to hloop, nbytes, keys of its entries].
+        self._loops = {}
+        # ids of collected loops whose entries are still to be dropped.
+        self._dead = []
+        self._lock = threading.Lock()
+
+    def loop_key(self, hloop):
+        if self.key_by == 'content':
+            h = hashlib.sha1()
+            for arr in (hloop.x(), hloop.y()):
+                h.update(np.ascontiguousarray(arr))
+            return h.hexdigest()
+        if hasattr(hloop, 'cache_key'):
+            return hloop.cache_key()
+        return id(hloop), getattr(hloop, 'version', 0)
+
+    def key(self, extract, hloop, params):
+        # A shared hloopy.extract.LoopData only saves work, it does not
+        # change the result.
+        params = tuple(sorted((k, v) for k, v in params.items()
+                              if k != 'data'))
+        return extract, self.loop_key(hloop), params
+
+    def get(self, extract, hloop, **params):
+        """Return `extract(hloop, **params)`, computing it only if it is
+        not already cached.
+        """
+        key = self.key(extract, hloop, params)
+        with self._lock:
+            self._purge()
+            entry = self._entries.get(key)
+            if entry is not None and (self.key_by == 'content' or
+                                      self._loops[entry[1]][0]() is hloop):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = extract(hloop, **params)
+        entry = (value, id(hloop), _extract_nbytes(value))
+        with self._lock:
+            self._purge()
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._drop(key, old)
+            loop = self._loops.get(id(hloop))
+            if loop is not None and loop[0]() is not hloop:
+                # A collected loop's id, reused before its callback ran.
+                self._drop_loop(id(hloop))
+                loop = None
+            if loop is None:
+                # The loop's data is only held through extract.hloop.
+                nbytes = (_loop_nbytes(hloop)
+                          if getattr(value, 'hloop', None) is hloop else 0)
+                loop = self._loops[id(hloop)] = [self._ref(hloop), nbytes,
+                                                 set()]
+                self.nbytes += nbytes
+            loop[2].add(key)
+            self._entries[key] = entry
+            self.nbytes += entry[2]
+            self._evict()
+        return value
+
+    def _ref(self, hloop):
+        dead = self._dead
+        i = id(hloop)
+        try:
+            return weakref.ref(hloop, lambda r: dead.append(i))
+        except TypeError:
+            # Not weakly referenceable, hold it so its id isn't reused.
+            return lambda: hloop
+
+    def _purge(self):
+        """Drop the entries of the loops that were garbage collected."""
+        while self._dead:
+            i = self._dead.pop()
+            loop = self._loops.get(i)
+            if loop is not None and loop[0]() is None:
+                self._drop_loop(i)
+
+    def _drop_loop(self, i):
+        loop = self._loops.pop(i)
+        for key in loop[2]:
+            self.nbytes -= self._entries.pop(key)[2]
+        self.nbytes -= loop[1]
+
+    def _drop(self, key, entry):
+        """Account for the removal of `entry`, and of its loop if no other
+        entry holds it.
+        """
+        self.nbytes -= entry[2]
+        loop = self._loops[entry[1]]
+        loop[2].discard(key)
+        if not loop[2]:
+            del self._loops[entry[1]]
+            self.nbytes -= loop[1]
+
+    def _evict(self):
+        while self._entries and (
+                (self.maxsize is not None and 
+                 len(self._entries) > self.maxsize) or
+                (self.max_bytes is not None and 
+                 self.nbytes > self.max_bytes)):
+            key, entry = self._entries.popitem(last=False)
+            self._drop(key, entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._loops.clear()
+            self.hits = self.misses = self.nbytes = 0
+
+    def stats(self):
+        """dict of hits, misses, entries and nbytes."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self), 'nbytes': self.nbytes}
+
+
+def _loop_nbytes(hloop):
+    """Memory held by `hloop`: its parsed frame, and the arrays of its
+    `arrays()` that are not views of other data.
+    """
+    n = 0
+    df = getattr(hloop, '_df', None)
+    if df is not None:
+        n += int(df.memory_usage(index=True).sum())
+    arrays = getattr(hloop, '_arrays', None) or ()
+    for a in arrays[1:]:
+        if isinstance(a, np.ndarray) and a.base is None:
+            n += a.nbytes
+    return n
+
+
+def _extract_nbytes(e):
+    n = sys.getsizeof(e)
+    for k, v in getattr(e, '__dict__', {}).items():
+        if isinstance(v, np.ndarray):
+            n += v.nbytes
+    return n
+
+
+_default_extract_cache = None
+
+
+def default_extract_cache():
+    """The ExtractCache used by the plotters and ExtractWriter."""
+    global _default_extract_cache
+    if _default_extract_cache is None:
+        _default_extract_cache = ExtractCache(max_bytes=2**28)
+    return _default_extract_cache
+
+
+class TransformCache:
+    """In-memory LRU cache of the intermediate (x, y) results of
+    transformation chains, see `hloopy.transformations.TransformedHLoop`.
+
+    Entries are keyed on the source loop (`cache_key()`) and the chain of
+    (function, params) steps that produced them, so chains that share
+    their first steps share those results.
+
+    Args:
+        max_bytes (int): Bound on the memory held by cached arrays. `None`
+            for no limit.
+    """
+    def __init__(self, max_bytes=2**28):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(x, y) cached under `key`, or `None`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, xy, source=None):
+        """Cache the arrays `xy` under `key`. The `source` loop is held so
+        that its id is not reused while the entry lives.
+        """
+        nbytes = sum(u.nbytes for u in xy)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self._entries[key] = (xy, source, nbytes)
+            self.nbytes += nbytes
+            while (self.max_bytes is not None and len(self._entries) > 1 and
+                   self.nbytes > self.max_bytes):
+                _, entry = self._entries.popitem(last=False)
+                self.nbytes -= entry[2]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.nbytes = 0
+
+    def stats(self):
+        """dict of hits, misses, entries and nbytes."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self), 'nbytes': self.nbytes}
+
+
+_default_transform_cache = None
+
+
+def default_transform_cache():
+    """The TransformCache used by TransformedHLoop."""
+    global _default_transform_cache
+    if _default_transform_cache is None:
+        _default_transform_cache = TransformCache()
+    return _default_transform_cache
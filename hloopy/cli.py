@@ -42,6 +42,9 @@ Options:
                                [default: \t]
     --smoothwidth=INT          Width parameter for the gaussian smoother.
                                [default: 20]
+    -j --workers=INT           Number of processes used to read the
+                               datafiles in 'scmoke' mode.
+                               [default: 1]
     --showaxes                 By default the axes around the loops are not
                                drawn. Pass this parameter to draw them.
     --verbose                  Print out more messages.
@@ -72,8 +75,11 @@ def scmoke(d):
     pat = '.*averaged.txt'
     datapaths = [join(scandir, f) for f in os.listdir(scandir) 
                  if re.match(pat, f)]
-    hls = [hlpy.HLoop(f, sep='\t', skiprows=1) for f in datapaths]
-    [hl.setas('x.y') for hl in hls]
+    hls = hlpy.HLoop.load_many(datapaths, workers=d['--workers'], 
+                               backend='process', setas='x.y', sep='\t', 
+                               skiprows=1)
+    for fpath, err in hls.errors:
+        print('Could not load {}: {}'.format(fpath, err))
     hideaxes = not d['--showaxes']
     lablevel = 1 if d['--folderisid'] else 0
     gp = GridPlot(hls, hideaxes=hideaxes, legend=True, lablevel=lablevel)
@@ -95,6 +101,7 @@ def main():
     d = docopt(__doc__)
     print(d)
     d['--skiprows'] = int(d['--skiprows'])
+    d['--workers'] = int(d['--workers'])
     commands = {
         'scmoke': scmoke, 
         'arb': arb,
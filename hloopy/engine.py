@@ -0,0 +1,172 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from hloopy.hloop import HLoop, HLoopGrid
+from hloopy.stack import HLoopStack
+from hloopy.extract import cached_extracts
+from hloopy.table import ExtractTable
+from hloopy.shared import SharedStack, StackHandle
+
+
+class ExtractEngine:
+    """Headless, parallel extraction over the sites of an HLoopGrid.
+
+    The sites are split into chunks that are loaded and extracted in a
+    process (or thread) pool. Results come back as an
+    `hloopy.table.ExtractTable` with the grid row and column of every
+    extract, ready to be handed to the plotters (see `ExtractGridPlot`'s
+    `results` argument) or written out. A site that fails to load or
+    extract is recorded and the run carries on.
+
+    Args:
+        extracts (sequence): Extract classes, or (class, kwargs) pairs.
+        workers (int): Number of processes or threads. `None` for one per
+            cpu, 1 runs everything in this process.
+        chunksize (int): Number of sites per task. By default the sites are
+            spread over about 4 tasks per worker.
+        backend (str): 'process' or 'thread'.
+        shared (str): How loop data already in memory is sent to worker
+            processes: 'shm' or 'mmap' place it in shared memory once
+            (see `hloopy.shared`) so workers get only a small handle,
+            `None` pickles every loop. Used for HLoopStack sources and for
+            HLoopGrids whose loops are all loaded.
+    """
+    def __init__(self, extracts, workers=None, chunksize=None,
+                 backend='process', shared='shm'):
+        if backend not in ('process', 'thread'):
+            msg = 'Arg "backend" must be "thread" or "process", not {}'
+            raise ValueError(msg.format(backend))
+        self.extracts = list(extracts)
+        self.workers = workers
+        self.chunksize = chunksize
+        self.backend = backend
+        self.shared = shared
+
+    def run(self, source, mapping_func=None, **kwargs):
+        """Extract every site of `source`.
+
+        Args:
+            source: An HLoopGrid, an HLoopStack, or a sequence of datafile
+                paths. Stacks and paths are laid out with
+                `HLoopGrid(hloops, mapping_func)`. Paths are opened by the
+                workers as `HLoop(fpath, **kwargs)`.
+
+        Returns:
+            ExtractTable: One row per site and extract, in grid order. Its
+                `shape` attribute is the grid shape and `errors` lists the
+                sites that failed as (fpath, exception).
+        """
+        workers = self.workers or os.cpu_count() or 1
+        to_processes = workers > 1 and self.backend == 'process'
+        stack = None
+        if isinstance(source, HLoopStack):
+            stack = source
+            grid = HLoopGrid(list(stack), mapping_func)
+        elif isinstance(source, HLoopGrid):
+            grid = source
+            if (to_processes and self.shared and
+                    all(hl.is_loaded() for hl in grid.hloops)):
+                stack = HLoopStack.from_hloops(grid.hloops)
+        if stack is not None:
+            sites = [(i, row, col)
+                     for i, (row, col) in enumerate(grid.mapping)]
+        elif isinstance(source, HLoopGrid):
+            sites = [(hl, row, col)
+                     for hl, (row, col) in zip(grid.hloops, grid.mapping)]
+        else:
+            # Placeholders for the layout only, nothing is read here.
+            grid = HLoopGrid([HLoop(f, lazy=True) for f in source],
+                             mapping_func)
+            kwargs.setdefault('lazy', True)
+            sites = [(hl.fpath, row, col)
+                     for hl, (row, col) in zip(grid.hloops, grid.mapping)]
+        chunksize = self.chunksize or max(1, -(-len(sites) // (4 * workers)))
+        chunks = [sites[i:i + chunksize]
+                  for i in range(0, len(sites), chunksize)]
+        shared = None
+        if stack is not None and to_processes and self.shared:
+            shared = SharedStack(stack, kind=self.shared)
+            stack = shared
+        try:
+            results = self._map(chunks, kwargs, stack, workers)
+        finally:
+            if shared is not None:
+                shared.close()
+        table = ExtractTable()
+        table.errors = []
+        for chunk_table, errors in results:
+            table.extend(chunk_table)
+            table.errors.extend(errors)
+        table.shape = grid.shape
+        return table
+
+    def _map(self, chunks, kwargs, stack, workers):
+        args = (self.extracts, kwargs, stack)
+        if workers == 1:
+            return [_run_chunk(c, *args) for c in chunks]
+        Executor = (ProcessPoolExecutor if self.backend == 'process'
+                    else ThreadPoolExecutor)
+        with Executor(max_workers=workers) as ex:
+            futures = [ex.submit(_run_chunk, *self._task(c, stack, kwargs))
+                       for c in chunks]
+            return [f.result() for f in futures]
+
+    def _task(self, chunk, stack, kwargs):
+        if isinstance(stack, SharedStack):
+            # Shared: send the handle with the paths of just its loops.
+            inds = [i for i, _, _ in chunk]
+            fpaths = [stack.stack.fpaths[i] for i in inds]
+            stack = stack.handle.for_loops(inds, fpaths)
+        elif self.backend == 'process' and isinstance(stack, HLoopStack):
+            # Not shared: send each worker a copy of just its loops.
+            sub = stack[np.array([i for i, _, _ in chunk])]
+            chunk = [(j, row, col) for j, (_, row, col) in enumerate(chunk)]
+            stack = sub
+        return chunk, self.extracts, kwargs, stack
+
+
+def _run_chunk(sites, extracts, kwargs, stack=None):
+    """Load and extract the (site, row, col) `sites`. Runs in a worker.
+    A site is an HLoop, a path (opened with `HLoop(fpath, **kwargs)`) or
+    the index of a loop in `stack`, an HLoopStack or StackHandle.
+
+    Returns:
+        (ExtractTable, errors)
+    """
+    table = ExtractTable(capacity=max(1, len(sites) * len(extracts)))
+    errors = []
+    handle = None
+    if isinstance(stack, StackHandle):
+        handle, stack = stack, stack.attach()
+    try:
+        _extract_sites(sites, extracts, kwargs, stack, table, errors)
+    finally:
+        if handle is not None:
+            # Workers live on between tasks, don't keep the block mapped.
+            stack = None
+            handle.detach()
+    return table, errors
+
+
+def _extract_sites(sites, extracts, kwargs, stack, table, errors):
+    """Add the extracts of `sites` to `table` and their failures to
+    `errors`. Apart from these, nothing of the loops outlives the call.
+    """
+    for hl, row, col in sites:
+        if stack is not None:
+            hl = stack[hl]
+        fpath = hl if isinstance(hl, str) else hl.fpath
+        n = len(table)
+        try:
+            if isinstance(hl, str):
+                hl = HLoop(hl, **kwargs)
+            # The extract cache is no use for a one-off pass in a worker.
+            for e in cached_extracts(extracts, hl, cache=False):
+                table.add(e, fpath, row, col)
+        except Exception as e:
+            # Drop the rows of the site's extracts that did work.
+            table.truncate(n)
+            errors.append((fpath, e))
+            continue
+        if getattr(hl, 'lazy', False):
+            hl.release()
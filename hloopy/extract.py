@@ -1,7 +1,131 @@
 import numpy as np
-import pandas as pd
-from os.path import split
 import re
+from hloopy.cache import default_extract_cache
+from hloopy.branches import Branches, directions_rows
+
+
+class LoopData:
+    """The x and y data of one loop together with intermediate results
+    that several extracts need (centered y, abs(x), histograms...). Each
+    intermediate is computed the first time it is asked for and then
+    kept, so extracts given the same LoopData (see `extract_many`) share
+    that work.
+
+    Args:
+        x, y (ndarray): Loop data.
+    """
+    def __init__(self, x=None, y=None):
+        self._x, self._y = x, y
+        self._hloop = None
+        self._memo = {}
+
+    @classmethod
+    def from_hloop(cls, hloop):
+        """LoopData of `hloop`. Its data is only fetched when needed."""
+        data = cls()
+        data._hloop = hloop
+        return data
+
+    def _load(self):
+        self._x, self._y = _arrays(self._hloop)
+
+    @property
+    def x(self):
+        if self._x is None:
+            self._load()
+        return self._x
+
+    @property
+    def y(self):
+        if self._y is None:
+            self._load()
+        return self._y
+
+    def _get(self, key, func):
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = func()
+            return value
+
+    def abs_yc(self):
+        """abs(y - y.mean())"""
+        return self._get('abs_yc', lambda: np.abs(self.y - self.y.mean()))
+
+    def abs_x(self):
+        """abs(x)"""
+        return self._get('abs_x', lambda: np.abs(self.x))
+
+    def branches(self):
+        """Sweep structure of the loop, see `hloopy.branches`. Loops that
+        keep their own (`HLoop.branches()`) are asked for it.
+        """
+        if hasattr(self._hloop, 'branches'):
+            return self._get('branches', self._hloop.branches)
+        return self._get('branches', lambda: Branches(self.x))
+
+    def histogram(self, bins):
+        """np.histogram(y, bins)"""
+        return self._get(('histogram', bins),
+                         lambda: np.histogram(self.y, bins=bins))
+
+
+def extract_many(hloop, extracts):
+    """Compute several extracts of one loop, doing the preparatory work
+    they have in common (getting the arrays, centering, abs, histograms)
+    only once. Results are the same as creating each extract on its own.
+
+    Args:
+        hloop (HLoop): Loop to be operated on.
+        extracts (sequence): Extract classes, or (class, kwargs) pairs
+            like `(Saturation, {'bins': 30})`.
+
+    Returns:
+        list: The extract instances, in the order requested.
+    """
+    data = LoopData.from_hloop(hloop)
+    res = []
+    for e in extracts:
+        e, kwargs = e if isinstance(e, tuple) else (e, {})
+        if getattr(e, 'shares_loopdata', False):
+            res.append(e(hloop, data=data, **kwargs))
+        else:
+            res.append(e(hloop, **kwargs))
+    return res
+
+
+def cached_extracts(extracts, hloop, cache=None):
+    """Like `extract_many`, but each extract is looked up in (and added
+    to) the extract cache first, see `cached_extract`.
+    """
+    data = LoopData.from_hloop(hloop)
+    res = []
+    for e in extracts:
+        e, kwargs = e if isinstance(e, tuple) else (e, {})
+        if getattr(e, 'shares_loopdata', False):
+            kwargs = dict(kwargs, data=data)
+        res.append(cached_extract(e, hloop, cache=cache, **kwargs))
+    return res
+
+
+def cached_extract(extract, hloop, cache=None, **kwargs):
+    """Get `extract(hloop, **kwargs)` from an `hloopy.cache.ExtractCache`,
+    computing it only if needed. This is how the plotters and
+    ExtractWriter get their extracts.
+
+    Args:
+        extract (callable): An extract class like Coercivity.
+        hloop (HLoop): Loop to be operated on.
+        cache: An ExtractCache. `None` uses the shared default cache,
+            `False` skips caching.
+        kwargs: Extract parameters, e.g. `avg_width`.
+    """
+    if cache is False:
+        return extract(hloop, **kwargs)
+    if cache is None:
+        cache = default_extract_cache()
+    return cache.get(extract, hloop, **kwargs)
+
 
 class ExtractBase:
     """Container for parameters extracted from a hysteresis loop.
@@ -49,7 +173,8 @@ class ExtractBase:
 
 def coercivity(hloop, avg_width=10):
     """Find the coercivity of an hloop, determined as the x-intercepts of
-    each (centered with :code:`y -= y.mean()`) branch.
+    the (centered with :code:`y -= y.mean()`) ascending and descending
+    branches.
 
     Args:
         hloop (hloopy.hloop): Hloop to be operated on
@@ -58,61 +183,110 @@ def coercivity(hloop, avg_width=10):
         extracted_params (hloop.Extract)
     """
 
-    x, y = np.array(hloop.x()), np.array(hloop.y())
-    N = len(y)
-    yc = y - y.mean()  # y-centered
-    ych0, ych1 = yc[:N//2], yc[N//2:]  # y-centered-half0/1
-    hc_indices = list(np.argmin(np.abs(y)) for y in (ych0, ych1))
-    hc_indices[1] += N//2
-    Hc_avgs = tuple(x[i - avg_width:i + avg_width].mean() for i in hc_indices)
-    Hc = abs(Hc_avgs[1] - Hc_avgs[0])/2.0
-    hc_indices = np.array(hc_indices)
-    return ExtractBase(label='coercivity',
-                       label_short='Hc',
-                       avg_val=Hc,
-                       xcoords=x[hc_indices],
-                       ycoords=y[hc_indices],
-                       indices=hc_indices)
+    return ExtractBase(**Coercivity._compute(LoopData.from_hloop(hloop),
+                                             avg_width))
 
 
 class Coercivity(ExtractBase):
     """Find the coercivity of an hloop, determined as the x-intercepts of
-    each (centered with :code:`y -= y.mean()`) branch.
+    the (centered with :code:`y -= y.mean()`) ascending and descending
+    branches. The x values are averaged over `avg_width` points on either
+    side of each intercept.
+
+    Raises:
+        ValueError: If the loop does not have both branches.
     """
 
-    def __init__(self, hloop, avg_width=10):
+    shares_loopdata = True
+
+    def __init__(self, hloop, avg_width=10, data=None):
         self.label = 'coercivity'
         self.label_short = 'Hc'
         self.hloop = hloop
 
-        x, y = np.array(hloop.x()), np.array(hloop.y())
-        N = len(y)
-        yc = y - y.mean()  # y-centered
-        ych0, ych1 = yc[:N//2], yc[N//2:]  # y-centered-half0/1
-        hc_indices = list(np.argmin(np.abs(y)) for y in (ych0, ych1))
-        hc_indices[1] += N//2
-        Hc_avgs = [x[i - avg_width:i + avg_width].mean() for i in hc_indices]
+        if data is None:
+            data = LoopData.from_hloop(hloop)
+        extract_dict = self._compute(data, avg_width)
+
+        self.avg_val = extract_dict['avg_val']
+        self.xcoords = self.xs = extract_dict['xcoords']
+        self.ycoords = self.ys = extract_dict['ycoords']
+        self.indices = self.ixs = extract_dict['indices']
+
+    @staticmethod
+    def _compute(data, avg_width):
+        x, y = data.x, data.y
+        ycabs = data.abs_yc()  # abs of y-centered
+        hc_indices = _branch_argmins(ycabs, data.branches().direction)
+        Hc_avgs = [_window_mean(x, i, avg_width) for i in hc_indices]
         Hc = abs(Hc_avgs[1] - Hc_avgs[0])/2.0
-        hc_indices = np.array(hc_indices)
+        return dict(label='coercivity',
+                    label_short='Hc',
+                    avg_val=Hc,
+                    xcoords=x[hc_indices],
+                    ycoords=y[hc_indices],
+                    indices=hc_indices)
 
-        self.avg_val = Hc
-        self.xcoords = self.xs = x[hc_indices]
-        self.ycoords = self.ys = y[hc_indices]
-        self.indices = self.ixs =hc_indices
+    @staticmethod
+    def coercivity_batch(x, y, avg_width=10):
+        """Same algorithm as the Coercivity class, run on many loops at
+        once.
+
+        Args:
+            x, y (ndarray): Arrays of shape (nloops, npoints).
+            avg_width (int): As for the Coercivity class.
+
+        Returns:
+            dict: `avg_val` has shape (nloops,), `xcoords`, `ycoords` and
+                `indices` have shape (nloops, 2). Loops without both
+                branches get NaN values.
+        """
+        x, y = np.atleast_2d(x), np.atleast_2d(y)
+        hc_indices = np.empty((len(y), 2), dtype=np.intp)
+        valid = np.empty(len(y), dtype=bool)
+        for rows in _row_blocks(y):
+            yc = y[rows] - y[rows].mean(axis=1)[:, None]  # y-centered
+            np.abs(yc, out=yc)
+            hc_indices[rows], valid[rows] = _branch_argmins_rows(
+                yc, directions_rows(x[rows]))
+        Hc_avgs = _window_means(x, hc_indices, avg_width)
+        Hc = np.abs(Hc_avgs[:, 1] - Hc_avgs[:, 0])/2.0
+        rows = np.arange(len(y))[:, None]
+        return _invalid_to_nan(valid, dict(label='coercivity',
+                                           label_short='Hc',
+                                           avg_val=Hc,
+                                           xcoords=x[rows, hc_indices],
+                                           ycoords=y[rows, hc_indices],
+                                           indices=hc_indices))
+
+    @classmethod
+    def batch(cls, stack, avg_width=10):
+        """Coercivity of every loop in an `HLoopStack`, see
+        `coercivity_batch()`.
+        """
+        return _batch_over_stack(stack, cls.coercivity_batch, 
+                                 avg_width=avg_width)
 
 
 class Remanence(ExtractBase):
     """Find the remanence of an hloop, determined as the y-intercepts of
-    each branch.
+    the ascending and descending branches. The y values are averaged over
+    `avg_width` points on either side of each intercept.
+
+    Raises:
+        ValueError: If the loop does not have both branches.
     """
 
-    def __init__(self, hloop, avg_width=10):
+    shares_loopdata = True
+
+    def __init__(self, hloop, avg_width=10, data=None):
         self.label = 'remanence'
         self.label_short = 'Mrem'
         self.hloop = hloop
 
-        x, y = np.array(self.hloop.x()), np.array(self.hloop.y())
-        extract_dict = self.remanence(x, y, avg_width)
+        if data is None:
+            data = LoopData.from_hloop(hloop)
+        extract_dict = self._compute(data, avg_width)
 
         self.avg_val = extract_dict['avg_val']
         self.xcoords = self.xs = extract_dict['xcoords']
@@ -121,31 +295,17 @@ class Remanence(ExtractBase):
 
     @staticmethod
     def remanence(x, y, avg_width):
-        N = len(x)
-        # Force array len to be a multiple of 4. There are usually
-        # thousands of points in a MOKE measurement, cutting the last 3 
-        # (worst case) will not have a significant effect on the result.
-        N -= (N % 4)
-        x = x[:N]
-        y = y[:N]
-        # Divide into 4 quarters
-        #    import pdb; pdb.set_trace()
-        inds = np.arange(N).reshape(4, N//4)
-        yq03 = y[inds[[0, 3]]].reshape(N//2)  # yq03 = y quarters 0 and 3
-        xq03 = x[inds[[0, 3]]].reshape(N//2)
-        yq12 = y[inds[[1, 2]]].reshape(N//2)
-        xq12 = x[inds[[1, 2]]].reshape(N//2)
-        # get indices of B=0 in the half-arrays
-        xmq03i = np.argmin(np.abs(xq03))  # xmq03i = indsof x min quarters 0 and 3
-        xmq12i = np.argmin(np.abs(xq12))
-        # convert to indices in the full arrays
-        rem_ind_03 = inds[[0, 3]].reshape(N//2)[xmq03i]
-        rem_ind_12 = inds[[1, 2]].reshape(N//2)[xmq12i]
+        return Remanence._compute(LoopData(x, y), avg_width)
+
+    @staticmethod
+    def _compute(data, avg_width):
+        x, y = data.x, data.y
+        # indices of B=0 on each branch
+        direction = data.branches().direction
+        mrem_indices = _branch_argmins(data.abs_x(), direction)
         # Average over the kernel size
-        yq03avg = abs(np.mean(yq03[xmq03i - avg_width:xmq03i + avg_width]))
-        yq12avg = abs(np.mean(yq12[xmq12i - avg_width:xmq12i + avg_width]))
-        mrem = (yq03avg + yq12avg)/2.
-        mrem_indices = np.array([rem_ind_03, rem_ind_12])
+        yavgs = [abs(_window_mean(y, i, avg_width)) for i in mrem_indices]
+        mrem = (yavgs[0] + yavgs[1])/2.
         return dict(label='remanence',
                     label_short='Mrem',
                     avg_val=mrem,
@@ -153,6 +313,42 @@ class Remanence(ExtractBase):
                     ycoords=y[mrem_indices],
                     indices=mrem_indices)
 
+    @staticmethod
+    def remanence_batch(x, y, avg_width=10):
+        """Same algorithm as `remanence()`, run on many loops at once.
+
+        Args:
+            x, y (ndarray): Arrays of shape (nloops, npoints).
+
+        Returns:
+            dict: `avg_val` has shape (nloops,), `xcoords`, `ycoords` and
+                `indices` have shape (nloops, 2). Loops without both
+                branches get NaN values.
+        """
+        x, y = np.atleast_2d(x), np.atleast_2d(y)
+        mrem_indices = np.empty((len(x), 2), dtype=np.intp)
+        valid = np.empty(len(x), dtype=bool)
+        for rows in _row_blocks(x):
+            mrem_indices[rows], valid[rows] = _branch_argmins_rows(
+                np.abs(x[rows]), directions_rows(x[rows]))
+        yavgs = np.abs(_window_means(y, mrem_indices, avg_width))
+        mrem = (yavgs[:, 0] + yavgs[:, 1])/2.
+        rows = np.arange(len(x))[:, None]
+        return _invalid_to_nan(valid, dict(label='remanence',
+                                           label_short='Mrem',
+                                           avg_val=mrem,
+                                           xcoords=x[rows, mrem_indices],
+                                           ycoords=y[rows, mrem_indices],
+                                           indices=mrem_indices))
+
+    @classmethod
+    def batch(cls, stack, avg_width=10):
+        """Remanence of every loop in an `HLoopStack`, see
+        `remanence_batch()`.
+        """
+        return _batch_over_stack(stack, cls.remanence_batch, 
+                                 avg_width=avg_width)
+
 
 class Saturation(ExtractBase):
     """Find the positive and negative saturaiton values of the hysteresis loop
@@ -165,13 +361,16 @@ class Saturation(ExtractBase):
     when initializing this class if you wish.
     """
 
-    def __init__(self, hloop, bins=50, thresh=0.25):
+    shares_loopdata = True
+
+    def __init__(self, hloop, bins=50, thresh=0.25, data=None):
         self.label = 'Saturation'
         self.label_short = 'Sat'
         self.hloop = hloop
 
-        x, y = np.array(self.hloop.x()), np.array(self.hloop.y())
-        extract_dict = self.saturation(x, y, bins=bins, thresh=thresh)
+        if data is None:
+            data = LoopData.from_hloop(hloop)
+        extract_dict = self._compute(data, bins=bins, thresh=thresh)
 
         self.avg_val = extract_dict['avg_val']
         self.xcoords = self.xs = extract_dict['xcoords']
@@ -180,7 +379,12 @@ class Saturation(ExtractBase):
 
     @staticmethod
     def saturation(x, y, bins=50, thresh=0.25):
-        heights, bins = np.histogram(y, bins=bins)
+        return Saturation._compute(LoopData(x, y), bins=bins, thresh=thresh)
+
+    @staticmethod
+    def _compute(data, bins=50, thresh=0.25):
+        x, y = data.x, data.y
+        heights, bins = data.histogram(bins)
 
         # thresh_y = self.get_threshold_y(heights, bins, thresh=thresh)
         # Compute the y thresholds
@@ -203,6 +407,60 @@ class Saturation(ExtractBase):
                     indices=None,
                     thresh_y=thresh_y)
 
+    @staticmethod
+    def saturation_batch(x, y, bins=50, thresh=0.25):
+        """Same algorithm as `saturation()`, run on many loops at once. The
+        histograms of all loops are counted with a single `bincount` over
+        row-offset bin indices. Loops where the per loop version would
+        raise (no bins on one side of zero) get NaN.
+
+        Args:
+            x, y (ndarray): Arrays of shape (nloops, npoints).
+
+        Returns:
+            dict: `avg_val` has shape (nloops,), `xcoords`, `ycoords` and
+                `thresh_y` have shape (nloops, 2).
+        """
+        x, y = np.atleast_2d(x), np.atleast_2d(y)
+        if len(y) > 1 and y.size > 2**18:
+            res = [Saturation.saturation_batch(x[r], y[r], bins, thresh)
+                   for r in _row_blocks(y)]
+            return dict(avg_val=np.concatenate([r['avg_val'] for r in res]),
+                        xcoords=np.vstack([r['xcoords'] for r in res]),
+                        ycoords=np.vstack([r['ycoords'] for r in res]),
+                        indices=None,
+                        thresh_y=np.vstack([r['thresh_y'] for r in res]))
+        heights, edges = _histogram_rows(y, bins)
+        lbins = edges[:, :-1]
+        binw = edges[:, 1] - edges[:, 0]
+        thresh_y = np.empty((len(y), 2))
+        for j, (half, dx, ax) in enumerate(zip((lbins > 0, lbins < 0), 
+                                               (0.0, binw), (1.0, -1.0))):
+            hmax = np.where(half, heights, -1).max(axis=1)
+            hthresh = thresh * hmax
+            saturated = half & (heights > hthresh[:, None])
+            lmin = np.where(saturated, np.abs(lbins), np.inf).min(axis=1)
+            lmin[~saturated.any(axis=1)] = np.nan
+            thresh_y[:, j] = ax * lmin + dx
+        # Average over all points outside the thresholds
+        with np.errstate(invalid='ignore', divide='ignore'):
+            y_saturations = np.column_stack((
+                _masked_row_mean(y, y > thresh_y[:, :1]),
+                _masked_row_mean(y, y < thresh_y[:, 1:])))
+        return dict(avg_val=np.abs(y_saturations).mean(axis=1),
+                    xcoords=np.column_stack((x.min(axis=1), x.max(axis=1))),
+                    ycoords=y_saturations,
+                    indices=None,
+                    thresh_y=thresh_y)
+
+    @classmethod
+    def batch(cls, stack, bins=50, thresh=0.25):
+        """Saturation of every loop in an `HLoopStack`, see
+        `saturation_batch()`.
+        """
+        return _batch_over_stack(stack, cls.saturation_batch, bins=bins,
+                                 thresh=thresh)
+
     def plot(self, ax, **kwargs):
         defaults = dict(linestyles='dashed', label=self.label_short, zorder=3)
         defaults.update(kwargs)
@@ -228,13 +486,148 @@ class ReflectivityScMOKE(ExtractBase):
         pass
     
     def reflectivity(self):
-        with open(self.hloop.fpath) as f:
-            line = f.readline()
-            ref = re.search("([+-]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)", line)
+        # Readers like 'scmoke' keep the first line, so the file need not
+        # be opened again.
+        line = getattr(self.hloop, 'header', None)
+        if line is None:
+            with open(self.hloop.fpath) as f:
+                line = f.readline()
+        ref = re.search("([+-]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)", line)
         return float(ref.groups()[0])
 
 
 
+def _arrays(hloop):
+    """x and y of `hloop` as ndarrays, using the cached `HLoop.arrays()`
+    when available.
+    """
+    if hasattr(hloop, 'arrays'):
+        return hloop.arrays()
+    return np.array(hloop.x()), np.array(hloop.y())
+
+
+def _row_blocks(arr, size=2**18):
+    """Slices of rows of the 2d `arr` with about `size` elements each, so
+    that temporaries stay small enough to be cache friendly.
+    """
+    step = max(1, size // max(1, arr.shape[1]))
+    for start in range(0, len(arr), step):
+        yield slice(start, start + step)
+
+
+def _histogram_rows(y, bins):
+    """`np.histogram(row, bins)` for every row of `y`. Bin edges and bin
+    assignment follow numpy's equal width bin algorithm so the counts are
+    identical.
+
+    Returns:
+        (heights, edges): Arrays of shape (nrows, bins), (nrows, bins + 1)
+    """
+    n = len(y)
+    first, last = y.min(axis=1), y.max(axis=1)
+    same = first == last
+    first = np.where(same, first - 0.5, first)
+    last = np.where(same, last + 0.5, last)
+    edges = np.linspace(first, last, bins + 1, axis=1)
+    flat_edges = edges.ravel()
+    rows = np.arange(n)[:, None]
+    f_indices = y - first[:, None]
+    f_indices *= (bins / (last - first))[:, None]
+    indices = f_indices.astype(np.intp)
+    indices[indices == bins] -= 1
+    # Work with indices into the flattened edges
+    indices += rows * (bins + 1)
+    indices -= y < np.take(flat_edges, indices)
+    indices += ((y >= np.take(flat_edges, indices + 1)) & 
+                (indices != rows * (bins + 1) + bins - 1))
+    # Offset each row's bins so one bincount counts every histogram.
+    indices -= rows
+    heights = np.bincount(indices.ravel(), minlength=n * bins)
+    return heights.reshape(n, bins), edges
+
+
+def _masked_row_mean(y, mask):
+    return np.where(mask, y, 0.0).sum(axis=1) / mask.sum(axis=1)
+
+
+def _window_mean(x, i, avg_width):
+    """Mean of `x[i - avg_width:i + avg_width]`. A loop is a closed
+    curve, so windows that hit the ends of the array wrap around.
+    """
+    return x.take(np.arange(i - avg_width, i + avg_width), mode='wrap').mean()
+
+
+def _window_means(x, indices, avg_width):
+    """`_window_mean(x[row], i, avg_width)` for every index `i` in each row
+    of `indices`, with the same results as the per loop code.
+    """
+    win = indices[..., None] + np.arange(-avg_width, avg_width)
+    win %= x.shape[1]
+    rows = np.arange(len(x))[:, None, None]
+    return x[rows, win].mean(axis=-1)
+
+
+def _branch_argmins(a, direction):
+    """Indices of the smallest value of `a` on the descending and on the
+    ascending branch, in the order they occur in the loop.
+
+    Raises:
+        ValueError: If the loop does not have both branches.
+    """
+    inds, valid = _branch_argmins_rows(a[None, :], direction[None, :])
+    if not valid[0]:
+        raise ValueError('Loop must have an ascending and a descending '
+                         'branch')
+    return inds[0]
+
+
+def _branch_argmins_rows(a, direction):
+    """`_branch_argmins()` for each row of `a`. Also returns a boolean
+    array that is False for rows that do not have both branches.
+    """
+    inds = np.empty((len(a), 2), dtype=np.intp)
+    valid = np.ones(len(a), dtype=bool)
+    for col, sign in enumerate((-1, 1)):
+        on_branch = direction == sign
+        valid &= on_branch.any(axis=1)
+        inds[:, col] = np.argmin(np.where(on_branch, a, np.inf), axis=1)
+    inds.sort(axis=1)
+    return inds, valid
+
+
+def _invalid_to_nan(valid, extract_dict):
+    """Set the values of a batch extract to NaN for the invalid loops."""
+    if valid.all():
+        return extract_dict
+    for k in ('avg_val', 'xcoords', 'ycoords'):
+        extract_dict[k] = extract_dict[k].astype(float)
+        extract_dict[k][~valid] = np.nan
+    return extract_dict
+
+
+def _batch_over_stack(stack, func, **kwargs):
+    """Run the batch extract function `func(x, y, **kwargs)` over an
+    HLoopStack. Ragged stacks are split into groups of equal length loops.
+    Array results are returned in stack order.
+    """
+    if not stack.ragged:
+        return func(stack.x, stack.y, **kwargs)
+    lengths = stack.lengths()
+    res = {}
+    for n in np.unique(lengths):
+        inds = np.nonzero(lengths == n)[0]
+        x = np.vstack([stack.loop_x(i) for i in inds])
+        y = np.vstack([stack.loop_y(i) for i in inds])
+        for k, v in func(x, y, **kwargs).items():
+            if not isinstance(v, np.ndarray):
+                res[k] = v
+                continue
+            if k not in res:
+                res[k] = np.empty((len(stack),) + v.shape[1:], dtype=v.dtype)
+            res[k][inds] = v
+    return res
+
+
 class ExtractWriter:
     """ The extracts given to the writer must have:
         - hloop attribute 
@@ -244,16 +637,80 @@ class ExtractWriter:
         - avg_val
     And they may also optionally have:
         - std_val
+
+    Extracts are kept in an `hloopy.table.ExtractTable`. If `path` is
+    given they are streamed to disk instead: every `flush_every` extracts
+    the collected rows are appended to `path` and dropped from memory. An
+    interrupted run can be continued by opening the same `path` again
+    (see `written()` to skip what is already done).
+
+    Args:
+        titlelevel (int): Directory level of the datafile paths used as row
+            titles by `to_df()`, 0 is the file name.
+        path (str): File or directory to stream to, see
+            `hloopy.table.open_store`.
+        format (str): 'tsv' or 'columnar'.
+        flush_every (int): Number of extracts collected between writes.
+        resume (bool): Keep the extracts already in `path`.
     """
-    def __init__(self, titlelevel=0):
+    def __init__(self, titlelevel=0, path=None, format=None,
+                 flush_every=1000, resume=True):
+        # Deferred, hloopy.table builds on this module.
+        from hloopy.table import ExtractTable, open_store
         self.titlelevel = titlelevel
-        self.d = {}
+        self.flush_every = flush_every
+        self.store = None
+        if path is not None:
+            self.store = open_store(path, format, resume)
+        if self.store is None:
+            self.table = ExtractTable()
+        else:
+            self.table = self.store.empty_table()
 
     def add(self, extract):
-        key = extract.hloop.fpath 
-        current = self.d.get(key, [])
-        current.append(extract)
-        self.d[key] = current
+        self.table.add(extract)
+        if self.store is not None and len(self.table) >= self.flush_every:
+            self.flush()
+
+    def add_table(self, table):
+        """Add the rows of the ExtractTable `table`."""
+        self.table.extend(table)
+        if self.store is not None and len(self.table) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Append the collected extracts to `path`."""
+        if self.store is not None and len(self.table):
+            self.store.append(self.table)
+            self.table.clear()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def written(self):
+        """set of (fpath, label) of the extracts already written."""
+        if self.store is None:
+            return set()
+        table = self.store.read()
+        d = table.data
+        return set((table.fpaths[l], table.labels[i])
+                   for l, i in set(zip(d['loop'], d['label'])))
+
+    def extract(self, hloop, *extracts, **kwargs):
+        """Compute (or fetch from the extract cache, see `cached_extract`)
+        each of the extract classes `extracts` for `hloop` and add them.
+        `kwargs` are passed to `cached_extract`.
+        """
+        cache = kwargs.pop('cache', None)
+        extracts = [(e, kwargs) for e in extracts]
+        for e in cached_extracts(extracts, hloop, cache=cache):
+            self.add(e)
 
     def to_csv(self, savefile, row_index_label='File', **kwargs):
         """Wrapper of pandas.to_csv."""
@@ -270,30 +727,26 @@ class ExtractWriter:
         df = self._parse_d_to_df(row_index_label)
         return df
 
-    def _parse_d_to_df(self, row_index_label='File'):
-        # get a list of sorted unique extracts (using their label attributes)
-        labels = sorted(set([e.label for es in self.d.values() for e in es]))
-        titles, rows = [], []
-        for path, extracts in self.d.items():
-            titles.append(self._title_from(path, self.titlelevel))
-            row = [float('nan') for i in labels]
-            for e in extracts:
-                i = labels.index(e.label)
-                row[i] = e.avg_val
-            rows.append(row)
-        data = np.array(rows)
-        df_d = {l: data[:,i] for i, l in enumerate(labels)}
-        df_d[row_index_label] = titles
-        df = pd.DataFrame(data=df_d)
-        df.set_index(row_index_label, inplace=True)
-        return df
+    @property
+    def d(self):
+        """dict of fpath -> list of the extracts of that datafile, as
+        `ExtractRow`s. Built from the table on each access, for code
+        written against the old dict of extracts.
+        """
+        d = {}
+        for row in self._all():
+            d.setdefault(row.fpath, []).append(row)
+        return d
+
+    def _all(self):
+        """ExtractTable of every extract added, including those written."""
+        if self.store is None:
+            return self.table
+        self.flush()
+        return self.store.read()
 
-    def _title_from(self, fpath, level):
-        dir, base = split(fpath)
-        if level == 0:
-            return base
-        else:
-            return self._title_from(dir, level - 1)
+    def _parse_d_to_df(self, row_index_label='File'):
+        return self._all().pivot(row_index_label, self.titlelevel)
 
     def __str__(self):
         return self.to_string()
@@ -1,32 +1,250 @@
 import pandas as pd
 import numpy as np
 import re
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import repeat
 from hloopy.util import rightpad
+from hloopy.cache import SidecarCache, default_cache
+from hloopy.branches import Branches, ZONE
+from hloopy import readers
 
 
 class HLoop:
     """An hloopy.HLoop represents a single hysteresis loop. It has
     both x and y datasets.
+
+    Args:
+        fpath (str): Path to the datafile.
+        read_func: Function used to read the datafile, or the name of a
+            reader registered in `hloopy.readers`. Pass 'auto' to choose
+            a reader from the file extension or contents.
+        setas: A string or dict, passed on to `setas()`.
+        lazy (bool): If True the datafile is not read until the data is
+            first needed (a call to `x()`, `y()` or access of `df`). Only
+            `fpath` and the reader options are kept until then, so grids
+            of many HLoops can be built without reading any files. Use
+            `release()` to drop the parsed data again.
+        cache: If True, parsed data is stored in (and later memory-mapped
+            from) the default `hloopy.cache.SidecarCache`. A SidecarCache
+            instance can be passed to use a different cache directory.
+        project (bool): If True only the x and y columns given by `setas`
+            are read from the datafile. Combine with e.g.
+            `dtype=numpy.float32` to also narrow the parsed columns.
+        kwargs: Passed to the read function.
     """
-    def __init__(self, fpath, read_func=pd.read_csv, setas=None, **kwargs):
+    def __init__(self, fpath, read_func=pd.read_csv, setas=None, lazy=False,
+                 cache=False, project=False, **kwargs):
+        self._init_state(fpath, read_func, kwargs, lazy, cache, project)
+        if project:
+            self._apply_setas(setas)
+        if not lazy:
+            self._read_data(f=read_func, **self._reader_kwargs())
+        if not project:
+            self._apply_setas(setas)
+
+    def _init_state(self, fpath, read_func=None, read_kwargs=None,
+                    lazy=False, cache=False, project=False, num_cols=None,
+                    header=None):
+        """Set up the attributes of an HLoop that has not read anything
+        yet. Subclasses that don't call `HLoop.__init__` call this.
+        """
         self.fpath = fpath
-        self._read_data(f=read_func, **kwargs)
+        self.read_func = read_func
+        self.read_kwargs = read_kwargs if read_kwargs is not None else {}
+        self.lazy = lazy
+        self.cache = cache
+        self.project = project
+        self._df = None
+        self._num_cols = num_cols
+        # Bumped whenever x() or y() may change, see hloopy.cache.
+        self.version = 0
+        # (version, x, y) cached by arrays()
+        self._arrays = None
+        # (cache_key(), zone, Branches) cached by branches()
+        self._branches = None
+        # Header line, for readers that return one along with the data.
+        self.header = header
+        # Datafile positions of the columns that are read, None for all.
+        self._usecols = None
+
+    @classmethod
+    def load_many(cls, fpaths, workers=None, backend='thread', 
+                  errors='collect', chunksize=1, **kwargs):
+        """Create an HLoop for each of `fpaths`, reading the datafiles in
+        parallel.
+
+        Args:
+            fpaths (sequence): Paths to the datafiles.
+            workers (int): Number of threads or processes. `None` lets the
+                executor decide. 1 reads the files in this thread.
+            backend (str): 'thread' or 'process'. Processes avoid the GIL
+                but the HLoops have to be pickled back.
+            errors (str): 'collect' to record files that fail to load in
+                the `errors` attribute of the result and carry on, or
+                'raise' to raise the first error.
+            chunksize (int): Number of files sent to a process at a time.
+            kwargs: Passed to `HLoop()` (`setas`, `lazy`, reader kwargs...)
+
+        Returns:
+            HLoopList: The HLoops, in the same order as `fpaths`. It can be
+                passed straight to `HLoopGrid` or `GridPlot`.
+        """
+        if errors not in ('collect', 'raise'):
+            raise ValueError('Arg "errors" must be "collect" or "raise"')
+        fpaths = list(fpaths)
+        args = (repeat(cls), fpaths, repeat(kwargs))
+        if workers == 1:
+            results = list(map(_load_one, *args))
+        elif backend == 'thread':
+            with ThreadPoolExecutor(max_workers=workers) as ex:
+                results = list(ex.map(_load_one, *args))
+        elif backend == 'process':
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                results = list(ex.map(_load_one, *args, chunksize=chunksize))
+        else:
+            msg = 'Arg "backend" must be "thread" or "process", not {}'
+            raise ValueError(msg.format(backend))
+        hloops = HLoopList()
+        for fpath, (hl, err) in zip(fpaths, results):
+            if err is None:
+                hloops.append(hl)
+            elif errors == 'raise':
+                raise err
+            else:
+                hloops.errors.append((fpath, err))
+        return hloops
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Registered readers are pickled by name, pandas.read_csv for one
+        # cannot be pickled in all pandas versions.
+        name = readers.reader_name(self.read_func)
+        if readers.is_registered(name):
+            state['read_func'] = name
+        return state
+
+    def _apply_setas(self, setas):
         if setas is not None:
             if isinstance(setas, str):
                 self.setas(setas)
             elif isinstance(setas, dict):
                 self.setas(**setas)
 
+    def _reader_kwargs(self):
+        kwargs = dict(self.read_kwargs)
+        if self._usecols is not None:
+            kwargs['usecols'] = self._usecols
+        return kwargs
+
+    def _update_projection(self):
+        """Read only the x and y columns if this HLoop is projected. Data
+        that was read without a needed column is released.
+        """
+        if not self.project:
+            return
+        n = self.num_cols()
+        cols = sorted(set(int(c) % n for c in 
+                          np.concatenate((self.xcol, self.ycol))))
+        if self._usecols is not None and set(cols) <= set(self._usecols):
+            return
+        self.release()
+        self._usecols = cols
+
+    def _frame_col(self, col):
+        """Position in `df` of the datafile column `col`."""
+        if self._usecols is None:
+            return col
+        return self._usecols.index(int(col) % self.num_cols())
+
     def _read_data(self, f, **kwargs):
-        self.df = pd.read_csv(self.fpath, **kwargs)
+        cache = self._get_cache()
+        if cache is not None:
+            cache_kwargs = dict(kwargs, read_func=readers.reader_name(f))
+            hit = cache.load(self.fpath, cache_kwargs)
+            if hit is not None:
+                data, meta = hit
+                self.header = meta['header']
+                self.df = pd.DataFrame(data, columns=meta['columns'], 
+                                       copy=False)
+                return
+        self.df = self._call_reader(f, **kwargs)
+        if cache is not None:
+            cache.store(self.fpath, cache_kwargs, self.df, self.header)
+
+    def _call_reader(self, f, **kwargs):
+        res = readers.get_reader(f)(self.fpath, **kwargs)
+        if isinstance(res, tuple):
+            res, self.header = res
+        return res
+
+    def _get_cache(self):
+        if isinstance(self.cache, SidecarCache):
+            return self.cache
+        elif self.cache:
+            return default_cache()
+        return None
+
+    @property
+    def df(self):
+        """The parsed datafile as a pandas.DataFrame. Read on first access
+        if this HLoop is lazy or has been released.
+        """
+        if self._df is None:
+            self._read_data(f=self.read_func, **self._reader_kwargs())
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        # Replacing data (not re-reading released data) is a change.
+        if self._df is not None:
+            self.version += 1
+        self._df = df
+
+    def cache_key(self):
+        """Identifies this HLoop and the state of its data for
+        `hloopy.cache.ExtractCache`.
+        """
+        return id(self), self.version
+
+    def is_loaded(self):
+        """True if the datafile has been read and is held in memory."""
+        return self._df is not None
+
+    def release(self):
+        """Drop the parsed data. It will be read again from `fpath` the
+        next time it is needed.
+        """
+        if self._df is not None and self._usecols is None:
+            self._num_cols = len(self._df.columns)
+        self._df = None
+        self._arrays = None
 
     def num_cols(self):
-        """Number of columns in the linked data file.
+        """Number of columns in the linked data file. If the data has not
+        been read yet (or only some columns were read) just the header of
+        the file is parsed.
 
         Returns:
             n (int): Number of columns.
         """
-        return len(self.df.columns)
+        if self._df is not None and self._usecols is None:
+            return len(self._df.columns)
+        if self._num_cols is None:
+            self._num_cols = self._peek_num_cols()
+        return self._num_cols
+
+    def _peek_num_cols(self):
+        cache = self._get_cache()
+        if cache is not None:
+            cache_kwargs = dict(self.read_kwargs, 
+                                read_func=readers.reader_name(self.read_func))
+            meta = cache.meta(self.fpath, cache_kwargs)
+            if meta is not None:
+                return len(meta['columns'])
+        kwargs = dict(self.read_kwargs)
+        kwargs.pop('dtype', None)
+        kwargs['nrows'] = 1
+        return len(self._call_reader(self.read_func, **kwargs).columns)
 
     def _x(self):
         """Get this HLoop's x-axis data. In a custom subclass of
@@ -36,10 +254,10 @@ class HLoop:
         that will have the same length as the one HLoop.y() returns.
         """
         try:
-            xcol = self.xcol[0]
-            return self.df.ix[:, xcol]
+            xcol = self._frame_col(self.xcol[0])
+            return self.df.iloc[:, xcol]
         except (AttributeError, ValueError):
-            return self.df.ix[:, 0]
+            return self.df.iloc[:, 0]
     x = _x
 
     def _y(self):
@@ -50,12 +268,50 @@ class HLoop:
         that will have the same length as the one HLoop.x() returns.
         """
         try:
-            ycol = self.ycol[0]
-            return self.df.ix[:, ycol]
+            ycol = self._frame_col(self.ycol[0])
+            return self.df.iloc[:, ycol]
         except (AttributeError, ValueError):
-            return self.df.ix[:, 1]
+            return self.df.iloc[:, 1]
     y = _y
 
+    def arrays(self):
+        """x and y data as read-only, contiguous numpy arrays. They are
+        computed once from `x()` and `y()` (without copying when the data
+        already is contiguous) and kept until `setas()` is called, the data
+        is replaced or `release()` is called. Subclasses with an `x()` or
+        `y()` that depends on other state should call `invalidate()` when
+        that state changes.
+
+        Returns:
+            (x, y): Tuple of ndarrays.
+        """
+        if self._arrays is None or self._arrays[0] != self.version:
+            x = np.ascontiguousarray(self.x())
+            y = np.ascontiguousarray(self.y())
+            x.flags.writeable = False
+            y.flags.writeable = False
+            self._arrays = (self.version, x, y)
+        return self._arrays[1], self._arrays[2]
+
+    def branches(self, zone=ZONE):
+        """Sweep structure (ascending and descending branches, turning
+        points, cycles) of the loop, see `hloopy.branches.Branches`. It is
+        found once and kept until the x data changes (`cache_key()`
+        changes); unlike `arrays()` it survives `release()`.
+        """
+        key = self.cache_key()
+        b = self._branches
+        if b is None or b[0] != key or b[1] != zone:
+            b = self._branches = (key, zone,
+                                  Branches(self.arrays()[0], zone))
+        return b[2]
+
+    def invalidate(self):
+        """Mark the data returned by `x()` and `y()` as changed."""
+        self.version += 1
+        self._arrays = None
+        self._branches = None
+
     def setas(self, *args, **kwargs):
         """Mark which columns should be respectively set as the 
         x-axis and y-axis data. There are ways to call this function:
@@ -74,7 +330,7 @@ class HLoop:
 
         """
         # Do nothing if no args are passed.
-        if len(args) == 0 or args[0] is None:
+        if (len(args) == 0 and not kwargs) or (args and args[0] is None):
             return
         # If first arg is a string, treat that as the column specifier
         elif len(args) == 1 and isinstance(args[0], str):
@@ -88,8 +344,10 @@ class HLoop:
                 self.ycol = np.array([s.find('y')])
         # Otherwise treat kwargs as the column specifier
         else:
-            self.xcol = int(np.array(kwargs.get('x', None)))
-            self.ycol = int(np.array(kwargs.get('y', None)))
+            self.xcol = np.atleast_1d(kwargs.get('x', 0)).astype(int)
+            self.ycol = np.atleast_1d(kwargs.get('y', 1)).astype(int)
+        self.version += 1
+        self._update_projection()
 
 
     def plot(self, ax, plotf='plot', **kwargs):
@@ -111,17 +369,34 @@ class HLoop:
         styles = {'color': 'darkslategrey'}
         styles.update(kwargs)
         try:
-            res = f(self.x(), self.y(), **kwargs)
+            res = f(*self.arrays(), **kwargs)
         except (AttributeError, ValueError):
-            x = self.df.ix[:, 0]
+            x = self.df.iloc[:, 0]
             if self.num_cols() == 1:
                 res = f(x, **styles)
             else:
-                y = self.df.ix[:, 1]
+                y = self.df.iloc[:, 1]
                 res = f(x, y, **styles)
         return res
 
 
+def _load_one(cls, fpath, kwargs):
+    try:
+        return cls(fpath, **kwargs), None
+    except Exception as e:
+        return None, e
+
+
+class HLoopList(list):
+    """A list of HLoops, as returned by `HLoop.load_many()`. The `errors`
+    attribute is a list of (fpath, exception) for the datafiles that could
+    not be loaded.
+    """
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.errors = []
+
+
 class HLoopGrid:
     """A 2d grid of HLoops.
 
@@ -0,0 +1,135 @@
+"""Running (sliding window) medians of traces, used by the median filters
+in `hloopy.transformations`.
+
+Traces are filtered one at a time or as the rows of a 2d array, with
+circular ('wrap') or zero padded ('constant') edges. Short kernels are
+applied by `scipy.ndimage.median_filter`, whose cost grows with the
+kernel size. For long kernels
+the traces are instead ranked once and the medians of all windows found
+together, one bit of the rank at a time, with a wavelet matrix: O(N log N)
+numpy work for N points whatever the kernel size. `method='auto'` takes
+the wavelet matrix for kernels of at least `WAVELET_KS_PER_BIT` points per
+bit of N (about 100 points for 1e5 points), where it was faster in
+`benchmarks/median.py`.
+"""
+import numpy as np
+
+# method='auto' uses the wavelet matrix for ks >= this * log2(N).
+WAVELET_KS_PER_BIT = 6
+
+
+def running_median(a, ks, mode='wrap', method='auto'):
+    """Median of every window of `ks` points along the last axis of `a`.
+
+    Gives the same values as `scipy.signal.medfilt(a, ks)` (mode
+    'constant', zero padded edges) or as medfilt of `a` padded circularly
+    (mode 'wrap').
+
+    Args:
+        a (ndarray): 1d trace, or 2d array of traces (one per row).
+        ks (int): Odd window size. In 'wrap' mode it must not be more than
+            the length of the traces.
+        mode (str): 'wrap' for circular boundaries (closed loops) or
+            'constant' for zero padding.
+        method (str): 'ndimage', 'wavelet' or 'auto' (chosen by `ks` and
+            the size of `a`), see the module docstring.
+
+    Returns:
+        ndarray: The medians, with the shape of `a`.
+    """
+    if mode not in ('wrap', 'constant'):
+        raise ValueError('Arg "mode" must be "wrap" or "constant"')
+    if method not in ('auto', 'ndimage', 'wavelet'):
+        raise ValueError('Arg "method" must be "auto", "ndimage" or '
+                         '"wavelet"')
+    if ks < 1 or ks % 2 != 1:
+        raise ValueError('Arg "ks" must be odd, not {}'.format(ks))
+    a = np.asarray(a)
+    shape = a.shape
+    a = np.atleast_2d(a)
+    n, N = a.shape
+    if a.size == 0:
+        return np.empty(shape, a.dtype)
+    if mode == 'wrap' and ks > N:
+        msg = 'Arg "ks" ({}) is larger than the traces ({})'
+        raise ValueError(msg.format(ks, N))
+    if method == 'auto':
+        method = _auto_method(ks, a.size)
+    if method == 'ndimage':
+        from scipy.ndimage import median_filter
+        res = median_filter(a, size=(1, ks), mode=mode, cval=0.0)
+        return res.reshape(shape)
+    return _wavelet(a, ks, mode).reshape(shape)
+
+
+def _auto_method(ks, size):
+    if ks >= WAVELET_KS_PER_BIT * np.log2(max(size, 2)):
+        return 'wavelet'
+    return 'ndimage'
+
+
+def _wavelet(a, ks, mode):
+    n, N = a.shape
+    h = ks // 2
+    if mode == 'constant':
+        # Zero pad, as medfilt does, and filter the padded traces as one.
+        pad = np.zeros((n, h), dtype=a.dtype)
+        a = np.concatenate((pad, a, pad), axis=1)
+        starts = np.arange(N)[None, :] + (N + 2 * h) * np.arange(n)[:, None]
+        ranges = [(starts.ravel(), starts.ravel() + ks)]
+    else:
+        # Circular windows are passed as two ranges, without padding.
+        i = np.arange(N)
+        lo, hi = i - h, i + h + 1
+        # A window runs over the start or the end of its trace, not both.
+        l1, r1 = np.maximum(lo, 0), np.minimum(hi, N)
+        l2 = np.where(lo < 0, N + lo, 0)
+        r2 = np.where(lo < 0, N, np.maximum(hi - N, 0))
+        row = (N * np.arange(n))[:, None]
+        ranges = [((l1 + row).ravel(), (r1 + row).ravel()),
+                  ((l2 + row).ravel(), (r2 + row).ravel())]
+    flat = np.ascontiguousarray(a).ravel()
+    return kth_smallest(flat, ranges, h)
+
+
+def kth_smallest(a, ranges, k):
+    """The `k`th smallest value (0 based) of `a` over each set of ranges.
+
+    Args:
+        a (ndarray): 1d array.
+        ranges (list): (starts, stops) pairs of index arrays, all of the
+            same length. Query `j` is over the union of
+            `a[starts[j]:stops[j]]` for every pair; empty ranges have
+            start == stop.
+        k (int or ndarray): Rank wanted, for all or for each query.
+
+    Returns:
+        ndarray: One value per query.
+    """
+    M = len(a)
+    order = np.argsort(a, kind='stable')
+    v = np.empty(M, dtype=np.int64)
+    v[order] = np.arange(M)
+    nq = len(ranges[0][0])
+    k = np.array(np.broadcast_to(k, (nq,)), dtype=np.int64)
+    ranges = [(np.array(l, dtype=np.int64), np.array(r, dtype=np.int64))
+              for l, r in ranges]
+    res = np.zeros(nq, dtype=np.int64)
+    zeros_before = np.empty(M + 1, dtype=np.int64)
+    zeros_before[0] = 0
+    for level in range(max(1, int(M - 1).bit_length()) - 1, -1, -1):
+        bit = (v >> level) & 1
+        is_zero = bit == 0
+        np.cumsum(is_zero, out=zeros_before[1:])
+        nz = zeros_before[-1]
+        zl = [zeros_before[l] for l, r in ranges]
+        zr = [zeros_before[r] for l, r in ranges]
+        nzeros = sum(hi - lo for lo, hi in zip(zl, zr))
+        one = k >= nzeros
+        k -= np.where(one, nzeros, 0)
+        res |= one.astype(np.int64) << level
+        for (l, r), zl_, zr_ in zip(ranges, zl, zr):
+            l[...] = np.where(one, nz + l - zl_, zl_)
+            r[...] = np.where(one, nz + r - zr_, zr_)
+        v = np.concatenate((v[is_zero], v[~is_zero]))
+    return a[order[res]]
@@ -0,0 +1,245 @@
+"""Asyncio pipeline that extracts datafiles as they are found, for scans
+that are still being written or too large to hold in memory.
+
+The work is split into stages connected by bounded queues:
+
+    discover -> load -> extract -> write
+
+Discovery runs in the event loop (`watch()` polls a directory for new
+files). Loading (reading and parsing a datafile) and extraction are
+CPU-bound and run in an executor. Writing appends to an `ExtractWriter`,
+whose flushes to disk run in a thread. Each stage has its own number of
+concurrent tasks, and a stage that gets ahead of the next one waits for
+room in its output queue. So at most about `queue_size` loops plus one per
+task are in memory at any time, however many files the scan has.
+"""
+import os
+import glob
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from hloopy.hloop import HLoop
+from hloopy.stack import HLoopStack
+from hloopy.extract import ExtractWriter, cached_extracts
+from hloopy.table import ExtractTable
+
+# Marks the end of a queue's items.
+_DONE = object()
+
+
+class Pipeline:
+    """Streaming extraction of many datafiles with asyncio.
+
+    Args:
+        extracts (sequence): Extract classes, or (class, kwargs) pairs.
+        writer (ExtractWriter): Where the extracts go. By default a new
+            in-memory ExtractWriter. Give it a `path` to stream to disk.
+        load_workers (int): Number of datafiles loaded at a time.
+        extract_workers (int): Number of loops extracted at a time.
+        queue_size (int): Capacity of each queue between stages.
+        backend (str): 'thread' or 'process', the executor that loading
+            and extraction run in.
+        skip_written (bool): Skip the datafiles that `writer` already has
+            extracts of, to continue an interrupted run.
+        kwargs: Passed to `HLoop()` (`setas`, reader kwargs...)
+
+    Attributes:
+        errors (list): (fpath, exception) of every datafile that could not
+            be loaded or extracted.
+        counts (dict): Number of datafiles through each stage.
+    """
+    def __init__(self, extracts, writer=None, load_workers=2,
+                 extract_workers=None, queue_size=16, backend='thread',
+                 skip_written=True, **kwargs):
+        if backend not in ('process', 'thread'):
+            msg = 'Arg "backend" must be "thread" or "process", not {}'
+            raise ValueError(msg.format(backend))
+        self.extracts = list(extracts)
+        self.writer = writer if writer is not None else ExtractWriter()
+        self.load_workers = load_workers
+        self.extract_workers = extract_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.backend = backend
+        self.skip_written = skip_written
+        self.kwargs = kwargs
+        self.errors = []
+        self.counts = dict.fromkeys(('discover', 'load', 'extract', 'write'),
+                                    0)
+
+    async def run(self, source):
+        """Run every datafile of `source` through the pipeline.
+
+        Args:
+            source: An iterable or async iterable of datafile paths (e.g.
+                `watch()`), or a glob pattern.
+
+        Returns:
+            ExtractWriter: The writer, flushed.
+        """
+        if isinstance(source, str):
+            source = sorted(glob.glob(source))
+        Executor = (ProcessPoolExecutor if self.backend == 'process'
+                    else ThreadPoolExecutor)
+        nworkers = self.load_workers + self.extract_workers
+        paths = asyncio.Queue(self.queue_size)
+        loops = asyncio.Queue(self.queue_size)
+        tables = asyncio.Queue(self.queue_size)
+        with Executor(max_workers=nworkers) as ex, \
+                ThreadPoolExecutor(max_workers=1) as io:
+            discover = [self._discover(source, paths, io)]
+            load = [self._load(paths, loops, ex)
+                    for i in range(self.load_workers)]
+            extract = [self._extract(loops, tables, ex)
+                       for i in range(self.extract_workers)]
+            write = [self._write(tables, io)]
+            # Each stage's queue is ended once all its producers are done.
+            stages = [_then_end(discover, paths, len(load)),
+                      _then_end(load, loops, len(extract)),
+                      _then_end(extract, tables, len(write)),
+                      _then_end(write)]
+            tasks = [asyncio.ensure_future(s) for s in stages]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # A failed stage must not leave the others waiting.
+                for t in tasks:
+                    t.cancel()
+            await _in(io, self.writer.flush)
+        return self.writer
+
+    async def _discover(self, source, out, io):
+        skip = set()
+        if self.skip_written:
+            skip = set(f for f, _ in await _in(io, self.writer.written))
+        if hasattr(source, '__aiter__'):
+            async for fpath in source:
+                if fpath not in skip:
+                    await self._put(out, fpath, 'discover')
+        else:
+            for fpath in source:
+                if fpath not in skip:
+                    await self._put(out, fpath, 'discover')
+
+    async def _load(self, inq, out, ex):
+        while True:
+            fpath = await inq.get()
+            if fpath is _DONE:
+                return
+            try:
+                hl = await _in(ex, _load_loop, fpath, self.kwargs)
+            except Exception as e:
+                self.errors.append((fpath, e))
+                continue
+            await self._put(out, hl, 'load')
+
+    async def _extract(self, inq, out, ex):
+        while True:
+            hl = await inq.get()
+            if hl is _DONE:
+                return
+            try:
+                table = await _in(ex, _extract_loop, hl, self.extracts)
+            except Exception as e:
+                self.errors.append((hl.fpath, e))
+                continue
+            await self._put(out, table, 'extract')
+
+    async def _write(self, inq, io):
+        while True:
+            table = await inq.get()
+            if table is _DONE:
+                return
+            await _in(io, self.writer.add_table, table)
+            self.counts['write'] += 1
+
+    async def _put(self, q, item, stage):
+        self.counts[stage] += 1
+        await q.put(item)
+
+
+def run_pipeline(source, extracts, **kwargs):
+    """Run a `Pipeline(extracts, **kwargs)` over `source` to completion.
+
+    Returns:
+        Pipeline: Its `writer` has the extracts and `errors` the datafiles
+            that failed.
+    """
+    pipeline = Pipeline(extracts, **kwargs)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(pipeline.run(source))
+    finally:
+        loop.close()
+    return pipeline
+
+
+async def watch(directory, pattern='*', interval=1.0, idle_timeout=None):
+    """Async generator of the datafiles appearing in `directory`.
+
+    A file is only yielded once its size and modification time are
+    unchanged over one `interval`, so files that are still being written
+    are left for a later poll.
+
+    Args:
+        pattern (str): Glob pattern of the datafiles.
+        interval (float): Seconds between polls of the directory.
+        idle_timeout (float): Stop after this many seconds without a new
+            file. `None` watches forever.
+    """
+    seen = set()
+    pending = {}
+    idle = 0.0
+    while True:
+        found = False
+        for fpath in sorted(glob.glob(os.path.join(directory, pattern))):
+            if fpath in seen:
+                continue
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                continue
+            stamp = (st.st_size, st.st_mtime)
+            if pending.get(fpath) == stamp:
+                del pending[fpath]
+                seen.add(fpath)
+                found = True
+                yield fpath
+            else:
+                pending[fpath] = stamp
+        idle = 0.0 if (found or pending) else idle + interval
+        if idle_timeout is not None and idle > idle_timeout:
+            return
+        await asyncio.sleep(interval)
+
+
+async def _then_end(coros, q=None, n=0):
+    """Run `coros`, then put `n` end markers in the queue `q`."""
+    await asyncio.gather(*coros)
+    for i in range(n):
+        await q.put(_DONE)
+
+
+def _in(executor, func, *args):
+    """Await `func(*args)` run in `executor`. Only called from the
+    pipeline's coroutines, so there is always a running loop.
+    """
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(executor, func, *args)
+
+
+def _load_loop(fpath, kwargs):
+    """Read `fpath` and keep only its x and y, as a one loop stack, so the
+    parsed frame is dropped straight away and only the arrays are queued
+    (or pickled back from a worker process).
+    """
+    hl = HLoop(fpath, **dict(kwargs, lazy=True))
+    return HLoopStack.from_hloops([hl])[0]
+
+
+def _extract_loop(hl, extracts):
+    """ExtractTable of the `extracts` of `hl`."""
+    # The extract cache is no use for a one-off pass.
+    es = cached_extracts(extracts, hl, cache=False)
+    table = ExtractTable(capacity=max(1, len(es)))
+    for e in es:
+        table.add(e, hl.fpath)
+    return table
@@ -4,6 +4,7 @@ import numpy as np
 from numpy import rot90
 from os.path import split
 from collections import defaultdict
+from hloopy.extract import cached_extracts
 
 
 class GridPlotBase: 
@@ -11,6 +12,27 @@ class GridPlotBase:
     def extract(self, *args):
         self.extracts += args 
 
+    def _extracts_of(self, hl, extracts):
+        """Extract instances for `hl`. They are looked up in `self.results`
+        (an ExtractTable, e.g. from `hloopy.engine.ExtractEngine`) if it is
+        set, otherwise they are computed (or fetched from the extract
+        cache). Extracts missing from the results are left out.
+        """
+        results = getattr(self, 'results', None)
+        if results is None:
+            return cached_extracts(extracts, hl)
+        if not hasattr(self, '_result_rows'):
+            self._result_rows = {}
+        found = []
+        for e in extracts:
+            e = e[0] if isinstance(e, tuple) else e
+            if e not in self._result_rows:
+                self._result_rows[e] = results.by_fpath(e)
+            row = self._result_rows[e].get(hl.fpath)
+            if row is not None:
+                found.append(row)
+        return found
+
     def _parse_legend_param(self, legend):
         legend_defaults = {'loc': 'best', 'fontsize': 8, 'frameon': True}
         if legend:
@@ -151,8 +173,7 @@ class GridPlot(GridPlotBase):
                 ax.set_title(title, **title_style)
             ln = hl.plot(ax)
             self.lines_plotted[x][y] = ln
-            for e in self.extracts:
-                e_instance = e(hl)
+            for e_instance in self._extracts_of(hl, self.extracts):
                 e_instance.plot(ax, **kwargs)
                 self.extract_instances[hl.fpath].append(e_instance)
             if q == 0 and self.legend:
@@ -186,8 +207,9 @@ class GridPlot(GridPlotBase):
 
 class HLoopGridPlot(GridPlotBase):
     def __init__(self, hloop_grid, legend=None, extracts=None, lablevel=None,
-                 titleparams={}, hideaxes=True):
-        """Plot an HLoopGrid object
+                 titleparams={}, hideaxes=True, results=None):
+        """Plot an HLoopGrid object. Extracts are taken from `results` (an
+        ExtractTable of precomputed extracts) if given.
         """
         self.hloop_grid = hloop_grid
         self.hloops = hloop_grid.hloops
@@ -201,6 +223,7 @@ class HLoopGridPlot(GridPlotBase):
         self.titleparams = titleparams
         self.extracts = []
         self.hideaxes_switch = hideaxes
+        self.results = results
 
     def plot(self, simple_label=False, extract_plot_kwargs={}, 
              ostring='nwes', **kwargs):
@@ -246,8 +269,7 @@ class HLoopGridPlot(GridPlotBase):
                 ax.set_title('{}, {}'.format(col_init, row_init), 
                              **title_style)
             # Plot extracts
-            for e in self.extracts:
-                e_instance = e(hl)
+            for e_instance in self._extracts_of(hl, self.extracts):
                 e_instance.plot(ax, **extract_plot_kwargs)
                 self.extract_instances[hl.fpath].append(e_instance)
             # Maybe add a legend
@@ -260,8 +282,10 @@ class HLoopGridPlot(GridPlotBase):
 
 
 class ExtractGridPlot(GridPlotBase):
-    def __init__(self, hloop_grid, extract):
-        """Plot an HLoopGrid object
+    def __init__(self, hloop_grid, extract, results=None):
+        """Plot an HLoopGrid object. The extract values are taken from
+        `results` (an ExtractTable of precomputed extracts, see
+        `hloopy.engine.ExtractEngine`) if given.
         """
         self.hloop_grid = hloop_grid
         self.hloops = hloop_grid.hloops
@@ -270,6 +294,7 @@ class ExtractGridPlot(GridPlotBase):
         self.nloops = self.hloop_grid.nloops
         self.hg = hloop_grid
         self.extract = extract
+        self.results = results
 
     def plot(self, ostring='nwes', colorbar={}, clim=None, hideaxes=False,
              missing_val=0.0, **kwargs):
@@ -307,7 +332,9 @@ class ExtractGridPlot(GridPlotBase):
             row_init, col_init = self.hg.mapping[i]
             row, col = self.rotated_indices(row_init, col_init, self.nrows, 
                                             self.ncols, ostring)
-            ext = self.extract(hl)
+            ext = self._extract_of(hl)
+            if ext is None:
+                continue
             self.extract_instances[row][col] = ext
             self.extract_avg_vals[row][col] = ext.avg_val
         self.fig, self.ax = plt.subplots()
@@ -323,6 +350,12 @@ class ExtractGridPlot(GridPlotBase):
             self.fig.colorbar(res, **colorbar)
         return res
 
+    def _extract_of(self, hl):
+        found = self._extracts_of(hl, [self.extract])
+        if getattr(hl, 'lazy', False):
+            hl.release()
+        return found[0] if found else None
+
     def hideaxes(self, ax):
         ax.spines["left"].set_visible(False)
         ax.spines["right"].set_visible(False)
@@ -392,7 +425,9 @@ class SaturationGridPlot(ExtractGridPlot):
             row_init, col_init = self.hg.mapping[i]
             row, col = self.rotated_indices(row_init, col_init, self.nrows, 
                                             self.ncols, ostring)
-            ext = self.extract(hl)
+            ext = self._extract_of(hl)
+            if ext is None:
+                continue
             self.extract_instances[row][col] = ext
             avg_val = (ext.xcoords[1] - ext.xcoords[0]) / 2.0
             self.extract_avg_vals[row][col] = avg_val
@@ -1,4 +1,5 @@
 import numpy as np
+from itertools import chain
 
 def crop(arr, numcycles, precrop=0, postcrop=0):
     """Crop out some initial and final cycles in data that contains
@@ -51,3 +52,145 @@ def average_points(arr, d):
                  depending on the type of array passed.
     """
     return np.array(list(arr[i:i+d].mean() for i in range(0, len(arr), d)))
+
+
+
+# Rows read at a time by average_cycles_stream and read_chunks.
+CHUNKSIZE = 2**16
+
+
+class CycleAverager:
+    """Streaming version of `average_cycles` that also gives the spread of
+    the cycles. The trace is fed in chunks of any size with `update()` and
+    a running mean and variance is kept for each phase point (merging the
+    statistics of each chunk in, as in Welford's algorithm), so the raw
+    trace is never held in memory.
+
+    The trace need not hold a whole number of cycles: the points of a
+    partial last cycle count towards their phase points only. `cyclen` may
+    also be fractional, point `i` then belongs to phase point
+    `floor(i mod cyclen)`.
+
+    Args:
+        cyclen (float): Number of points per cycle.
+        precrop (int): Number of cycles to skip at the start, as in `crop`.
+        postcrop (int): Number of cycles to drop at the end, as in `crop`.
+            The last `postcrop` cycles seen are held back until more data
+            comes in.
+        ncols (int): Number of columns of the trace (e.g. 2 for x and y),
+            `None` for a 1d trace.
+    """
+    def __init__(self, cyclen, precrop=0, postcrop=0, ncols=None):
+        if cyclen <= 0:
+            raise ValueError('Arg "cyclen" must be positive')
+        self.cyclen = cyclen
+        self.ncols = ncols
+        self.nphase = int(np.ceil(cyclen))
+        k = 1 if ncols is None else ncols
+        self.count = np.zeros(self.nphase, dtype=np.int64)
+        self._mean = np.zeros((self.nphase, k))
+        self._m2 = np.zeros((self.nphase, k))
+        # Index, in the cropped trace, of the next point merged.
+        self._pos = 0
+        self._skip = int(precrop * cyclen)
+        self._hold = int(postcrop * cyclen)
+        self._held = np.zeros((0, k))
+
+    def update(self, chunk):
+        """Add the next `chunk` of points of the trace."""
+        chunk = np.asarray(chunk, dtype=float)
+        chunk = chunk.reshape(len(chunk), -1)
+        if self._skip:
+            n = min(self._skip, len(chunk))
+            self._skip -= n
+            chunk = chunk[n:]
+        if self._hold:
+            chunk = np.concatenate((self._held, chunk))
+            self._held = chunk[max(0, len(chunk) - self._hold):].copy()
+            chunk = chunk[:len(chunk) - len(self._held)]
+        if len(chunk):
+            self._merge(chunk)
+
+    def _merge(self, chunk):
+        i = self._pos + np.arange(len(chunk))
+        self._pos += len(chunk)
+        phase = np.floor(i - np.floor(i / self.cyclen) * self.cyclen)
+        phase = np.minimum(phase.astype(np.intp), self.nphase - 1)
+        n_b = np.bincount(phase, minlength=self.nphase)[:, None]
+        # Statistics of this chunk alone, then merged with the rest.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_b = self._sums(phase, chunk) / n_b
+            m2_b = self._sums(phase, (chunk - mean_b[phase])**2)
+            n_a = self.count[:, None]
+            has = n_b > 0
+            delta = np.where(has, mean_b - self._mean, 0.0)
+            frac = np.where(has, n_b / np.maximum(n_a + n_b, 1), 0.0)
+        self._mean += delta * frac
+        self._m2 += np.where(has, m2_b + delta * delta * n_a * frac, 0.0)
+        self.count += n_b[:, 0]
+
+    def _sums(self, phase, values):
+        return np.column_stack([np.bincount(phase, v, self.nphase)
+                                for v in values.T])
+
+    @property
+    def mean(self):
+        """Average cycle. Phase points that no data reached are NaN."""
+        return self._out(np.where(self.count[:, None] > 0, self._mean,
+                                  np.nan))
+
+    def variance(self, ddof=1):
+        """Variance of the cycles at each phase point."""
+        n = self.count[:, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = np.where(n > ddof, self._m2 / (n - ddof), np.nan)
+        return self._out(var)
+
+    def stderr(self):
+        """Standard error of the mean at each phase point."""
+        n = self.count if self.ncols is None else self.count[:, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.variance() / n)
+
+    def result(self):
+        """(mean, stderr)"""
+        return self.mean, self.stderr()
+
+    def _out(self, a):
+        return a[:, 0] if self.ncols is None else a
+
+
+def average_cycles_stream(chunks, cyclen, precrop=0, postcrop=0):
+    """Average the cycles of a trace given as an iterable of chunks (see
+    `read_chunks`), or as an array, which may be a memory map and is then
+    read a chunk at a time. See `CycleAverager`.
+
+    Returns:
+        (mean, stderr): The averaged cycle and its standard error.
+    """
+    if isinstance(chunks, np.ndarray):
+        arr = chunks
+        chunks = (arr[i:i + CHUNKSIZE] for i in range(0, len(arr), CHUNKSIZE))
+        ncols = None if arr.ndim == 1 else arr.shape[1]
+    else:
+        chunks = iter(chunks)
+        first = np.asarray(next(chunks))
+        ncols = None if first.ndim == 1 else first.shape[1]
+        chunks = chain([first], chunks)
+    avg = CycleAverager(cyclen, precrop, postcrop, ncols)
+    for chunk in chunks:
+        avg.update(chunk)
+    return avg.result()
+
+
+def read_chunks(fpath, usecols=None, chunksize=None, **kwargs):
+    """Generator of the numeric data of a datafile, `chunksize` rows at a
+    time, without reading the whole file. `kwargs` are passed to
+    pandas.read_csv.
+    """
+    import pandas as pd
+    reader = pd.read_csv(fpath, usecols=usecols,
+                         chunksize=chunksize or CHUNKSIZE, **kwargs)
+    for df in reader:
+        values = df.values
+        yield values[:, 0] if values.shape[1] == 1 else values
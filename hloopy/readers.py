@@ -0,0 +1,323 @@
+"""Datafile readers. A reader is any callable `f(fpath, **kwargs)` that
+returns a pandas.DataFrame, or a `(DataFrame, header)` tuple if it also
+reads a header line that should be kept (see `HLoop.header`). Readers are
+registered by name so that `HLoop(fpath, read_func='numeric')` can be used,
+and `read_func='auto'` picks a reader by file extension or by sniffing the
+first line of the file.
+
+The built in readers are:
+
+    - 'csv': pandas.read_csv, the general purpose fallback.
+    - 'numeric': Fast path for purely numeric whitespace separated files.
+      Accepts the common pandas.read_csv options (`sep`, `skiprows`,
+      `header`, `usecols`, `dtype`, `nrows`).
+    - 'scmoke': Scanning MOKE labview output. One header line followed by
+      tab separated numbers. The header line is returned along with the
+      data.
+    - 'npy', 'npz': Numpy binary files. `.npy` files are memory-mapped.
+"""
+import os
+import re
+import warnings
+from itertools import islice
+from os.path import splitext
+import numpy as np
+import pandas as pd
+
+
+class UnsupportedOptions(ValueError):
+    """Raised by a reader that cannot handle the options or file it was
+    given. The 'auto' reader falls back to pandas.read_csv in that case.
+    """
+    pass
+
+
+class _Reader:
+    def __init__(self, name, func, extensions=(), sniff=None):
+        self.name = name
+        self.func = func
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.sniff = sniff
+
+
+_registry = {}
+
+
+def register_reader(name, func, extensions=(), sniff=None):
+    """Register a reader so it can be selected by name.
+
+    Args:
+        name (str): Name used for `HLoop(..., read_func=name)`.
+        func (callable): `func(fpath, **kwargs)`. Returns a DataFrame or a
+            (DataFrame, header) tuple.
+        extensions (sequence): File extensions (like '.npy') that the
+            'auto' reader will use this reader for.
+        sniff (callable): `sniff(first_line)` returns True if the file
+            with that first line (bytes) is in this reader's format. Used
+            by the 'auto' reader.
+    """
+    _registry[name] = _Reader(name, func, extensions, sniff)
+
+
+def get_reader(read_func):
+    """Resolve `read_func` (a callable, a registered name or None for
+    'auto') to a callable.
+    """
+    if read_func is None:
+        read_func = 'auto'
+    if callable(read_func):
+        return read_func
+    try:
+        return _registry[read_func].func
+    except KeyError:
+        msg = 'No reader named {}. Choose from {}'
+        raise ValueError(msg.format(read_func, sorted(_registry)))
+
+
+def is_registered(name):
+    """True if a reader called `name` is registered."""
+    return name in _registry
+
+
+def reader_name(read_func):
+    """A name for `read_func` that is stable between sessions."""
+    if read_func is None or isinstance(read_func, str):
+        return read_func or 'auto'
+    for r in _registry.values():
+        if r.func is read_func:
+            return r.name
+    module = getattr(read_func, '__module__', '')
+    name = getattr(read_func, '__qualname__', repr(read_func))
+    return '{}.{}'.format(module, name)
+
+
+def detect_format(fpath):
+    """Name of the registered reader for `fpath`, chosen by extension and
+    then by sniffing the first line. Falls back to 'numeric'.
+    """
+    ext = splitext(fpath)[1].lower()
+    for r in _registry.values():
+        if ext and ext in r.extensions:
+            return r.name
+    with open(fpath, 'rb') as f:
+        first = f.readline(4096)
+    for r in _registry.values():
+        if r.sniff is not None and r.sniff(first):
+            return r.name
+    return 'numeric'
+
+
+def read_auto(fpath, **kwargs):
+    """Read `fpath` with the reader chosen by `detect_format()`. If that
+    reader cannot handle `kwargs` or the file, use pandas.read_csv.
+    """
+    f = _registry[detect_format(fpath)].func
+    try:
+        return f(fpath, **kwargs)
+    except UnsupportedOptions:
+        return pd.read_csv(fpath, **kwargs)
+
+
+_WHITESPACE_SEPS = ('\t', ' ', r'\s+')
+# Above this size pandas' C tokenizer beats numpy's text parser, so the
+# body of bigger files is handed to it.
+FROMSTRING_MAX_BYTES = 2**18
+
+
+def _split(line, sep):
+    line = line.rstrip('\r\n')
+    if sep == r'\s+':
+        return line.split()
+    return line.split(sep)
+
+
+def _parse_block(text, ncols, sep=r'\s+'):
+    """Parse the `sep` separated numbers in `text` into an (n, ncols)
+    array using numpy's C parser.
+    """
+    # numpy takes any run of whitespace as one separator, so a missing
+    # field would shift the values after it. Only uniform rows are parsed
+    # here (pandas gives the missing fields as NaN).
+    nlines = 0
+    for line in text.split('\n'):
+        if not line.strip():
+            continue
+        fields = _split(line, sep)
+        if len(fields) != ncols or not all(v.strip() for v in fields):
+            raise UnsupportedOptions('Rows with missing or extra fields')
+        nlines += 1
+    # Text that is not all numbers stops the parse with a warning (numpy
+    # 1.x) or a ValueError (numpy 2), either way pandas is needed.
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            data = np.fromstring(text, sep=' ')
+        except (ValueError, DeprecationWarning):
+            raise UnsupportedOptions('Data is not a uniform numeric table')
+    if ncols == 0 or data.size != nlines * ncols:
+        raise UnsupportedOptions('Data is not a uniform numeric table')
+    return data.reshape(-1, ncols)
+
+
+def _read_lines(f, nrows):
+    if nrows is None:
+        return f.read()
+    return ''.join(islice(f, nrows))
+
+
+def _read_body(f, sep, nrows=None, ncols=None):
+    """Parse the rest of the open file `f` as a numeric table. Returns
+    a 2d array.
+    """
+    if os.fstat(f.fileno()).st_size > FROMSTRING_MAX_BYTES:
+        df = pd.read_csv(f, sep=sep, header=None, nrows=nrows)
+        if not all(dt.kind in 'biuf' for dt in df.dtypes):
+            raise UnsupportedOptions('Data is not a uniform numeric table')
+        data = df.values
+        if ncols is not None and data.shape[1] != ncols:
+            raise UnsupportedOptions('Header and data widths differ')
+        return data
+    text = _read_lines(f, nrows)
+    if ncols is None:
+        first = next((l for l in text.split('\n') if l.strip()), '')
+        ncols = len(_split(first, sep))
+    return _parse_block(text, ncols, sep)
+
+
+def _frame(data, names=None, usecols=None, dtype=None, nrows=None):
+    if nrows is not None:
+        data = data[:nrows]
+    if names is None:
+        names = list(range(data.shape[1]))
+    if usecols is not None:
+        try:
+            cols = sorted(set(c if isinstance(c, (int, np.integer))
+                              else names.index(c) for c in usecols))
+        except ValueError:
+            raise UnsupportedOptions('usecols not found in columns')
+        data = data[:, cols]
+        names = [names[c] for c in cols]
+    if dtype is not None:
+        if isinstance(dtype, dict):
+            raise UnsupportedOptions('Only a single dtype is supported')
+        data = data.astype(dtype, copy=False)
+    return pd.DataFrame(data, columns=names, copy=False)
+
+
+def read_numeric(fpath, sep=None, skiprows=0, header='infer', usecols=None,
+                 dtype=None, nrows=None, **kwargs):
+    """Fast reader for whitespace separated tables of numbers. Mirrors the
+    pandas.read_csv options of the same names. Small files skip the
+    pandas parser setup entirely, which is what dominates when reading
+    thousands of small files.
+
+    If `sep` is not given it is sniffed from the first line read: tab if
+    it has tabs, otherwise any whitespace. Comma separated files are left
+    to pandas.
+
+    Raises:
+        UnsupportedOptions: If any other option is passed, `sep` is not
+            whitespace or the file is not a uniform numeric table.
+    """
+    if kwargs:
+        raise UnsupportedOptions('Unsupported options: {}'.format(
+            sorted(kwargs)))
+    if not isinstance(skiprows, int):
+        raise UnsupportedOptions('Only an int skiprows is supported')
+    if sep is not None and sep not in _WHITESPACE_SEPS:
+        raise UnsupportedOptions('Only whitespace separators are supported')
+    if header not in ('infer', 0, None):
+        raise UnsupportedOptions('Unsupported header: {}'.format(header))
+    with open(fpath) as f:
+        for _ in range(skiprows):
+            f.readline()
+        if sep is None:
+            sep = _sniff_sep(f)
+        names = None
+        if header is not None:
+            line = f.readline()
+            while line and not line.strip():
+                line = f.readline()
+            names = _split(line, sep)
+            if '"' in line or len(set(names)) != len(names):
+                raise UnsupportedOptions('Header needs pandas')
+        ncols = None if names is None else len(names)
+        data = _read_body(f, sep, nrows, ncols)
+    return _frame(data, names, usecols, dtype)
+
+
+def _sniff_sep(f):
+    """Separator of the first non-blank line of the open file `f`, which
+    is left where it was.
+    """
+    pos = f.tell()
+    line = f.readline()
+    while line and not line.strip():
+        line = f.readline()
+    f.seek(pos)
+    if ',' in line:
+        raise UnsupportedOptions('Comma separated data needs pandas')
+    return '\t' if '\t' in line else r'\s+'
+
+
+def read_scmoke(fpath, sep='\t', usecols=None, dtype=None, nrows=None,
+                **kwargs):
+    """Reader for the Scanning MOKE labview program output. The first line
+    is a header, the rest is tab separated numbers. Runs of tabs in the
+    header are treated as one separator.
+
+    Returns:
+        (df, header): The data and the header line.
+    """
+    if kwargs or sep not in _WHITESPACE_SEPS:
+        raise UnsupportedOptions('Unsupported options: {}'.format(
+            sorted(kwargs)))
+    with open(fpath) as f:
+        header = f.readline()
+        data = _read_body(f, sep, nrows)
+    ncols = data.shape[1]
+    names = re.split(r'\t+', header.strip())
+    if len(names) != ncols or len(set(names)) != ncols:
+        names = None
+    df = _frame(data, names, usecols, dtype)
+    return df, header
+
+
+def _sniff_scmoke(first):
+    return first.startswith(b'AppliedField(G)\t')
+
+
+def read_npy(fpath, usecols=None, dtype=None, nrows=None, **kwargs):
+    """Reader for `.npy` files holding a 1d or 2d array. The file is
+    memory-mapped, columns are named 0, 1, ...
+    """
+    if kwargs:
+        raise UnsupportedOptions('Unsupported options: {}'.format(
+            sorted(kwargs)))
+    data = np.load(fpath, mmap_mode='r')
+    if data.ndim == 1:
+        data = data.reshape(-1, 1)
+    return _frame(data, None, usecols, dtype, nrows)
+
+
+def read_npz(fpath, usecols=None, dtype=None, nrows=None, **kwargs):
+    """Reader for `.npz` files. Either a single 2d array, or one 1d array
+    per column, in which case the array names are the column names.
+    """
+    if kwargs:
+        raise UnsupportedOptions('Unsupported options: {}'.format(
+            sorted(kwargs)))
+    with np.load(fpath) as npz:
+        names = list(npz.files)
+        arrays = [npz[n] for n in names]
+    if len(arrays) == 1 and arrays[0].ndim == 2:
+        return _frame(arrays[0], None, usecols, dtype, nrows)
+    return _frame(np.column_stack(arrays), names, usecols, dtype, nrows)
+
+
+register_reader('csv', pd.read_csv, extensions=('.csv',))
+register_reader('numeric', read_numeric)
+register_reader('scmoke', read_scmoke, sniff=_sniff_scmoke)
+register_reader('npy', read_npy, extensions=('.npy',))
+register_reader('npz', read_npz, extensions=('.npz',))
+register_reader('auto', read_auto)
@@ -0,0 +1,180 @@
+"""Sharing the data of an HLoopStack with worker processes without
+pickling it. The x and y arrays are copied once into a shared memory block
+(or a memory-mapped temporary file) and workers are sent a `StackHandle`:
+the block's name, the array shape and dtype, the loop offsets of a ragged
+stack and the paths of just the loops a task works on. Workers map the
+block and get an HLoopStack of read-only views, and let go of it with
+`StackHandle.detach()` at the end of the task.
+
+The process that creates a `SharedStack` owns the block and removes it
+when the SharedStack is closed (use it as a context manager), garbage
+collected, or at interpreter exit at the latest.
+"""
+import os
+import tempfile
+import weakref
+import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8, only kind='mmap' is available
+    shared_memory = None
+from hloopy.stack import HLoopStack
+
+# Where POSIX shared memory blocks appear as files on Linux.
+SHM_DIR = '/dev/shm'
+
+# (x, y) views of the blocks attached in this process, by block name.
+_attached = {}
+# Blocks mapped through their own buffer, by name, see _map().
+_open_blocks = {}
+
+
+class SharedStack:
+    """A copy of an HLoopStack's x and y in shared memory.
+
+    Args:
+        stack (HLoopStack): The loops to share.
+        kind (str): 'shm' for a `multiprocessing.shared_memory` block or
+            'mmap' for a memory-mapped temporary file.
+        dir (str): Directory for the 'mmap' file. Default is the system
+            temporary directory.
+
+    Attributes:
+        stack (HLoopStack): The shared loops, as views of the block.
+        handle (StackHandle): Picklable handle to send to workers.
+    """
+    def __init__(self, stack, kind='shm', dir=None):
+        if kind not in ('shm', 'mmap'):
+            raise ValueError('Arg "kind" must be "shm" or "mmap"')
+        if kind == 'shm' and shared_memory is None:
+            raise ValueError('kind="shm" needs Python 3.8, use "mmap"')
+        dtype = np.result_type(stack.x, stack.y)
+        nbytes = max(1, 2 * stack.x.size * dtype.itemsize)
+        shm = None
+        if kind == 'shm':
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            name, buf = shm.name, _map(shm.name, nbytes, 'r+')
+        else:
+            fd, name = tempfile.mkstemp(prefix='hloopy_', suffix='.bin',
+                                        dir=dir)
+            os.close(fd)
+            buf = np.memmap(name, dtype=np.uint8, mode='w+', shape=(nbytes,))
+        self._finalizer = weakref.finalize(self, _release, kind, name, shm)
+        x, y = _views(buf, stack.x.shape, dtype)
+        x[...] = stack.x
+        y[...] = stack.y
+        self.stack = HLoopStack(x, y, stack.offsets, stack.fpaths,
+                                stack.meta)
+        self.handle = StackHandle(kind, name, stack.x.shape, dtype.str,
+                                  stack.offsets)
+
+    def close(self):
+        """Remove the shared block. Workers that still have it mapped keep
+        their mapping until they let go of it.
+        """
+        self.stack = None
+        self._finalizer()
+
+    @property
+    def closed(self):
+        return not self._finalizer.alive
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StackHandle:
+    """Lightweight, picklable reference to the data of a SharedStack. It
+    holds the layout of the block only (and the offsets of a ragged
+    stack); the paths of the loops a task needs are added with
+    `for_loops()`. The loops' metadata is not sent.
+    """
+    def __init__(self, kind, name, shape, dtype, offsets=None, fpaths=None):
+        self.kind = kind
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.offsets = offsets
+        # Path of some of the loops, by index.
+        self.fpaths = fpaths or {}
+
+    def for_loops(self, indices, fpaths):
+        """Copy of this handle with the paths `fpaths` of the loops
+        `indices`, to send to the task that works on those loops.
+        """
+        return StackHandle(self.kind, self.name, self.shape, self.dtype,
+                           self.offsets, dict(zip(indices, fpaths)))
+
+    def attach(self):
+        """HLoopStack of read-only views of the shared data. A process
+        maps each block only once, until `detach()`. Loops whose path was
+        not given to `for_loops()` have an fpath of None.
+        """
+        try:
+            x, y = _attached[self.name]
+        except KeyError:
+            dtype = np.dtype(self.dtype)
+            nbytes = max(1, 2 * int(np.prod(self.shape)) * dtype.itemsize)
+            if self.kind == 'shm':
+                buf = _map(self.name, nbytes, 'r')
+            else:
+                buf = np.memmap(self.name, dtype=np.uint8, mode='r',
+                                shape=(nbytes,))
+            x, y = _views(buf, self.shape, dtype)
+            x.flags.writeable = False
+            y.flags.writeable = False
+            _attached[self.name] = x, y
+        n = self.shape[0] if self.offsets is None else len(self.offsets) - 1
+        fpaths = [self.fpaths.get(i) for i in range(n)]
+        return HLoopStack(x, y, self.offsets, fpaths)
+
+    def detach(self):
+        """Let go of this process's mapping of the block. The memory is
+        unmapped once the views already handed out are gone.
+        """
+        _attached.pop(self.name, None)
+        shm = _open_blocks.pop(self.name, None)
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                # Views of its buffer are still in use.
+                _open_blocks[self.name] = shm
+
+
+def _map(name, nbytes, mode):
+    """Map the shared memory block `name`. On Linux the block's file is
+    mapped with numpy, which keeps the views valid for as long as they
+    live and stays clear of the resource tracker (that would remove the
+    block when a worker exits). Elsewhere the block's own buffer is used.
+    """
+    path = os.path.join(SHM_DIR, name)
+    if os.path.exists(path):
+        return np.memmap(path, dtype=np.uint8, mode=mode, shape=(nbytes,))
+    # A block can't be closed while there are views of its buffer, so it
+    # is kept open until StackHandle.detach().
+    shm = shared_memory.SharedMemory(name=name)
+    _open_blocks[name] = shm
+    return shm.buf
+
+
+def _views(buf, shape, dtype):
+    n = int(np.prod(shape))
+    flat = np.frombuffer(buf, dtype=dtype, count=2 * n)
+    return flat[:n].reshape(shape), flat[n:].reshape(shape)
+
+
+def _release(kind, name, shm):
+    if kind == 'mmap':
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+        return
+    # The views are of a separate mapping (see _map), so this is safe.
+    # Memory still mapped elsewhere is freed once it is unmapped.
+    shm.close()
+    shm.unlink()
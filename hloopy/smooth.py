@@ -0,0 +1,92 @@
+"""Smoothing of traces by convolution with a Gaussian or Savitzky-Golay
+kernel, used by the smoothing transformations in `hloopy.transformations`.
+
+Short kernels are applied directly, one multiply-add of the whole trace
+per kernel point. Longer ones are applied by FFT, which costs the same
+whatever the kernel length. Closed loops are smoothed circularly (the end
+of a trace runs on into its start); open traces are mirrored at their
+ends. Everything works along the last axis, so a 2d array of traces is
+smoothed in one call.
+"""
+import numpy as np
+
+# Longest kernel applied directly with method='auto'.
+DIRECT_MAX = 32
+
+
+def gaussian_kernel(width, truncate=4.0):
+    """Normalized Gaussian kernel.
+
+    Args:
+        width (float): Standard deviation, in points.
+        truncate (float): The kernel runs out to this many standard
+            deviations on each side.
+    """
+    if width <= 0:
+        raise ValueError('Arg "width" must be positive, not {}'.format(width))
+    h = int(truncate * width + 0.5)
+    k = np.exp(-0.5 * (np.arange(-h, h + 1) / float(width))**2)
+    return k / k.sum()
+
+
+def savgol_kernel(window, polyorder=3):
+    """Smoothing kernel of a Savitzky-Golay filter, see
+    scipy.signal.savgol_coeffs.
+    """
+    from scipy.signal import savgol_coeffs
+    return savgol_coeffs(window, polyorder)
+
+
+def smooth(a, kernel, circular=True, method='auto'):
+    """Convolve the traces `a` with the symmetric, odd length `kernel`.
+
+    Args:
+        a (ndarray): 1d trace or 2d array of traces (one per row).
+        circular (bool): True for closed loops, False to mirror the traces
+            at their ends.
+        method (str): 'direct', 'fft' or 'auto' (direct for kernels of up
+            to DIRECT_MAX points).
+
+    Returns:
+        ndarray: The smoothed traces, with the shape of `a`.
+    """
+    if method not in ('auto', 'direct', 'fft'):
+        raise ValueError('Arg "method" must be "auto", "direct" or "fft"')
+    a = np.asarray(a, dtype=float)
+    kernel = np.asarray(kernel, dtype=float)
+    if len(kernel) % 2 != 1:
+        raise ValueError('The kernel must have an odd length')
+    N = a.shape[-1]
+    h = len(kernel) // 2
+    if N == 0 or h == 0:
+        return a * kernel[0]
+    if method == 'auto':
+        method = 'direct' if len(kernel) <= DIRECT_MAX else 'fft'
+    if not circular:
+        # Mirror the ends, smooth the padded traces circularly (the wrap
+        # only reaches into the padding) and drop the padding.
+        pad = [(0, 0)] * (a.ndim - 1) + [(h, h)]
+        padded = np.pad(a, pad, mode='symmetric')
+        return smooth(padded, kernel, True, method)[..., h:h + N]
+    if method == 'fft' or len(kernel) > N:
+        return _fft(a, kernel)
+    return _direct(a, kernel)
+
+
+def _direct(a, kernel):
+    N = a.shape[-1]
+    h = len(kernel) // 2
+    padded = np.concatenate((a[..., N - h:], a, a[..., :h]), axis=-1)
+    out = kernel[0] * padded[..., :N]
+    for j in range(1, len(kernel)):
+        out += kernel[j] * padded[..., j:j + N]
+    return out
+
+
+def _fft(a, kernel):
+    N = a.shape[-1]
+    h = len(kernel) // 2
+    # The kernel centered on point 0, folded onto the trace if longer.
+    k = np.zeros(N)
+    np.add.at(k, (np.arange(len(kernel)) - h) % N, kernel)
+    return np.fft.irfft(np.fft.rfft(a) * np.fft.rfft(k), N)
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+from hloopy.hloop import HLoop
+
+
+class HLoopStack:
+    """Many hysteresis loops packed into contiguous numpy arrays, for
+    batched analysis.
+
+    When all loops have the same number of points `x` and `y` are 2d
+    arrays of shape (nloops, npoints). Otherwise the loops are stored end
+    to end in flat 1d arrays and loop `i` is `x[offsets[i]:offsets[i+1]]`.
+
+    Indexing with an int gives a `StackedHLoop`, an `HLoop` whose x and y
+    are views into the stack, so a stack can be used anywhere a sequence
+    of HLoops is expected (`HLoopGrid`, `GridPlot`, extracts...). Indexing
+    with a slice gives an HLoopStack that shares the same buffers.
+
+    Args:
+        x, y (ndarray): 2d arrays, or flat 1d arrays if `offsets` is given.
+        offsets (ndarray): Start of each loop in the flat arrays, with the
+            total length appended (so `len(offsets) == nloops + 1`).
+        fpaths (sequence): Datafile path of each loop.
+        meta (sequence): A dict of metadata for each loop.
+    """
+    def __init__(self, x, y, offsets=None, fpaths=None, meta=None):
+        x, y = np.asarray(x), np.asarray(y)
+        if x.shape != y.shape:
+            raise ValueError('x and y must have the same shape')
+        if offsets is None:
+            if x.ndim != 2:
+                raise ValueError('x and y must be 2d if offsets is None')
+            n = x.shape[0]
+        else:
+            offsets = np.asarray(offsets, dtype=np.intp)
+            if x.ndim != 1:
+                raise ValueError('x and y must be 1d if offsets are given')
+            n = len(offsets) - 1
+        self.x, self.y = x, y
+        self.offsets = offsets
+        self.fpaths = list(fpaths) if fpaths is not None else [None] * n
+        self.meta = list(meta) if meta is not None else [{} for i in range(n)]
+        if len(self.fpaths) != n or len(self.meta) != n:
+            raise ValueError('Need one fpath and one meta dict per loop')
+
+    @classmethod
+    def from_hloops(cls, hloops, dtype=np.float64):
+        """Pack the x and y data of `hloops` into a new stack. Lazy HLoops
+        are released once their data has been copied in, so the parsed
+        files are not all held in memory at once.
+        """
+        hloops = list(hloops)
+        if len(hloops) == 0:
+            raise ValueError("Parameter 'hloops' must have len > 0")
+        lengths = np.empty(len(hloops), dtype=np.intp)
+        xs, ys = [], []
+        for i, hl in enumerate(hloops):
+            x = np.asarray(hl.x(), dtype=dtype)
+            y = np.asarray(hl.y(), dtype=dtype)
+            if getattr(hl, 'lazy', False):
+                hl.release()
+            lengths[i] = len(x)
+            xs.append(x)
+            ys.append(y)
+        fpaths = [hl.fpath for hl in hloops]
+        meta = [{'header': getattr(hl, 'header', None)} for hl in hloops]
+        if (lengths == lengths[0]).all():
+            return cls(np.vstack(xs), np.vstack(ys), fpaths=fpaths, meta=meta)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        return cls(np.concatenate(xs), np.concatenate(ys), offsets=offsets,
+                   fpaths=fpaths, meta=meta)
+
+    @classmethod
+    def load(cls, fpaths, dtype=np.float64, **kwargs):
+        """Read the datafiles `fpaths` into a new stack. `kwargs` are passed
+        to `HLoop.load_many()`. The files are read lazily and released as
+        they are packed.
+
+        Returns:
+            HLoopStack. Files that could not be loaded are listed in the
+            `errors` attribute as (fpath, exception).
+        """
+        kwargs.setdefault('lazy', True)
+        hloops = HLoop.load_many(fpaths, **kwargs)
+        stack = cls.from_hloops(hloops, dtype=dtype)
+        stack.errors = hloops.errors
+        return stack
+
+    @property
+    def ragged(self):
+        """True if the loops are stored in flat arrays with offsets."""
+        return self.offsets is not None
+
+    def __len__(self):
+        return len(self.fpaths)
+
+    def lengths(self):
+        """Number of points in each loop."""
+        if self.ragged:
+            return np.diff(self.offsets)
+        return np.full(len(self), self.x.shape[1], dtype=np.intp)
+
+    def loop_x(self, i):
+        """x data of loop `i`, as a view."""
+        return self._loop(self.x, i)
+
+    def loop_y(self, i):
+        """y data of loop `i`, as a view."""
+        return self._loop(self.y, i)
+
+    def _loop(self, arr, i):
+        i = range(len(self))[i]
+        if self.ragged:
+            return arr[self.offsets[i]:self.offsets[i + 1]]
+        return arr[i]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._slice(key)
+        if isinstance(key, (int, np.integer)):
+            return StackedHLoop(self, range(len(self))[key])
+        return self._take(np.arange(len(self))[key])
+
+    def _slice(self, s):
+        start, stop, step = s.indices(len(self))
+        fpaths, meta = self.fpaths[s], self.meta[s]
+        if not self.ragged:
+            return HLoopStack(self.x[s], self.y[s], fpaths=fpaths, meta=meta)
+        if step != 1:
+            return self._take(np.arange(start, stop, step))
+        # Offsets stay absolute so the flat buffers are shared.
+        offsets = self.offsets[start:max(start, stop) + 1]
+        return HLoopStack(self.x, self.y, offsets=offsets, fpaths=fpaths,
+                          meta=meta)
+
+    def _take(self, inds):
+        """New stack (with copied data) of the loops at `inds`."""
+        fpaths = [self.fpaths[i] for i in inds]
+        meta = [self.meta[i] for i in inds]
+        if not self.ragged:
+            return HLoopStack(self.x[inds], self.y[inds], fpaths=fpaths,
+                              meta=meta)
+        xs = [self.loop_x(i) for i in inds]
+        ys = [self.loop_y(i) for i in inds]
+        offsets = np.concatenate(([0], np.cumsum([len(x) for x in xs])))
+        return HLoopStack(np.concatenate(xs), np.concatenate(ys),
+                          offsets=offsets, fpaths=fpaths, meta=meta)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield StackedHLoop(self, i)
+
+    def padded(self, fill=np.nan):
+        """x and y as 2d arrays of shape (nloops, max_npoints). For a
+        ragged stack the short loops are right padded with `fill` (this
+        makes a copy). Otherwise the arrays themselves are returned.
+        """
+        if not self.ragged:
+            return self.x, self.y
+        lengths = self.lengths()
+        shape = (len(self), lengths.max() if len(self) else 0)
+        xp = np.full(shape, fill, dtype=self.x.dtype)
+        yp = np.full(shape, fill, dtype=self.y.dtype)
+        mask = np.arange(shape[1]) < lengths[:, None]
+        start = self.offsets[0]
+        xp[mask] = self.x[start:self.offsets[-1]]
+        yp[mask] = self.y[start:self.offsets[-1]]
+        return xp, yp
+
+
+class StackedHLoop(HLoop):
+    """An HLoop whose x and y data are views into an `HLoopStack`. It
+    reads no datafile; `fpath` is only used for titles and grid mapping.
+    """
+    def __init__(self, stack, i):
+        self.stack = stack
+        self.index = i
+        self.meta = stack.meta[i]
+        self._init_state(stack.fpaths[i], num_cols=2,
+                         header=self.meta.get('header'))
+
+    def x(self):
+        return self.stack.loop_x(self.index)
+    _x = x
+
+    def y(self):
+        return self.stack.loop_y(self.index)
+    _y = y
+
+    def cache_key(self):
+        return id(self.stack), self.index, self.version
+
+    def _read_data(self, f, **kwargs):
+        self.df = pd.DataFrame({'x': self.x(), 'y': self.y()},
+                               columns=['x', 'y'])
+
+    def release(self):
+        self._df = None
+        self._arrays = None
+
+    def setas(self, *args, **kwargs):
+        """The columns of a StackedHLoop are fixed, this does nothing."""
+        pass
@@ -0,0 +1,651 @@
+import os
+import numpy as np
+import pandas as pd
+from os.path import split, join, exists, getsize, isdir
+from hloopy.extract import ExtractBase, cached_extracts
+
+# Number of x/y coordinates (and indices) stored per extract.
+NCOORDS = 2
+
+
+def table_dtype(ncoords=NCOORDS):
+    """Structured dtype of an ExtractTable row."""
+    return np.dtype([('loop', np.int32),
+                     ('label', np.int16),
+                     ('row', np.int32),
+                     ('col', np.int32),
+                     ('avg_val', np.float64),
+                     ('std_val', np.float64),
+                     ('ncoords', np.int8),
+                     ('xcoords', np.float64, (ncoords,)),
+                     ('ycoords', np.float64, (ncoords,)),
+                     ('indices', np.int64, (ncoords,))])
+
+
+class ExtractTable:
+    """Columnar store of extract results with one row per (loop, extract),
+    backed by a numpy structured array. It holds millions of results in a
+    few tens of bytes each, where extract objects cost a python object
+    (plus a reference to their HLoop) apiece.
+
+    Loops are stored as an index into `fpaths` and labels as an index into
+    `labels`. Coordinates are fixed width: up to `ncoords` of them are kept
+    per extract (`ncoords` gives how many are valid) and missing indices
+    are -1. An extract with more coordinates than that is stored without
+    them. Grid positions are -1 when unknown.
+
+    Extract objects are only made on demand: `table[i]` is an `ExtractRow`,
+    a light view of row `i` that can be used like an extract (it has
+    `label`, `avg_val`, `xs`, `plot()`...). Indexing with a slice or mask
+    gives a new ExtractTable, see `take()`.
+
+    Args:
+        ncoords (int): Number of coordinates stored per extract.
+        capacity (int): Number of rows to allocate up front.
+    """
+    def __init__(self, ncoords=NCOORDS, capacity=1024):
+        self.ncoords = ncoords
+        self._data = np.zeros(capacity, dtype=table_dtype(ncoords))
+        self._len = 0
+        self.fpaths = []
+        self.labels = []
+        # Per label: label_short and the extract class (used by plot()).
+        self.label_info = {}
+        self._fpath_ids = {}
+        self._label_ids = {}
+
+    @property
+    def data(self):
+        """The rows as a structured array (a view, not a copy)."""
+        return self._data[:self._len]
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return ExtractRow(self, range(self._len)[key])
+        return self.take(key)
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield ExtractRow(self, i)
+
+    def _reserve(self, n):
+        needed = self._len + n
+        if needed > len(self._data):
+            new = np.zeros(max(needed, 2 * len(self._data)),
+                           dtype=self._data.dtype)
+            new[:self._len] = self._data[:self._len]
+            self._data = new
+
+    def fpath_id(self, fpath):
+        """Index of `fpath` in `fpaths`, which is added if needed."""
+        try:
+            return self._fpath_ids[fpath]
+        except KeyError:
+            self.fpaths.append(fpath)
+            i = self._fpath_ids[fpath] = len(self.fpaths) - 1
+            return i
+
+    def label_id(self, label, label_short=None, cls=None):
+        """Index of `label` in `labels`, which is added if needed."""
+        try:
+            i = self._label_ids[label]
+        except KeyError:
+            self.labels.append(label)
+            i = self._label_ids[label] = len(self.labels) - 1
+            self.label_info[label] = (label_short or label, cls)
+        return i
+
+    def add(self, extract, fpath=None, row=-1, col=-1):
+        """Add one extract object. Its loop is `fpath` or, if that is None,
+        `extract.hloop.fpath`.
+        """
+        if fpath is None:
+            fpath = extract.hloop.fpath
+        self._reserve(1)
+        r = self._data[self._len]
+        r['loop'] = self.fpath_id(fpath)
+        r['label'] = self.label_id(extract.label,
+                                   getattr(extract, 'label_short', None),
+                                   type(extract))
+        r['row'], r['col'] = row, col
+        r['avg_val'] = extract.avg_val
+        r['std_val'] = getattr(extract, 'std_val', np.nan)
+        xs = _coords(getattr(extract, 'xcoords', None))
+        ys = _coords(getattr(extract, 'ycoords', None))
+        ixs = _coords(getattr(extract, 'indices', None))
+        n = max(len(xs), len(ys))
+        if n > self.ncoords:
+            xs = ys = ixs = ()
+            n = 0
+        r['ncoords'] = n
+        r['xcoords'] = _padded(xs, self.ncoords, np.nan)
+        r['ycoords'] = _padded(ys, self.ncoords, np.nan)
+        r['indices'] = _padded(ixs, self.ncoords, -1)
+        self._len += 1
+
+    def add_batch(self, results, fpaths, rows=None, cols=None, label=None,
+                  label_short=None, cls=None):
+        """Add the results of a batch extract (like `Coercivity.batch()`)
+        for many loops at once.
+
+        Args:
+            results (dict): `avg_val` of shape (nloops,) and optionally
+                `xcoords`, `ycoords`, `indices` of shape (nloops, k).
+            fpaths (sequence): Datafile path of each loop.
+            rows, cols (sequence): Grid position of each loop.
+            label, label_short (str): Default to the ones in `results`.
+            cls: The extract class, used by `ExtractRow.plot()`.
+        """
+        avg_val = np.asarray(results['avg_val'])
+        n = len(avg_val)
+        label = label or results['label']
+        label_short = label_short or results.get('label_short')
+        self._reserve(n)
+        new = self._data[self._len:self._len + n]
+        new['loop'] = [self.fpath_id(f) for f in fpaths]
+        new['label'] = self.label_id(label, label_short, cls)
+        new['row'] = -1 if rows is None else rows
+        new['col'] = -1 if cols is None else cols
+        new['avg_val'] = avg_val
+        new['std_val'] = results.get('std_val', np.nan)
+        coords = {}
+        for field in ('xcoords', 'ycoords', 'indices'):
+            if results.get(field) is not None:
+                coords[field] = np.asarray(results[field]).reshape(n, -1)
+        k = max([v.shape[1] for v in coords.values()] or [0])
+        if k > self.ncoords:
+            coords, k = {}, 0
+        for field, fill in (('xcoords', np.nan), ('ycoords', np.nan),
+                            ('indices', -1)):
+            v = coords.get(field)
+            if v is None:
+                new[field] = fill
+                continue
+            new[field][:, :v.shape[1]] = v
+            new[field][:, v.shape[1]:] = fill
+        new['ncoords'] = k
+        self._len += n
+
+    def add_rows(self, fpaths, labels, avg_val, std_val=np.nan, rows=-1,
+                 cols=-1, label_shorts=None):
+        """Add rows given column-wise, without coordinates.
+
+        Args:
+            fpaths, labels (sequence): Datafile path and label of each row.
+            label_shorts (dict): label_short of each label.
+        """
+        n = len(fpaths)
+        label_shorts = label_shorts or {}
+        self._reserve(n)
+        new = self._data[self._len:self._len + n]
+        new['loop'] = [self.fpath_id(f) for f in fpaths]
+        new['label'] = [self.label_id(l, label_shorts.get(l)) for l in labels]
+        new['row'], new['col'] = rows, cols
+        new['avg_val'], new['std_val'] = avg_val, std_val
+        new['ncoords'] = 0
+        new['xcoords'] = new['ycoords'] = np.nan
+        new['indices'] = -1
+        self._len += n
+
+    def extend(self, other):
+        """Append the rows of the ExtractTable `other`."""
+        loop_ids = np.array([self.fpath_id(f) for f in other.fpaths],
+                            dtype=np.int32)
+        label_ids = np.array([self.label_id(l, *other.label_info[l])
+                              for l in other.labels], dtype=np.int16)
+        n = len(other)
+        self._reserve(n)
+        new = self._data[self._len:self._len + n]
+        if other.ncoords == self.ncoords:
+            new[...] = other.data
+        else:
+            _copy_rows(other.data, new)
+        if n:
+            new['loop'] = loop_ids[new['loop']]
+            new['label'] = label_ids[new['label']]
+        self._len += n
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Don't pickle the unused capacity.
+        state['_data'] = self.data
+        return state
+
+    def clear(self):
+        """Remove all rows. The fpaths and labels (and so their ids) are
+        kept.
+        """
+        self.truncate(0)
+
+    def truncate(self, n):
+        """Remove all rows after the first `n`, as `clear()` does."""
+        self._len = min(self._len, n)
+
+    def extract(self, hloop, *extracts, row=-1, col=-1, **kwargs):
+        """Compute (or fetch from the extract cache) each of the extract
+        classes `extracts` for `hloop` and add the results. `kwargs` are
+        passed to the extracts.
+        """
+        cache = kwargs.pop('cache', None)
+        extracts = [(e, kwargs) for e in extracts]
+        for e in cached_extracts(extracts, hloop, cache=cache):
+            self.add(e, hloop.fpath, row, col)
+
+    def extract_grid(self, hlgrid, *extracts, **kwargs):
+        """`extract()` every loop of an HLoopGrid, recording its grid
+        position.
+        """
+        for hl, (row, col) in zip(hlgrid.hloops, hlgrid.mapping):
+            self.extract(hl, *extracts, row=row, col=col, **kwargs)
+
+    def extract_stack(self, stack, *extracts, rows=None, cols=None,
+                      **kwargs):
+        """Run the batch version (`cls.batch(stack, **kwargs)`) of each of
+        the extract classes `extracts` over an HLoopStack and add the
+        results.
+        """
+        for cls in extracts:
+            results = cls.batch(stack, **kwargs)
+            label = results.get('label') or cls.__name__
+            self.add_batch(results, stack.fpaths, rows, cols, label=label,
+                           cls=cls)
+
+    def mask(self, label=None, fpath=None, row=None, col=None, vmin=None,
+             vmax=None):
+        """Boolean mask of the rows matching all the given conditions.
+        `label` and `fpath` may also be sequences of labels/fpaths.
+        """
+        d = self.data
+        m = np.ones(len(d), dtype=bool)
+        if label is not None:
+            m &= np.isin(d['label'], self._ids(self._label_ids, label))
+        if fpath is not None:
+            m &= np.isin(d['loop'], self._ids(self._fpath_ids, fpath))
+        if row is not None:
+            m &= d['row'] == row
+        if col is not None:
+            m &= d['col'] == col
+        if vmin is not None:
+            m &= d['avg_val'] >= vmin
+        if vmax is not None:
+            m &= d['avg_val'] <= vmax
+        return m
+
+    @staticmethod
+    def _ids(ids, keys):
+        if isinstance(keys, str):
+            keys = [keys]
+        return [ids[k] for k in keys if k in ids]
+
+    def filter(self, *args, **kwargs):
+        """New ExtractTable with the rows matching `mask(*args, **kwargs)`.
+        """
+        return self.take(self.mask(*args, **kwargs))
+
+    def take(self, key):
+        """New ExtractTable with the rows selected by a mask, indices or
+        slice `key`. The rows are copied, the fpaths and labels are shared.
+        """
+        sub = ExtractTable.__new__(ExtractTable)
+        sub.__dict__.update(self.__dict__)
+        sub._data = np.array(self.data[key], ndmin=1)
+        sub._len = len(sub._data)
+        return sub
+
+    def _label_mask(self, extract):
+        """Mask of the rows of `extract`, a label or an extract class."""
+        if isinstance(extract, str):
+            return self.mask(label=extract)
+        labels = [l for l in self.labels if self.label_info[l][1] is extract]
+        return self.mask(label=labels)
+
+    def by_fpath(self, extract):
+        """dict of fpath -> ExtractRow for the rows of `extract` (a label
+        or an extract class).
+        """
+        inds = np.flatnonzero(self._label_mask(extract))
+        loops = self.data['loop'][inds]
+        return {self.fpaths[l]: ExtractRow(self, i)
+                for l, i in zip(loops, inds)}
+
+    def grid(self, extract, shape=None, fill=np.nan):
+        """2d array of the avg_val of `extract` (a label or an extract
+        class) at each grid position. Positions without a value are `fill`.
+        """
+        d = self.data[self._label_mask(extract)]
+        d = d[(d['row'] >= 0) & (d['col'] >= 0)]
+        if shape is None:
+            shape = getattr(self, 'shape', None)
+        if shape is None:
+            shape = ((d['row'].max() + 1, d['col'].max() + 1) if len(d)
+                     else (0, 0))
+        res = np.full(shape, fill, dtype=float)
+        res[d['row'], d['col']] = d['avg_val']
+        return res
+
+    def values(self, label):
+        """avg_val of every row with `label`."""
+        return self.data['avg_val'][self.mask(label=label)]
+
+    def to_df(self, coords=False):
+        """DataFrame with one row per extract and the columns `fpath`,
+        `label` (both categorical), `row`, `col`, `avg_val`, `std_val`, and
+        if `coords` is True also `x0, x1, ..., y0, ..., index0, ...`.
+        """
+        d = self.data
+        cols = {'fpath': pd.Categorical.from_codes(d['loop'], self.fpaths),
+                'label': pd.Categorical.from_codes(d['label'], self.labels),
+                'row': d['row'], 'col': d['col'],
+                'avg_val': d['avg_val'], 'std_val': d['std_val']}
+        names = list(cols)
+        if coords:
+            for field, prefix in (('xcoords', 'x'), ('ycoords', 'y'),
+                                  ('indices', 'index')):
+                for j in range(self.ncoords):
+                    name = '{}{}'.format(prefix, j)
+                    cols[name] = d[field][:, j]
+                    names.append(name)
+        return pd.DataFrame(cols, columns=names)
+
+    def pivot(self, row_index_label='File', titlelevel=0):
+        """Wide table of avg_val with one row per datafile and one column
+        per label, like `ExtractWriter.to_df()`.
+        """
+        d = self.data
+        labels = sorted(set(self.labels[i] for i in np.unique(d['label'])))
+        loops, first = np.unique(d['loop'], return_index=True)
+        # First occurrence order, like the insertion ordered ExtractWriter.
+        loops = loops[np.argsort(first)]
+        pos = np.full(len(self.fpaths), -1)
+        pos[loops] = np.arange(len(loops))
+        data = np.full((len(loops), len(labels)), np.nan)
+        col_of = np.array([labels.index(l) if l in labels else -1
+                           for l in self.labels], dtype=np.intp)
+        data[pos[d['loop']], col_of[d['label']]] = d['avg_val']
+        df_d = {l: data[:, i] for i, l in enumerate(labels)}
+        df_d[row_index_label] = [_title_from(self.fpaths[l], titlelevel)
+                                 for l in loops]
+        df = pd.DataFrame(data=df_d)
+        df.set_index(row_index_label, inplace=True)
+        return df
+
+
+def open_store(path, format=None, resume=True):
+    """Open an on-disk store of extract rows, see `TSVStore` and
+    `ColumnarStore`.
+
+    Args:
+        path (str): File (TSV) or directory (columnar) to write to.
+        format (str): 'tsv' or 'columnar'. By default a path that is a
+            directory or ends in '.cols' is columnar.
+        resume (bool): Keep the rows already in `path`. Otherwise it is
+            started afresh.
+    """
+    if format is None:
+        columnar = isdir(path) or path.endswith('.cols')
+        format = 'columnar' if columnar else 'tsv'
+    if format == 'tsv':
+        return TSVStore(path, resume)
+    if format == 'columnar':
+        return ColumnarStore(path, resume)
+    raise ValueError('Arg "format" must be "tsv" or "columnar"')
+
+
+class TSVStore:
+    """Extract rows appended to a tab separated text file with the columns
+    `fpath, label, label_short, row, col, avg_val, std_val`. A partially
+    written last line (from an interrupted run) is dropped on resume.
+    """
+    columns = ['fpath', 'label', 'label_short', 'row', 'col', 'avg_val',
+               'std_val']
+
+    def __init__(self, path, resume=True):
+        self.path = path
+        if resume and exists(path) and getsize(path) > 0:
+            _truncate_partial_line(path)
+        else:
+            with open(path, 'w') as f:
+                f.write('\t'.join(self.columns) + '\n')
+
+    def empty_table(self):
+        """ExtractTable to collect rows in before `append()`."""
+        return ExtractTable()
+
+    def append(self, table):
+        """Write the rows of `table` to the end of the file."""
+        d = table.data
+        df = table.to_df()
+        df.insert(2, 'label_short', [table.label_info[table.labels[i]][0]
+                                     for i in d['label']])
+        with open(self.path, 'a') as f:
+            df.to_csv(f, sep='\t', header=False, index=False,
+                      float_format='%.17g')
+
+    def read(self):
+        """All rows in the file as an ExtractTable."""
+        df = pd.read_csv(self.path, sep='\t', float_precision='round_trip')
+        table = ExtractTable(capacity=max(1, len(df)))
+        shorts = dict(zip(df['label'], df['label_short']))
+        table.add_rows(list(df['fpath']), list(df['label']),
+                       df['avg_val'].values, df['std_val'].values,
+                       df['row'].values, df['col'].values, shorts)
+        return table
+
+
+class ColumnarStore:
+    """Extract rows in a directory of raw binary column files, one per
+    field of the ExtractTable dtype (`avg_val.bin`...), plus `fpaths.txt`
+    and `labels.tsv` holding the strings that the `loop` and `label`
+    columns index into. Columns can be appended to and read (or memory
+    mapped) independently. Columns left unequal in length by an
+    interrupted run are cut back to the rows that were fully written on
+    resume.
+    """
+    def __init__(self, path, resume=True, ncoords=NCOORDS):
+        self.path = path
+        self.dtype = table_dtype(ncoords)
+        self.ncoords = ncoords
+        os.makedirs(path, exist_ok=True)
+        if not resume:
+            for name in self.dtype.names:
+                _remove(self._colpath(name))
+            _remove(join(path, 'fpaths.txt'))
+            _remove(join(path, 'labels.tsv'))
+        self.fpaths, self.labels = self._read_strings()
+        n = self.nrows()
+        for name in self.dtype.names:
+            colpath = self._colpath(name)
+            if exists(colpath):
+                os.truncate(colpath, n * self.dtype[name].itemsize)
+
+    def _colpath(self, name):
+        return join(self.path, name + '.bin')
+
+    def _read_strings(self):
+        fpaths, labels = [], []
+        fpath = join(self.path, 'fpaths.txt')
+        if exists(fpath):
+            with open(fpath) as f:
+                fpaths = f.read().splitlines()
+        lpath = join(self.path, 'labels.tsv')
+        if exists(lpath):
+            with open(lpath) as f:
+                labels = [tuple(l.split('\t')) for l in f.read().splitlines()]
+        return fpaths, labels
+
+    def nrows(self):
+        """Number of complete rows in the store."""
+        sizes = []
+        for name in self.dtype.names:
+            colpath = self._colpath(name)
+            size = getsize(colpath) if exists(colpath) else 0
+            sizes.append(size // self.dtype[name].itemsize)
+        return min(sizes)
+
+    def empty_table(self):
+        """ExtractTable to collect rows in before `append()`. It knows the
+        fpaths and labels already in the store, so the ids agree.
+        """
+        table = ExtractTable(self.ncoords)
+        for f in self.fpaths:
+            table.fpath_id(f)
+        for label, label_short in self.labels:
+            table.label_id(label, label_short)
+        return table
+
+    def append(self, table):
+        """Write the rows of `table` (made by `empty_table()`) to the end
+        of the columns. The new strings are written first, so ids in the
+        columns can always be resolved.
+        """
+        new_fpaths = table.fpaths[len(self.fpaths):]
+        with open(join(self.path, 'fpaths.txt'), 'a') as f:
+            f.writelines(p + '\n' for p in new_fpaths)
+        new_labels = [(l, table.label_info[l][0])
+                      for l in table.labels[len(self.labels):]]
+        with open(join(self.path, 'labels.tsv'), 'a') as f:
+            f.writelines('\t'.join(l) + '\n' for l in new_labels)
+        self.fpaths.extend(new_fpaths)
+        self.labels.extend(new_labels)
+        d = table.data
+        for name in self.dtype.names:
+            with open(self._colpath(name), 'ab') as f:
+                np.ascontiguousarray(d[name]).tofile(f)
+
+    def column(self, name, mmap=True):
+        """One column of the store, memory-mapped by default."""
+        n = self.nrows()
+        sub = self.dtype[name]
+        shape = (n,) + sub.shape
+        if n == 0:
+            return np.empty(shape, dtype=sub.base)
+        if mmap:
+            return np.memmap(self._colpath(name), dtype=sub.base, mode='r',
+                             shape=shape)
+        return np.fromfile(self._colpath(name), dtype=sub.base,
+                           count=int(np.prod(shape))).reshape(shape)
+
+    def read(self):
+        """All rows in the store as an ExtractTable."""
+        n = self.nrows()
+        table = self.empty_table()
+        table._reserve(n)
+        for name in self.dtype.names:
+            table._data[name][:n] = self.column(name, mmap=False)
+        table._len = n
+        return table
+
+
+def _truncate_partial_line(path):
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 4096))
+        tail = f.read()
+        if tail.endswith(b'\n'):
+            return
+        # Only the part after the last newline is incomplete.
+        f.truncate(size - len(tail) + tail.rfind(b'\n') + 1)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ExtractRow(ExtractBase):
+    """View of one row of an ExtractTable that behaves like an extract
+    object. Nothing is copied until an attribute is read.
+    """
+    def __init__(self, table, i):
+        self.table = table
+        self.i = i
+
+    def _field(self, name):
+        return self.table._data[self.i][name]
+
+    @property
+    def fpath(self):
+        return self.table.fpaths[self._field('loop')]
+
+    @property
+    def label(self):
+        return self.table.labels[self._field('label')]
+
+    @property
+    def label_short(self):
+        return self.table.label_info[self.label][0]
+
+    @property
+    def avg_val(self):
+        return float(self._field('avg_val'))
+
+    @property
+    def std_val(self):
+        return float(self._field('std_val'))
+
+    @property
+    def grid_pos(self):
+        return int(self._field('row')), int(self._field('col'))
+
+    @property
+    def xcoords(self):
+        return self._field('xcoords')[:self._field('ncoords')]
+    xs = xcoords
+
+    @property
+    def ycoords(self):
+        return self._field('ycoords')[:self._field('ncoords')]
+    ys = ycoords
+
+    @property
+    def indices(self):
+        ixs = self._field('indices')[:self._field('ncoords')]
+        return None if (ixs < 0).all() else ixs
+    ixs = indices
+
+    def plot(self, ax, **kwargs):
+        """Plot like the extract class this row came from."""
+        cls = self.table.label_info[self.label][1]
+        plot = getattr(cls, 'plot', ExtractBase.plot)
+        return plot(self, ax, **kwargs)
+
+
+def _copy_rows(src, dest):
+    """Copy the rows `src` into `dest`, a table with another number of
+    coordinates. Rows whose coordinates don't fit lose them.
+    """
+    for name in src.dtype.names:
+        if name not in ('xcoords', 'ycoords', 'indices'):
+            dest[name] = src[name]
+    k = min(src['xcoords'].shape[1], dest['xcoords'].shape[1])
+    fits = src['ncoords'] <= dest['xcoords'].shape[1]
+    dest['ncoords'] = np.where(fits, src['ncoords'], 0)
+    for field, fill in (('xcoords', np.nan), ('ycoords', np.nan),
+                        ('indices', -1)):
+        dest[field] = fill
+        dest[field][fits, :k] = src[field][fits, :k]
+
+
+def _coords(v):
+    if v is None:
+        return np.empty(0)
+    return np.atleast_1d(np.asarray(v, dtype=float))
+
+
+def _padded(v, n, fill):
+    res = np.full(n, fill, dtype=float)
+    res[:len(v)] = v
+    return res
+
+
+def _title_from(fpath, level):
+    dir, base = split(fpath)
+    if level == 0:
+        return base
+    return _title_from(dir, level - 1)
@@ -1,33 +1,100 @@
 # -*- coding: utf-8 -*-
+"""Transformations of the x and y data of a hysteresis loop. Each is a
+function `f(x, y, **params)` returning the new `(x, y)`, and they can be
+chained with `Transformer` or `TransformedHLoop`.
+
+The transformations never modify `x` and `y`. The arrays they return are
+new, except that an axis a transformation leaves alone may be returned as
+it was given. So a chain can run on the read-only arrays of
+`HLoop.arrays()`, and chains can run on many loops in parallel threads.
+To avoid allocating, the elementwise transformations take an optional
+`out=(x, y)` pair of arrays that both results are written into; `out` may
+be the inputs themselves to transform in place.
+
+Transformations that carry state from one call to the next (like
+`vertical_offset`) keep it in a `TransformContext`. Give each independent
+sequence of calls its own context.
+"""
+import threading
 import numpy as np
 from collections import Iterable
+import pandas as pd
+from hloopy.hloop import HLoop
+from hloopy.stack import HLoopStack
+from hloopy.cache import default_transform_cache
+from hloopy.median import running_median
+from hloopy.smooth import smooth, gaussian_kernel, savgol_kernel
 
 def line(x, m, b):
     return m * x + b
 
 
-def scale(x, y, xsc=1.0, ysc=1.0, **kwargs):
+class TransformContext:
+    """State shared by the calls of a chain of transformations, see the
+    module docstring. Updates are atomic, so a context may be shared by
+    threads, although the order of their calls then decides the result.
+    """
+    def __init__(self):
+        self.state = {}
+        self._lock = threading.Lock()
+
+    def accumulate(self, key, delta, start=0.0):
+        """Add `delta` to the value `key` (first set to `start`) and return
+        the new value.
+        """
+        with self._lock:
+            value = self.state.get(key, start) + delta
+            self.state[key] = value
+            return value
+
+    def reset(self):
+        with self._lock:
+            self.state.clear()
+
+
+# Used by the transformations when no context is given.
+_default_context = TransformContext()
+
+
+def scale(x, y, xsc=1.0, ysc=1.0, out=None, **kwargs):
     """Scale data. For use with Transformer."""
-    return x * xsc, y * ysc
+    return (np.multiply(x, xsc, out=_dest(out, 0)),
+            np.multiply(y, ysc, out=_dest(out, 1)))
 
 
-def translate(x, y, xtrans=1.0, ytrans=1.0, **kwargs):
+def translate(x, y, xtrans=1.0, ytrans=1.0, out=None, **kwargs):
     """Translate data. For use with Transformer."""
-    return x + xtrans, y + ytrans
+    return (np.add(x, xtrans, out=_dest(out, 0)),
+            np.add(y, ytrans, out=_dest(out, 1)))
 
 
-def invertx(x, y, **kwargs):
+def invertx(x, y, out=None, **kwargs):
     """Multiply x by -1"""
-    return -x, y
+    return np.negative(x, out=_dest(out, 0)), _keep(y, out, 1)
 
 
-def inverty(x, y, **kwargs):
+def inverty(x, y, out=None, **kwargs):
     """Multiply y by -1"""
-    return x, -y
+    return _keep(x, out, 0), np.negative(y, out=_dest(out, 1))
+
+
+def _dest(out, i):
+    """Array for result `i` to be written to, None to allocate one."""
+    return None if out is None else out[i]
+
+
+def _keep(u, out, i):
+    """Result `i`, which is `u` unchanged."""
+    if out is None:
+        return u
+    if out[i] is not u:
+        out[i][...] = u
+    return out[i]
 
 
 def medfilt(x, y, ks=3, axis='y', **kwargs):
-    """Use scipy.signal.medfilt to filter either the x or y data.
+    """Median filter either the x or y data. Gives the same result as
+    scipy.signal.medfilt, see `hloopy.median.running_median`.
     
     Args:
         ks: and odd number that represents the width of the filter. See medfilt
@@ -35,58 +102,52 @@ def medfilt(x, y, ks=3, axis='y', **kwargs):
         axis: either 'x' or 'y'. Indicates which axis medfilt should be called
             on.
     """
-    from scipy.signal import medfilt
     _verify_axis(axis)
     if axis == 'x':
-        x = medfilt(x, ks)
+        x = running_median(x, ks, mode='constant')
     elif axis == 'y': 
-        y = medfilt(y, ks)
+        y = running_median(y, ks, mode='constant')
     return x, y
 
 def wrapped_medfilt(x, y, ks=3, axis='y', **kwargs):
-    """Use scipy.signal.medfilt to filter either the x or y data. Also loop the
-    filter around to prevent edge effects.
+    """Median filter either the x or y data. Also loop the filter around to
+    prevent edge effects.
 
     If the data forms a closed loop the medfilt should account for this,
     otherwise there will be artifacts introduced in points near (less than
     ks-1 / 2) the edge of the data. This version of medfilt accounts for that
-    by prepending the last ks data points and appending the first data points,
-    running medfilt, and then removing the pre/appended points.
+    by taking the windows near the edges circularly, as if the last ks data
+    points were prepended and the first ks appended (without copying them).
     
     Args:
         ks: and odd number that represents the width of the filter. See medfilt
-            for more detail.
+            for more detail. It cannot be larger than the number of points.
         axis: either 'x' or 'y'. Indicates which axis medfilt should be called
             on.
     """
-    from scipy.signal import medfilt
     _verify_axis(axis)
-    x = np.concatenate((x[-ks:], x, x[:ks]))
-    y = np.concatenate((y[-ks:], y, y[:ks]))
     if axis == 'x':
-        x = medfilt(x, ks)
+        x = running_median(x, ks, mode='wrap')
     elif axis == 'y': 
-        y = medfilt(y, ks)
-    return x[ks:-ks], y[ks:-ks]
+        y = running_median(y, ks, mode='wrap')
+    return x, y
 
 
-def remove_offset(x, y, axis='y', **kwargs):
+def remove_offset(x, y, axis='y', out=None, **kwargs):
     """Center data either horizontally or vertically (default to vertically).
 
-    This is done by the crude method of just doing y -= y.mean() (if axis='y').
+    This is done by the crude method of just doing y - y.mean() (if axis='y').
 
     Args:
         axis: either 'x' or 'y'. Indicates which axis should be centered.
     """
     _verify_axis(axis)
     if axis == 'y':
-        y -= y.mean()
-    elif axis == 'x':
-        x -= x.mean()
-    return x, y
+        return _keep(x, out, 0), np.subtract(y, y.mean(), out=_dest(out, 1))
+    return np.subtract(x, x.mean(), out=_dest(out, 0)), _keep(y, out, 1)
 
 
-def center(x, y, axis='y', **kwargs):
+def center(x, y, axis='y', out=None, **kwargs):
     """Center data either horizontally or vertically (default to vertically).
 
     Return y - average_of(y.max(), y.min())
@@ -96,10 +157,41 @@ def center(x, y, axis='y', **kwargs):
     """
     _verify_axis(axis)
     if axis == 'y':
-        y -= 0.5 * (y.max() + y.min())
-    elif axis == 'x':
-        x -= 0.5 * (x.max() + x.min())
-    return x, y
+        mid = 0.5 * (y.max() + y.min())
+        return _keep(x, out, 0), np.subtract(y, mid, out=_dest(out, 1))
+    mid = 0.5 * (x.max() + x.min())
+    return np.subtract(x, mid, out=_dest(out, 0)), _keep(y, out, 1)
+
+
+def gaussian_smooth(x, y, width=20, axis='y', circular=True,
+                    method='auto', **kwargs):
+    """Smooth either the x or y data with a Gaussian kernel. See
+    `hloopy.smooth.smooth`.
+
+    Args:
+        width: Standard deviation of the Gaussian, in points.
+        axis: either 'x' or 'y'. Indicates which axis should be smoothed.
+        circular: True if the data is a closed loop, False to mirror it at
+            its ends.
+        method: 'direct', 'fft' or 'auto' to pick by kernel length.
+    """
+    return _smooth_axis(x, y, gaussian_kernel(width), axis, circular, method)
+
+
+def savgol_smooth(x, y, window=21, polyorder=3, axis='y', circular=True,
+                  method='auto', **kwargs):
+    """Smooth either the x or y data with a Savitzky-Golay filter of odd
+    length `window`. See `gaussian_smooth` for the other arguments.
+    """
+    kernel = savgol_kernel(window, polyorder)
+    return _smooth_axis(x, y, kernel, axis, circular, method)
+
+
+def _smooth_axis(x, y, kernel, axis, circular, method):
+    _verify_axis(axis)
+    if axis == 'x':
+        return smooth(x, kernel, circular, method), y
+    return x, smooth(y, kernel, circular, method)
 
 
 def unroll(x, y, axis='y', **kwargs):
@@ -141,17 +233,31 @@ def spline(x, y, axis='y', s=3.0, **kwargs):
         return spl(ylin), y
 
 
-def flatten_saturation(x, y, threshold=200, polarity='+', **kwargs):
+def flatten_saturation(x, y, threshold=200, polarity='+', mask=None,
+                       full_output=False, **kwargs):
     """Subtract a linear term from your data based on a fit to the saturation
-    region.
+    region. The line is fit by linear least squares in closed form, see
+    `fit_saturation()` for the arguments.
+
+    Args:
+        full_output: If True also return the fitted parameters.
+
+    Returns:
+        (x, y), or (x, y, params) if `full_output`.
+
+    Raises:
+        ValueError: If the saturation region has fewer than two distinct x
+            values.
     """
-    from scipy.optimize import curve_fit
-    if polarity == '+':
-        mask = x > threshold
-    elif polarity == '-':
-        mask = x < threshold
-    popt, pcov = curve_fit(line, x[mask], y[mask])
-    return x, y - line(x, *popt)
+    x, y = np.asarray(x), np.asarray(y)
+    params = fit_saturation(x[None, :], y[None, :], threshold, polarity,
+                            None if mask is None else np.asarray(mask)[None])
+    params = dict((k, v[0]) for k, v in params.items())
+    if np.isnan(params['slope']):
+        msg = 'Too few points to fit in the saturation region, {} {}'
+        raise ValueError(msg.format(polarity, threshold))
+    y = y - (params['slope'] * x + params['intercept'])
+    return (x, y, params) if full_output else (x, y)
 
 
 def _verify_axis(axis):
@@ -186,13 +292,16 @@ def ith_cycle(x, y, i, ncyc, delta=0, **kwargs):
     
 
 
-def vertical_offset(x, y, dy=0.1, **kwargs):
-    if not hasattr(vertical_offset, 'offset'):
-        vertical_offset.offset = 0.0
-    vertical_offset.offset += dy
-    return x, y + vertical_offset.offset
+def vertical_offset(x, y, dy=0.1, context=None, out=None, **kwargs):
+    """Shift y up by `dy` more than in the previous call with the same
+    `context` (a TransformContext, by default one shared by all calls), to
+    stack loops above each other.
+    """
+    context = context if context is not None else _default_context
+    offset = context.accumulate('vertical_offset', dy)
+    return _keep(x, out, 0), np.add(y, offset, out=_dest(out, 1))
 
-def normalize(x, y, xlim=None, ylim=None, n_avg=1, **kwargs):
+def normalize(x, y, xlim=None, ylim=None, n_avg=1, out=None, **kwargs):
     """Move the data to fit in the box defined by xlim and ylim.
 
 
@@ -207,30 +316,35 @@ def normalize(x, y, xlim=None, ylim=None, n_avg=1, **kwargs):
             of the 10 greatest points would be used.
     """
     res = []
-    for u, lim in zip((x, y), (xlim, ylim)):
+    for i, (u, lim) in enumerate(zip((x, y), (xlim, ylim))):
         if lim is None:
-            res.append(u)
+            res.append(_keep(u, out, i))
             continue
         if not isinstance(lim, Iterable):
             lim = (-lim, lim)
         center = (lim[0] + lim[1]) / 2.0
         width = lim[1] - lim[0]
-        u -= u.mean()
+        u = np.subtract(u, u.mean(), out=_dest(out, i))
         uwidth = 2 * (_max_n_points(np.abs(u), n_avg).mean())
-        res.append(u * (width / uwidth) + center)
+        u *= width / uwidth
+        u += center
+        res.append(u)
     return res[0], res[1]
 
 
-def simple_normalize(x, y, n_avg=1, axis='y', **kwargs):
+def simple_normalize(x, y, n_avg=1, axis='y', out=None, **kwargs):
     _verify_axis(axis)
     if axis == 'y':
-        return x, y/_max_n_points(np.abs(y), n_avg).mean()
+        level = _max_n_points(np.abs(y), n_avg).mean()
+        return _keep(x, out, 0), np.divide(y, level, out=_dest(out, 1))
     else:
-        return x/_max_n_points(np.abs(x), n_avg).mean(), y
+        level = _max_n_points(np.abs(x), n_avg).mean()
+        return np.divide(x, level, out=_dest(out, 0)), _keep(y, out, 1)
 
 
-def saturation_normalize(x, y, thresh=1.0, axis='y', **kwargs):
-    return x, y / _saturation_level(x, y, thresh)
+def saturation_normalize(x, y, thresh=1.0, axis='y', out=None, **kwargs):
+    level = _saturation_level(x, y, thresh)
+    return _keep(x, out, 0), np.divide(y, level, out=_dest(out, 1))
     # return x[np.abs(x) > thresh], y[np.abs(x) > thresh]
 
 
@@ -255,7 +369,7 @@ def _saturation_level(x, y, thresh):
     return np.abs(y)[np.abs(x) > thresh].mean()
 
 
-def threshold_crop(x, y, thresh=np.float('inf'), axis='x', **kwargs):
+def threshold_crop(x, y, thresh=np.inf, axis='x', **kwargs):
     """Clip of all points that are above thresh.
 
     Args:
@@ -267,11 +381,521 @@ def threshold_crop(x, y, thresh=np.float('inf'), axis='x', **kwargs):
     ind = np.abs(x) < thresh
     return x[ind], y[ind]
     
-def amr_normalize(x, y, thresh=300.0, amr_mag=1.0, angle=0.0, **kwargs):
-    y -= _amr_tail_mean(x, y, thresh)
-    y/= amr_mag
-    y += np.cos(angle)**2
-    return x, y
+def amr_normalize(x, y, thresh=300.0, amr_mag=1.0, angle=0.0, out=None,
+                  **kwargs):
+    res = np.subtract(y, _amr_tail_mean(x, y, thresh), out=_dest(out, 1))
+    res /= amr_mag
+    res += np.cos(angle)**2
+    return _keep(x, out, 0), res
 
 def _amr_tail_mean(x, y, thresh):
     return y[np.abs(x) > np.abs(thresh)].mean()
+
+
+# Batch versions of the transformations, for 2d arrays of shape
+# (nloops, npoints) such as those of an HLoopStack. Each row gives exactly
+# the same result as the per-loop function, and the inputs are not modified.
+
+def medfilt_batch(x, y, ks=3, axis='y', **kwargs):
+    """Batch `medfilt`, over the rows of 2d x and y."""
+    _verify_axis(axis)
+    if axis == 'x':
+        return running_median(x, ks, mode='constant'), y
+    return x, running_median(y, ks, mode='constant')
+
+
+def wrapped_medfilt_batch(x, y, ks=3, axis='y', **kwargs):
+    """Batch `wrapped_medfilt`, over the rows of 2d x and y."""
+    _verify_axis(axis)
+    if axis == 'x':
+        return running_median(x, ks, mode='wrap'), y
+    return x, running_median(y, ks, mode='wrap')
+
+
+def gaussian_smooth_batch(x, y, width=20, axis='y', circular=True,
+                          method='auto', **kwargs):
+    """Batch `gaussian_smooth`, over the rows of 2d x and y."""
+    return gaussian_smooth(x, y, width, axis, circular, method)
+
+
+def savgol_smooth_batch(x, y, window=21, polyorder=3, axis='y',
+                        circular=True, method='auto', **kwargs):
+    """Batch `savgol_smooth`, over the rows of 2d x and y."""
+    return savgol_smooth(x, y, window, polyorder, axis, circular, method)
+
+
+def remove_offset_batch(x, y, axis='y', **kwargs):
+    """Batch `remove_offset`, over the rows of 2d x and y."""
+    _verify_axis(axis)
+    if axis == 'y':
+        return x, y - y.mean(axis=1, keepdims=True)
+    return x - x.mean(axis=1, keepdims=True), y
+
+
+def center_batch(x, y, axis='y', **kwargs):
+    """Batch `center`, over the rows of 2d x and y."""
+    _verify_axis(axis)
+    if axis == 'y':
+        return x, y - 0.5 * (y.max(axis=1, keepdims=True) +
+                             y.min(axis=1, keepdims=True))
+    return x - 0.5 * (x.max(axis=1, keepdims=True) +
+                      x.min(axis=1, keepdims=True)), y
+
+
+def normalize_batch(x, y, xlim=None, ylim=None, n_avg=1, **kwargs):
+    """Batch `normalize`, over the rows of 2d x and y."""
+    res = []
+    for u, lim in zip((x, y), (xlim, ylim)):
+        if lim is None:
+            res.append(u)
+            continue
+        if not isinstance(lim, Iterable):
+            lim = (-lim, lim)
+        center = (lim[0] + lim[1]) / 2.0
+        width = lim[1] - lim[0]
+        u = u - u.mean(axis=1, keepdims=True)
+        uwidth = 2 * (_max_n_points_rows(np.abs(u), n_avg).mean(axis=1))
+        res.append(u * (width / uwidth)[:, None] + center)
+    return res[0], res[1]
+
+
+def simple_normalize_batch(x, y, n_avg=1, axis='y', **kwargs):
+    """Batch `simple_normalize`, over the rows of 2d x and y."""
+    _verify_axis(axis)
+    u = y if axis == 'y' else x
+    u = u / _max_n_points_rows(np.abs(u), n_avg).mean(axis=1)[:, None]
+    return (x, u) if axis == 'y' else (u, y)
+
+
+def threshold_crop_batch(x, y, thresh=np.inf, axis='x', **kwargs):
+    """Batch `threshold_crop`. The rows would be cropped to different
+    lengths, so this returns the mask of the points that are kept instead.
+    """
+    return np.abs(x) < thresh
+
+
+def flatten_saturation_batch(x, y, threshold=200, polarity='+', mask=None,
+                             full_output=False, **kwargs):
+    """Batch `flatten_saturation`, over the rows of 2d x and y. Rows that
+    cannot be fit come out as NaN.
+    """
+    params = fit_saturation(x, y, threshold, polarity, mask)
+    y = y - (params['slope'][:, None] * x + params['intercept'][:, None])
+    return (x, y, params) if full_output else (x, y)
+
+
+def fit_saturation(x, y, threshold=200, polarity='+', mask=None):
+    """Least squares line through the saturation region of each row of 2d
+    x and y, in closed form.
+
+    Args:
+        threshold: Field beyond which a loop is saturated. A float, or one
+            per row.
+        polarity: '+' to fit where x > threshold, '-' where x < threshold,
+            or 'both' to fit both tails (|x| > |threshold|) with a common
+            slope and an intercept for each tail. The line then goes
+            midway between the tails.
+        mask: Boolean array like x of the points that may be used, for
+            example to leave out spikes.
+
+    Returns:
+        dict of arrays with one value per row: 'slope', 'intercept', 'n'
+            (number of points fit) and 'rms' (root mean square residual).
+            'both' adds the intercepts of the tails, 'intercept_pos' and
+            'intercept_neg'. Rows with fewer than two distinct x values in
+            the region give NaN.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    threshold = np.asarray(threshold, dtype=float)
+    if threshold.ndim:
+        threshold = threshold[:, None]
+    if polarity == '+':
+        tails = [x > threshold]
+    elif polarity == '-':
+        tails = [x < threshold]
+    elif polarity == 'both':
+        tails = [x > np.abs(threshold), x < -np.abs(threshold)]
+    else:
+        msg = 'Arg "polarity" must be "+", "-" or "both", not {}'
+        raise ValueError(msg.format(polarity))
+    if mask is not None:
+        tails = [t & mask for t in tails]
+    # Each tail is centered on its own means, the slope is common.
+    sxy = sxx = 0.0
+    means, n = [], 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for t in tails:
+            nt = t.sum(axis=1)
+            mx = np.where(t, x, 0.0).sum(axis=1) / nt
+            my = np.where(t, y, 0.0).sum(axis=1) / nt
+            dx = np.where(t, x - mx[:, None], 0.0)
+            dy = np.where(t, y - my[:, None], 0.0)
+            sxy = sxy + (dx * dy).sum(axis=1)
+            sxx = sxx + (dx * dx).sum(axis=1)
+            means.append((mx, my))
+            n = n + nt
+        slope = np.where(sxx > 0, sxy / sxx, np.nan)
+        b = [my - slope * mx for mx, my in means]
+        res = 0.0
+        for t, bt in zip(tails, b):
+            r = np.where(t, y - (slope[:, None] * x + bt[:, None]), 0.0)
+            res = res + (r * r).sum(axis=1)
+        params = {'slope': slope, 'intercept': sum(b) / len(b), 'n': n,
+                  'rms': np.sqrt(res / n)}
+    if polarity == 'both':
+        params['intercept_pos'], params['intercept_neg'] = b
+    return params
+
+
+def _max_n_points_rows(arr, n=1):
+    """`_max_n_points` of each row of `arr`: its `n` greatest values, in
+    the same order.
+    """
+    N = arr.shape[1]
+    n = min(n, N)
+    top = np.partition(arr, N - n, axis=1)[:, N - n:]
+    return np.ascontiguousarray(np.sort(top, axis=1)[:, ::-1])
+
+
+class Transformer:
+    """A chain of the transformations in this module, applied to x and y
+    data, an HLoop or an HLoopStack.
+
+    The input data is never modified (copy-on-write): the transformations
+    of this module leave their arguments alone, and any other function is
+    given a private copy. Copies and the results of fused steps go to
+    scratch buffers that the Transformer keeps and reuses from call to
+    call, so running it over many loops of the same length allocates only
+    the returned arrays.
+
+    Consecutive elementwise steps (`scale`, `translate`, `invertx`,
+    `inverty`, `center` and `remove_offset`) are fused into a single
+    multiply-add per axis. The results equal those of calling the steps
+    one by one, up to rounding.
+
+    Each thread has its own scratch buffers, so one Transformer can be
+    used from many threads at once.
+
+    Args:
+        steps (sequence): Transformation functions, or (function, kwargs)
+            pairs, in the order they are applied.
+    """
+    def __init__(self, steps=()):
+        self.steps = [s if isinstance(s, tuple) else (s, {}) for s in steps]
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def then(self, func, **kwargs):
+        """New Transformer with `func(x, y, **kwargs)` added at the end."""
+        return Transformer(self.steps + [(func, kwargs)])
+
+    def __call__(self, x, y, out=None, context=None):
+        """Transform x and y.
+
+        Args:
+            out: Optional (x, y) arrays the results are written into.
+            context: TransformContext passed to the steps, for those that
+                keep state between calls.
+
+        Returns:
+            (x, y): New arrays (or `out`). An axis that no step changes is
+                returned as it was given unless `out` is given.
+        """
+        given = (np.asarray(x), np.asarray(y))
+        cur = list(given)
+        pending = [_Affine(u) for u in cur]
+        for func, kwargs in self.steps:
+            affine = _AFFINES.get(func)
+            if affine is not None:
+                for p, (a, b) in zip(pending, affine(*pending, **kwargs)):
+                    p.compose(a, b)
+                continue
+            pure = getattr(func, '__module__', None) == __name__
+            for i in (0, 1):
+                if not pending[i].identity():
+                    cur[i] = self._run_affine(pending[i], i, given)
+                elif not pure and self._shares(cur[i], given):
+                    buf = self._buffer(i, cur[i].shape, cur[i].dtype)
+                    np.copyto(buf, cur[i])
+                    cur[i] = buf
+            if context is not None:
+                kwargs = dict(kwargs, context=context)
+            cur = [np.asarray(u) for u in func(cur[0], cur[1], **kwargs)]
+            pending = [_Affine(u) for u in cur]
+        res = []
+        for i in (0, 1):
+            dest = None if out is None else out[i]
+            u, p = cur[i], pending[i]
+            if not p.identity():
+                if dest is None:
+                    dest = np.empty(u.shape, p.dtype())
+                res.append(p.apply(dest))
+            elif dest is not None:
+                dest[...] = u
+                res.append(dest)
+            elif self._is_buffer(u):
+                res.append(u.copy())
+            else:
+                res.append(u)
+        return res[0], res[1]
+
+    def apply(self, hloop):
+        """The transformed `hloop`, as an HLoop of a new one loop
+        HLoopStack.
+        """
+        x, y = self(*hloop.arrays())
+        meta = {'header': getattr(hloop, 'header', None)}
+        return HLoopStack(x[None, :], y[None, :], fpaths=[hloop.fpath],
+                          meta=[meta])[0]
+
+    def apply_stack(self, stack):
+        """New HLoopStack of the transformed loops of `stack`."""
+        xs, ys = [], []
+        for i in range(len(stack)):
+            x, y = self(stack.loop_x(i), stack.loop_y(i))
+            xs.append(x)
+            ys.append(y)
+        lengths = np.array([len(x) for x in xs])
+        if len(xs) and (lengths == lengths[0]).all():
+            return HLoopStack(np.vstack(xs), np.vstack(ys),
+                              fpaths=stack.fpaths, meta=stack.meta)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        return HLoopStack(np.concatenate(xs), np.concatenate(ys),
+                          offsets=offsets, fpaths=stack.fpaths,
+                          meta=stack.meta)
+
+    def _run_affine(self, p, i, given):
+        """Apply the pending affine map `p` of axis `i`, in place if its
+        array is not one of the `given` inputs.
+        """
+        u = p.u
+        if self._shares(u, given) or p.dtype() != u.dtype:
+            return p.apply(self._buffer(i, u.shape, p.dtype()))
+        return p.apply(u)
+
+    def _buffers(self):
+        """This thread's scratch buffers."""
+        return self._local.__dict__.setdefault('buffers', {})
+
+    def _buffer(self, i, shape, dtype):
+        buffers = self._buffers()
+        key = (i, shape, np.dtype(dtype))
+        buf = buffers.get(key)
+        if buf is None:
+            buf = buffers[key] = np.empty(shape, dtype)
+        return buf
+
+    def _is_buffer(self, u):
+        return any(np.may_share_memory(u, b)
+                   for b in self._buffers().values())
+
+    @staticmethod
+    def _shares(u, given):
+        return any(np.may_share_memory(u, g) for g in given)
+
+
+class TransformedHLoop(HLoop):
+    """An HLoop whose x and y are those of another HLoop, `source`, passed
+    through a chain of transformation steps. Nothing is computed until the
+    data is asked for.
+
+    The result of every step is kept in a `hloopy.cache.TransformCache`,
+    keyed on the source's `cache_key()` and the steps up to it. Changing
+    step `i` (see `set_step()`) only recomputes the steps from `i` on, and
+    since `cache_key()` changes with the steps, extracts are recomputed
+    (and those of earlier settings fetched from the extract cache again if
+    a setting is changed back). Derived loops made with `then()` share the
+    results of their common steps.
+
+    Args:
+        source (HLoop): Loop to transform.
+        steps (sequence): Transformation functions, or (function, kwargs)
+            pairs.
+        cache: A TransformCache. `None` uses the shared default cache.
+    """
+    def __init__(self, source, steps=(), cache=None):
+        self.source = source
+        self.steps = [s if isinstance(s, tuple) else (s, {}) for s in steps]
+        self.transform_cache = (cache if cache is not None
+                                else default_transform_cache())
+        self._init_state(source.fpath, num_cols=2,
+                         header=getattr(source, 'header', None))
+
+    def then(self, func, **kwargs):
+        """New TransformedHLoop with `func(x, y, **kwargs)` added at the
+        end of the steps.
+        """
+        return TransformedHLoop(self.source, self.steps + [(func, kwargs)],
+                                self.transform_cache)
+
+    def set_step(self, i, func=None, **kwargs):
+        """Replace the parameters (and, if given, the function) of step
+        `i`.
+        """
+        old_func, _ = self.steps[i]
+        self.steps[i] = (func or old_func, kwargs)
+        self.invalidate()
+
+    def _key(self, n):
+        """Cache key of the result of the first `n` steps."""
+        return (self.source.cache_key(),
+                tuple((f, _params_key(kw)) for f, kw in self.steps[:n]))
+
+    def cache_key(self):
+        return self._key(len(self.steps))
+
+    def _compute(self):
+        n = len(self.steps)
+        # Start from the longest chain of steps already computed.
+        for k in range(n, 0, -1):
+            xy = self.transform_cache.get(self._key(k))
+            if xy is not None:
+                break
+        else:
+            k, xy = 0, self.source.arrays()
+        for i in range(k, n):
+            xy = Transformer(self.steps[i:i + 1])(*xy)
+            for u in xy:
+                u.flags.writeable = False
+            self.transform_cache.put(self._key(i + 1), xy, self.source)
+        return xy
+
+    def x(self):
+        return self._compute()[0]
+    _x = x
+
+    def y(self):
+        return self._compute()[1]
+    _y = y
+
+    def arrays(self):
+        # Keyed on cache_key(), not version, so that changes to the source
+        # (such as its setas()) are picked up too.
+        key = self.cache_key()
+        if self._arrays is None or self._arrays[0] != key:
+            x, y = self._compute()
+            self._arrays = (key, x, y)
+            self._df = None
+        return self._arrays[1], self._arrays[2]
+
+    def _get_df(self):
+        # arrays() drops a frame made before the source changed.
+        self.arrays()
+        return HLoop.df.fget(self)
+    df = property(_get_df, HLoop.df.fset, doc=HLoop.df.__doc__)
+
+    def _read_data(self, f, **kwargs):
+        x, y = self.arrays()
+        self.df = pd.DataFrame({'x': x, 'y': y}, columns=['x', 'y'])
+
+    def release(self):
+        self._df = None
+        self._arrays = None
+
+    def setas(self, *args, **kwargs):
+        """The columns of a TransformedHLoop are fixed, this does nothing.
+        """
+        pass
+
+
+def _params_key(kwargs):
+    """Hashable form of the step parameters `kwargs`."""
+    res = []
+    for k, v in sorted(kwargs.items()):
+        try:
+            hash(v)
+        except TypeError:
+            v = repr(v)
+        res.append((k, v))
+    return tuple(res)
+
+
+class _Affine:
+    """Pending elementwise map `a * u + b` of the array `u`, with the
+    statistics of the mapped array that `center` and `remove_offset` need.
+    """
+    def __init__(self, u):
+        self.u = u
+        self.a, self.b = 1.0, 0.0
+        self._stats = {}
+
+    def compose(self, a, b):
+        self.a, self.b = a * self.a, a * self.b + b
+
+    def identity(self):
+        return self.a == 1.0 and self.b == 0.0
+
+    def dtype(self):
+        return np.result_type(self.u, self.a, self.b)
+
+    def _stat(self, name):
+        if name not in self._stats:
+            self._stats[name] = getattr(self.u, name)()
+        return self._stats[name]
+
+    def mean(self):
+        return self.a * self._stat('mean') + self.b
+
+    def max(self):
+        ext = self._stat('max') if self.a >= 0 else self._stat('min')
+        return self.a * ext + self.b
+
+    def min(self):
+        ext = self._stat('min') if self.a >= 0 else self._stat('max')
+        return self.a * ext + self.b
+
+    def apply(self, out):
+        np.multiply(self.u, self.a, out=out)
+        if self.b != 0.0:
+            out += self.b
+        return out
+
+
+def _affine_scale(x, y, xsc=1.0, ysc=1.0, **kwargs):
+    return (xsc, 0.0), (ysc, 0.0)
+
+
+def _affine_translate(x, y, xtrans=1.0, ytrans=1.0, **kwargs):
+    return (1.0, xtrans), (1.0, ytrans)
+
+
+def _affine_invertx(x, y, **kwargs):
+    return (-1.0, 0.0), (1.0, 0.0)
+
+
+def _affine_inverty(x, y, **kwargs):
+    return (1.0, 0.0), (-1.0, 0.0)
+
+
+def _affine_remove_offset(x, y, axis='y', **kwargs):
+    _verify_axis(axis)
+    if axis == 'y':
+        return (1.0, 0.0), (1.0, -y.mean())
+    return (1.0, -x.mean()), (1.0, 0.0)
+
+
+def _affine_center(x, y, axis='y', **kwargs):
+    _verify_axis(axis)
+    if axis == 'y':
+        return (1.0, 0.0), (1.0, -0.5 * (y.max() + y.min()))
+    return (1.0, -0.5 * (x.max() + x.min())), (1.0, 0.0)
+
+
+# Elementwise steps, as functions of the (pending) x and y giving the
+# (a, b) of each axis.
+_AFFINES = {
+    scale: _affine_scale,
+    translate: _affine_translate,
+    invertx: _affine_invertx,
+    inverty: _affine_inverty,
+    remove_offset: _affine_remove_offset,
+    center: _affine_center,
+}
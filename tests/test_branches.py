@@ -0,0 +1,67 @@
+from hloopy import HLoop, HLoopStack
+from hloopy.branches import Branches, directions_rows
+from hloopy.extract import Coercivity, Remanence
+from nose.tools import assert_equal, assert_true, raises
+from os.path import join, realpath, dirname
+import numpy as np
+
+TESTPATH = realpath(dirname(__file__))
+
+
+class TestBranches:
+    @classmethod
+    def setup(cls):
+        t = np.linspace(0, 4 * np.pi, 800, endpoint=False)
+        cls.x = 100 * np.cos(t)
+        cls.y = np.tanh((cls.x + 20 * np.sign(np.roll(cls.x, 5) - cls.x))
+                        / 10)
+
+    def test_turning_points(self):
+        b = Branches(self.x)
+        np.testing.assert_array_equal(b.turning_points, [0, 200, 400, 600])
+        np.testing.assert_array_equal(b.kinds, [1, -1, 1, -1])
+        np.testing.assert_array_equal(b.cycle_boundaries(), [0, 400])
+        assert_equal(b.segments()[1], (200, 400, 1))
+
+    def test_direction_matches_diff(self):
+        for shift in (0, 37, 555):
+            x = np.roll(self.x, shift)
+            b = Branches(x)
+            d = np.sign(np.diff(x))
+            np.testing.assert_array_equal(b.direction[:-1][d != 0], d[d != 0])
+
+    def test_noise(self):
+        rng = np.random.RandomState(0)
+        b = Branches(np.roll(self.x, 50) + rng.randn(800))
+        assert_equal(len(b.turning_points), 4)
+        assert_true(all(abs(b.turning_points - [50, 250, 450, 650]) < 10))
+
+    def test_rows_match_single(self):
+        xs = np.array([np.roll(self.x, s) for s in (0, 13, 400)])
+        d = directions_rows(xs)
+        for row, x in zip(d, xs):
+            np.testing.assert_array_equal(row, Branches(x).direction)
+
+    def test_extracts_independent_of_start(self):
+        ref_hc = Coercivity(HLoopStack(self.x[None], self.y[None])[0])
+        ref_mr = Remanence(HLoopStack(self.x[None], self.y[None])[0])
+        for shift in (1, 99, 250, 799):
+            hl = HLoopStack(np.roll(self.x, shift)[None],
+                            np.roll(self.y, shift)[None])[0]
+            assert_equal(Coercivity(hl).avg_val, ref_hc.avg_val)
+            assert_equal(Remanence(hl).avg_val, ref_mr.avg_val)
+
+    @raises(ValueError)
+    def test_single_sweep(self):
+        x = np.linspace(-1, 1, 100)
+        Coercivity(HLoopStack(x[None], x[None])[0])
+
+    def test_hloop_caches_branches(self):
+        fpath = join(TESTPATH, 'data', 'poleup_poledown', '0deg_400G_down_0')
+        hl = HLoop(fpath, setas='x.y', sep='\t', skiprows=5)
+        b = hl.branches()
+        assert_true(hl.branches() is b)
+        hl.release()
+        assert_true(hl.branches() is b)
+        hl.setas('.xy')
+        assert_true(hl.branches() is not b)
@@ -0,0 +1,162 @@
+from hloopy import HLoop
+from hloopy.cache import SidecarCache, ExtractCache
+from hloopy.extract import Coercivity, Remanence, Saturation
+from nose.tools import assert_equal, assert_true
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+testpath = os.path.realpath(os.path.dirname(__file__))
+
+
+def _hc(hloop):
+    return Coercivity(hloop).avg_val
+
+
+class TestSidecarCache:
+    @classmethod
+    def setup(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.cache = SidecarCache(os.path.join(cls.tmpdir, 'cache'))
+        src = os.path.join(testpath, 'data', 'poleup_poledown', 
+                           '0deg_400G_down_0')
+        cls.fpath = os.path.join(cls.tmpdir, '0deg_400G_down_0')
+        shutil.copy(src, cls.fpath)
+
+    @classmethod
+    def teardown(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_roundtrip(self):
+        hl = HLoop(self.fpath, cache=self.cache, sep='\t', skiprows=5)
+        assert_equal(len(self.cache.entries()), 1)
+        hl2 = HLoop(self.fpath, cache=self.cache, sep='\t', skiprows=5)
+        assert_equal(list(hl.df.columns), list(hl2.df.columns))
+        assert_true(np.array_equal(hl.df.values, hl2.df.values))
+
+    def test_stale_entry_removed(self):
+        HLoop(self.fpath, cache=self.cache, sep='\t', skiprows=5)
+        with open(self.fpath, 'a') as f:
+            f.write('1.0\t2.0\t3.0\n')
+        kwargs = {'sep': '\t', 'skiprows': 5, 'read_func': 'csv'}
+        assert_equal(self.cache.load(self.fpath, kwargs), None)
+        assert_equal(len(self.cache.entries()), 0)
+
+    def test_evict(self):
+        HLoop(self.fpath, cache=self.cache, sep='\t', skiprows=5)
+        HLoop(self.fpath, cache=self.cache, sep='\t', skiprows=6)
+        assert_equal(len(self.cache.entries()), 2)
+        self.cache.max_bytes = self.cache.nbytes() - 1
+        self.cache.evict()
+        assert_equal(len(self.cache.entries()), 1)
+
+
+    def test_store_scans_only_when_full(self):
+        scans = []
+        entries = self.cache.entries
+
+        def counted():
+            scans.append(1)
+            return entries()
+        self.cache.entries = counted
+        df = pd.DataFrame({'a': np.arange(100.0)})
+        for i in range(5):
+            self.cache.store(self.fpath, {'skiprows': i}, df)
+        assert_equal(len(scans), 1)
+        self.cache.max_bytes = self.cache.nbytes()
+        del scans[:]
+        self.cache.store(self.fpath, {'skiprows': 5}, df)
+        assert_equal(len(scans), 1)
+        assert_equal(len(entries()), 5)
+
+    def test_concurrent_stores(self):
+        from concurrent.futures import ThreadPoolExecutor
+        df = pd.DataFrame({'a': np.arange(10000.0)})
+        with ThreadPoolExecutor(4) as ex:
+            stored = list(ex.map(
+                lambda i: self.cache.store(self.fpath, {}, df), range(16)))
+        assert_true(all(stored))
+        data, meta = self.cache.load(self.fpath, {})
+        np.testing.assert_array_equal(data[:, 0], df['a'].values)
+        assert_equal(len(os.listdir(self.cache.cachedir)), 2)
+
+    def test_dtypes(self):
+        ints = pd.DataFrame({'a': np.arange(10), 'b': np.arange(10)})
+        assert_true(self.cache.store(self.fpath, {}, ints))
+        data, meta = self.cache.load(self.fpath, {})
+        assert_equal(data.dtype, ints.values.dtype)
+        mixed = pd.DataFrame({'a': np.arange(10), 'b': np.ones(10)})
+        assert_equal(self.cache.store(self.fpath, {'x': 1}, mixed), False)
+        mixed['b'] = mixed['b'] > 0
+        assert_equal(self.cache.store(self.fpath, {'x': 2}, mixed), False)
+
+
+class TestExtractCache:
+    @classmethod
+    def setup(cls):
+        fpath = os.path.join(testpath, 'data', 'poleup_poledown', 
+                             '0deg_400G_down_0')
+        cls.hl = HLoop(fpath, setas='x.y', sep='\t', skiprows=5)
+        cls.cache = ExtractCache(maxsize=2)
+
+    def test_hit_miss(self):
+        e0 = self.cache.get(Coercivity, self.hl)
+        e1 = self.cache.get(Coercivity, self.hl)
+        assert_true(e0 is e1)
+        self.cache.get(Coercivity, self.hl, avg_width=5)
+        assert_equal((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_setas_invalidates(self):
+        e0 = self.cache.get(Coercivity, self.hl)
+        self.hl.setas('y.x')
+        e1 = self.cache.get(Coercivity, self.hl)
+        assert_true(e0 is not e1)
+
+    def test_lru_eviction(self):
+        self.cache.get(Coercivity, self.hl)
+        self.cache.get(Remanence, self.hl)
+        self.cache.get(Coercivity, self.hl)
+        self.cache.get(Saturation, self.hl)
+        assert_equal(len(self.cache), 2)
+        self.cache.get(Coercivity, self.hl)
+        assert_equal(self.cache.hits, 2)
+
+    def test_max_bytes(self):
+        self.cache.max_bytes = 1
+        self.cache.get(Coercivity, self.hl)
+        assert_equal(len(self.cache), 0)
+
+    def test_max_bytes_counts_loops(self):
+        cache = ExtractCache()
+        cache.get(Coercivity, self.hl)
+        df_nbytes = self.hl.df.memory_usage(index=True).sum()
+        assert_true(cache.nbytes > df_nbytes)
+        nbytes = cache.nbytes
+        # The loop is counted once, however many extracts hold it.
+        cache.get(Remanence, self.hl)
+        assert_true(cache.nbytes - nbytes < df_nbytes)
+        cache.max_bytes = df_nbytes
+        cache.get(Saturation, self.hl)
+        assert_equal((len(cache), cache.nbytes), (0, 0))
+
+    def test_weak_loops(self):
+        import gc
+        from hloopy.cache import default_extract_cache
+        assert_true(default_extract_cache().max_bytes is not None)
+        cache = ExtractCache()
+        hl = HLoop(self.hl.fpath, setas='x.y', sep='\t', skiprows=5)
+        cache.get(_hc, hl)
+        # A function's result does not hold the loop, nor does the cache.
+        assert_true(cache.nbytes < 1000)
+        del hl
+        gc.collect()
+        cache.get(_hc, self.hl)
+        assert_equal((len(cache), cache.misses), (1, 2))
+
+    def test_content_key(self):
+        cache = ExtractCache(key_by='content')
+        other = HLoop(self.hl.fpath, setas='x.y', sep='\t', skiprows=5)
+        e0 = cache.get(Coercivity, self.hl)
+        assert_true(cache.get(Coercivity, other) is e0)
@@ -0,0 +1,99 @@
+from hloopy import HLoop, HLoopGrid
+from hloopy.engine import ExtractEngine
+from hloopy.extract import Coercivity, Remanence
+from hloopy.plotters import ExtractGridPlot
+from nose.tools import assert_equal, assert_true
+from os.path import join, realpath, dirname
+import matplotlib.pyplot as plt
+import numpy as np
+
+TESTPATH = realpath(dirname(__file__))
+
+
+class _Unstorable(Coercivity):
+    """Coercivity with an avg_val the table can't store for one loop."""
+    def __init__(self, hloop, **kwargs):
+        super().__init__(hloop, **kwargs)
+        self.label = 'unstorable'
+        if hloop.fpath.endswith('up_1'):
+            self.avg_val = 'not a number'
+
+
+class TestExtractEngine:
+    @classmethod
+    def setup(cls):
+        datapath = join(TESTPATH, 'data', 'poleup_poledown')
+        names = ('0deg_400G_down_0', '0deg_400G_up_0',
+                 '0deg_400G_down_1', '0deg_400G_up_1')
+        cls.fpaths = [join(datapath, n) for n in names]
+        cls.kwargs = dict(setas='x.y', sep='\t', skiprows=5)
+
+    @classmethod
+    def teardown(cls):
+        plt.close('all')
+
+    def test_matches_serial(self):
+        hls = [HLoop(f, **self.kwargs) for f in self.fpaths]
+        grid = HLoopGrid(hls)
+        for workers, backend in ((1, 'process'), (2, 'thread'),
+                                 (2, 'process')):
+            engine = ExtractEngine([Coercivity, (Remanence, {'avg_width': 5})],
+                                   workers=workers, chunksize=1,
+                                   backend=backend)
+            table = engine.run(grid)
+            assert_equal(len(table), 8)
+            assert_equal(table.errors, [])
+            hc = table.grid(Coercivity)
+            for hl, (row, col) in zip(hls, grid.mapping):
+                assert_equal(hc[row, col], Coercivity(hl).avg_val)
+            mr = table.by_fpath(Remanence)[self.fpaths[2]]
+            assert_equal(mr.avg_val, Remanence(hls[2], 5).avg_val)
+
+    def test_failed_site(self):
+        engine = ExtractEngine([Coercivity], workers=2)
+        table = engine.run(self.fpaths[:3] + ['missing'], **self.kwargs)
+        assert_equal(len(table), 3)
+        assert_equal(len(table.errors), 1)
+        assert_equal(table.errors[0][0], 'missing')
+        assert_equal(table.shape, (2, 2))
+        assert_true(np.isnan(table.grid('coercivity')[1, 1]))
+
+    def test_unstorable_site(self):
+        engine = ExtractEngine([Coercivity, _Unstorable], workers=1,
+                               backend='thread')
+        table = engine.run(self.fpaths, **self.kwargs)
+        assert_equal([f for f, _ in table.errors], [self.fpaths[3]])
+        assert_equal(len(table), 6)
+        assert_true(self.fpaths[3] not in table.by_fpath(Coercivity))
+
+    def test_plot_results(self):
+        hls = [HLoop(f, **self.kwargs) for f in self.fpaths]
+        grid = HLoopGrid(hls)
+        table = ExtractEngine([Coercivity], workers=1).run(grid)
+        egp = ExtractGridPlot(grid, Coercivity, results=table)
+        egp.plot()
+        assert_true(egp.extract_instances[0][0].table is table)
+
+    def test_stack_shared(self):
+        from hloopy import HLoopStack
+        hls = [HLoop(f, **self.kwargs) for f in self.fpaths]
+        stack = HLoopStack.from_hloops(hls)
+        ref = Coercivity.batch(stack)['avg_val']
+        for shared in ('shm', 'mmap', None):
+            engine = ExtractEngine([Coercivity], workers=2, chunksize=3,
+                                   shared=shared)
+            table = engine.run(stack)
+            np.testing.assert_array_equal(table.values('coercivity'), ref)
+            assert_equal(table.fpaths, self.fpaths)
+        # Workers let go of the block at the end of each task.
+        from hloopy import shared
+        from hloopy.engine import _run_chunk
+        with shared.SharedStack(stack) as ss:
+            handle = ss.handle.for_loops([1], [self.fpaths[1]])
+            table, errors = _run_chunk([(1, 0, 0)], [(Coercivity, {})], {},
+                                       handle)
+            assert_equal(table[0].fpath, self.fpaths[1])
+            assert_equal(table[0].avg_val, ref[1])
+            assert_true(handle.name not in shared._attached)
+        table = ExtractEngine([Coercivity], workers=2).run(HLoopGrid(hls))
+        np.testing.assert_array_equal(table.values('coercivity'), ref)
@@ -1,7 +1,7 @@
 from hloopy import HLoop
 from hloopy.extract import (coercivity, Coercivity, Remanence, Saturation,
                             ExtractWriter)
-from nose.tools import assert_equal, assert_less
+from nose.tools import assert_equal, assert_less, assert_true
 import os
 import matplotlib.pyplot as plt
 import numpy as np
@@ -81,3 +81,150 @@ class TestExtractWriter:
         writer.add(sat_extract)
         writer.to_csv(self.savepath)
 
+    def test_d(self):
+        writer = ExtractWriter()
+        writer.add(Remanence(self.hl))
+        writer.add(Saturation(self.hl))
+        assert_equal(list(writer.d), [self.hl.fpath])
+        es = writer.d[self.hl.fpath]
+        assert_equal([e.label for e in es], ['remanence', 'Saturation'])
+        assert_equal(es[0].avg_val, Remanence(self.hl).avg_val)
+
+    def _hloops(self):
+        datapath = os.path.join(testpath, 'data', 'poleup_poledown')
+        return [HLoop(os.path.join(datapath, n), setas='x.y', sep='\t',
+                      skiprows=5)
+                for n in ('0deg_400G_down_0', '0deg_400G_up_0',
+                          '0deg_400G_down_1')]
+
+    def test_streaming_matches_memory(self):
+        mem = ExtractWriter()
+        for hl in self._hloops():
+            mem.extract(hl, Coercivity, Remanence)
+        for name in ('stream.tsv', 'stream.cols'):
+            path = os.path.join(testpath, 'save', name)
+            with ExtractWriter(path=path, flush_every=3) as writer:
+                for hl in self._hloops():
+                    writer.extract(hl, Coercivity, Remanence)
+                assert_true(len(writer.table) < 3)
+            df = ExtractWriter(path=path).to_df()
+            np.testing.assert_array_equal(df.values, mem.to_df().values)
+            assert_equal(list(df.index), list(mem.to_df().index))
+
+    def test_resume(self):
+        hls = self._hloops()
+        for name in ('resume.tsv', 'resume.cols'):
+            path = os.path.join(testpath, 'save', name)
+            with ExtractWriter(path=path) as writer:
+                writer.extract(hls[0], Coercivity)
+            if name.endswith('.tsv'):
+                with open(path, 'a') as f:
+                    f.write('half a li')
+            else:
+                with open(os.path.join(path, 'avg_val.bin'), 'ab') as f:
+                    f.write(b'1234')
+            writer = ExtractWriter(path=path)
+            assert_equal(writer.written(),
+                         {(hls[0].fpath, 'coercivity')})
+            writer.extract(hls[1], Coercivity)
+            assert_equal(len(writer.to_df()), 2)
+            writer = ExtractWriter(path=path, resume=False)
+            assert_equal(writer.written(), set())
+
+
+
+def _stack_pdn():
+    from hloopy import HLoopStack
+    names = ('0deg_400G_down_0', '0deg_400G_up_0', 
+             '0deg_400G_down_1', '0deg_400G_up_1')
+    fpaths = [os.path.join(testpath, 'data', 'poleup_poledown', n)
+              for n in names]
+    return HLoopStack.load(fpaths, setas='x.y', sep='\t', skiprows=5)
+
+
+def _assert_batch_matches(batch, extracts):
+    for i, e in enumerate(extracts):
+        np.testing.assert_equal(batch['avg_val'][i], e.avg_val)
+        np.testing.assert_array_equal(batch['xcoords'][i], e.xcoords)
+        np.testing.assert_array_equal(batch['ycoords'][i], e.ycoords)
+        if e.indices is not None:
+            np.testing.assert_array_equal(batch['indices'][i], e.indices)
+
+
+class TestBatchExtracts:
+    @classmethod
+    def setup(cls):
+        cls.stack = _stack_pdn()
+        rng = np.random.RandomState(0)
+        t = np.linspace(0, 2 * np.pi, 400, endpoint=False)
+        shifts = rng.randint(0, 400, size=20)
+        cls.x = np.array([np.roll(100 * np.cos(t), s) for s in shifts])
+        cls.y = np.tanh((cls.x + 20 * np.sign(np.roll(cls.x, 5, axis=1) - 
+                                               cls.x)) / 10)
+        cls.y += 0.01 * rng.randn(*cls.y.shape)
+
+    def test_coercivity_batch_matches(self):
+        _assert_batch_matches(Coercivity.batch(self.stack), 
+                              [Coercivity(hl) for hl in self.stack])
+
+    def test_coercivity_batch_edges(self):
+        from hloopy import HLoopStack
+        stack = HLoopStack(self.x, self.y)
+        for w in (1, 10, 40):
+            _assert_batch_matches(Coercivity.batch(stack, avg_width=w),
+                                  [Coercivity(hl, w) for hl in stack])
+
+    def test_coercivity_batch_ragged(self):
+        from hloopy import HLoopStack
+        xs, ys = [self.x[0], self.x[1][:300]], [self.y[0], self.y[1][:300]]
+        stack = HLoopStack(np.concatenate(xs), np.concatenate(ys),
+                           offsets=[0, 400, 700])
+        _assert_batch_matches(Coercivity.batch(stack),
+                              [Coercivity(hl) for hl in stack])
+
+    def test_remanence_batch_matches(self):
+        from hloopy import HLoopStack
+        _assert_batch_matches(Remanence.batch(self.stack), 
+                              [Remanence(hl) for hl in self.stack])
+        stack = HLoopStack(self.x[:, :398], self.y[:, :398])
+        for w in (1, 10, 40):
+            _assert_batch_matches(Remanence.batch(stack, avg_width=w),
+                                  [Remanence(hl, w) for hl in stack])
+
+    def test_saturation_batch_matches(self):
+        from hloopy import HLoopStack
+        for stack in (self.stack, HLoopStack(self.x, self.y)):
+            batch = Saturation.batch(stack, bins=30)
+            for i, hl in enumerate(stack):
+                try:
+                    e = Saturation.saturation(hl.x(), hl.y(), bins=30)
+                except ValueError:
+                    assert_true(np.isnan(batch['avg_val'][i]))
+                    continue
+                np.testing.assert_array_equal(batch['thresh_y'][i], 
+                                              e['thresh_y'])
+                np.testing.assert_allclose(batch['ycoords'][i], 
+                                           e['ycoords'], rtol=1e-12)
+                np.testing.assert_array_equal(batch['xcoords'][i], 
+                                              e['xcoords'])
+
+    def test_histogram_rows(self):
+        from hloopy.extract import _histogram_rows
+        heights, edges = _histogram_rows(self.y, 17)
+        for i, row in enumerate(self.y):
+            h, e = np.histogram(row, bins=17)
+            np.testing.assert_array_equal(heights[i], h)
+            np.testing.assert_array_equal(edges[i], e)
+
+    def test_extract_many_matches(self):
+        from hloopy import HLoopStack
+        from hloopy.extract import extract_many
+        for hl in HLoopStack(self.x, self.y):
+            hc, mr, sat = extract_many(hl, [Coercivity,
+                                            (Remanence, {'avg_width': 5}),
+                                            (Saturation, {'bins': 30})])
+            for e, ref in ((hc, Coercivity(hl)), (mr, Remanence(hl, 5)),
+                           (sat, Saturation(hl, bins=30))):
+                np.testing.assert_equal(e.avg_val, ref.avg_val)
+                np.testing.assert_array_equal(e.xcoords, ref.xcoords)
+                np.testing.assert_array_equal(e.ycoords, ref.ycoords)
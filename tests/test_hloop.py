@@ -1,5 +1,5 @@
-from hloopy import HLoop
-from nose.tools import assert_equal, raises
+from hloopy import HLoop, HLoopGrid
+from nose.tools import assert_equal, assert_true, raises
 import os
 import matplotlib.pyplot as plt
 
@@ -40,3 +40,119 @@ class TestHLoopPupPdn:
         self.hl.setas('x.y')
         self.hl.plot(self.ax)
         if SHOW_PLOTS: plt.show()
+
+
+class TestHLoopLazy:
+    @classmethod
+    def setup(cls):
+        cls.fpath = os.path.join(testpath, 'data', 'poleup_poledown', 
+                                 '0deg_400G_down_0')
+
+    def test_lazy_not_read(self):
+        hl = HLoop(self.fpath, lazy=True, sep='\t', skiprows=5)
+        assert_equal(hl.is_loaded(), False)
+
+    def test_lazy_num_cols_without_read(self):
+        hl = HLoop(self.fpath, lazy=True, sep='\t', skiprows=5)
+        assert_equal(hl.num_cols(), 3)
+        assert_equal(hl.is_loaded(), False)
+
+    def test_lazy_read_on_access(self):
+        hl = HLoop(self.fpath, lazy=True, setas='x.y', sep='\t', skiprows=5)
+        eager = HLoop(self.fpath, setas='x.y', sep='\t', skiprows=5)
+        assert_equal(list(hl.y()), list(eager.y()))
+        assert_equal(hl.is_loaded(), True)
+
+    def test_release(self):
+        hl = HLoop(self.fpath, lazy=True, sep='\t', skiprows=5)
+        n = len(hl.x())
+        hl.release()
+        assert_equal(hl.is_loaded(), False)
+        assert_equal(len(hl.x()), n)
+
+
+class TestHLoopProject:
+    @classmethod
+    def setup(cls):
+        cls.fpath = os.path.join(testpath, 'data', 'poleup_poledown', 
+                                 '0deg_400G_down_0')
+        cls.full = HLoop(cls.fpath, setas='x.y', sep='\t', skiprows=5)
+
+    def test_project_str(self):
+        hl = HLoop(self.fpath, setas='x.y', project=True, sep='\t',
+                   skiprows=5)
+        assert_equal(len(hl.df.columns), 2)
+        assert_equal(hl.num_cols(), 3)
+        assert_equal(list(hl.y()), list(self.full.y()))
+
+    def test_project_dict_dtype(self):
+        import numpy as np
+        hl = HLoop(self.fpath, setas={'x': 2, 'y': 0}, project=True, 
+                   dtype=np.float32, sep='\t', skiprows=5)
+        assert_equal(hl.x().dtype, np.float32)
+        assert_equal(list(hl.y()), list(self.full.x().astype(np.float32)))
+
+    def test_project_setas_rereads(self):
+        hl = HLoop(self.fpath, setas='x.y', project=True, sep='\t',
+                   skiprows=5)
+        hl.setas('xy')
+        assert_equal(list(hl.y()), list(self.full.df.iloc[:, 1]))
+
+    @raises(ValueError)
+    def test_project_setas_validation(self):
+        HLoop(self.fpath, setas='x...y', project=True, lazy=True, sep='\t',
+              skiprows=5)
+
+
+class TestHLoopLoadMany:
+    @classmethod
+    def setup(cls):
+        datapath = os.path.join(testpath, 'data', 'poleup_poledown')
+        names = ('0deg_400G_down_0', '0deg_400G_up_0', 
+                 '0deg_400G_down_1', '0deg_400G_up_1')
+        cls.fpaths = [os.path.join(datapath, n) for n in names]
+
+    def check_load_many(self, backend):
+        fpaths = self.fpaths[:2] + ['missing'] + self.fpaths[2:]
+        hls = HLoop.load_many(fpaths, workers=2, backend=backend, 
+                              setas='x.y', sep='\t', skiprows=5)
+        assert_equal([hl.fpath for hl in hls], self.fpaths)
+        assert_equal([e[0] for e in hls.errors], ['missing'])
+        HLoopGrid(hls)
+
+    def test_load_many_thread(self):
+        self.check_load_many('thread')
+
+    def test_load_many_process(self):
+        self.check_load_many('process')
+
+    @raises(FileNotFoundError)
+    def test_load_many_raise(self):
+        HLoop.load_many(['missing'], errors='raise')
+
+
+class TestHLoopArrays:
+    @classmethod
+    def setup(cls):
+        fpath = os.path.join(testpath, 'data', 'poleup_poledown', 
+                             '0deg_400G_down_0')
+        cls.hl = HLoop(fpath, setas='x.y', sep='\t', skiprows=5)
+
+    def test_arrays_cached_readonly(self):
+        x, y = self.hl.arrays()
+        assert_equal(x.flags.writeable, False)
+        assert_equal(y.flags.c_contiguous, True)
+        assert_true(self.hl.arrays()[0] is x)
+        assert_equal(list(y), list(self.hl.y()))
+
+    def test_arrays_no_copy(self):
+        import numpy as np
+        x, y = self.hl.arrays()
+        # setas='x.y', the y data is column 2.
+        assert_true(np.shares_memory(y, self.hl.df.iloc[:, 2].to_numpy()))
+
+    def test_setas_invalidates(self):
+        x, y = self.hl.arrays()
+        self.hl.setas('y.x')
+        x2, y2 = self.hl.arrays()
+        assert_equal(list(x2), list(y))
@@ -0,0 +1,65 @@
+from hloopy.median import running_median, kth_smallest
+from nose.tools import assert_equal, assert_raises
+from numpy.testing import assert_array_equal
+from scipy.signal import medfilt
+import numpy as np
+
+
+class TestRunningMedian:
+    @classmethod
+    def setup(cls):
+        rng = np.random.RandomState(0)
+        cls.a = rng.randn(3, 500)
+        # Plenty of ties.
+        cls.b = rng.randint(0, 4, size=(2, 300)).astype(float)
+
+    def test_constant(self):
+        for method in ('ndimage', 'wavelet'):
+            for a in (self.a, self.b):
+                for ks in (1, 3, 15, 17, 51):
+                    res = running_median(a, ks, 'constant', method)
+                    for i in range(len(a)):
+                        assert_array_equal(res[i], medfilt(a[i], ks))
+                    assert_array_equal(
+                        running_median(a[0], ks, 'constant', method), res[0])
+
+    def test_wrap(self):
+        for method in ('ndimage', 'wavelet'):
+            for a in (self.a, self.b):
+                for ks in (3, 15, 17, 101, 299):
+                    res = running_median(a, ks, method=method)
+                    for i in range(len(a)):
+                        p = np.concatenate((a[i, -ks:], a[i], a[i, :ks]))
+                        assert_array_equal(res[i], medfilt(p, ks)[ks:-ks])
+
+    def test_auto(self):
+        from hloopy import median
+        calls = []
+        wavelet = median._wavelet
+
+        def counted(*args):
+            calls.append(args[1])
+            return wavelet(*args)
+        median._wavelet = counted
+        try:
+            for ks in (3, 51, 101, 201):
+                res = running_median(self.a, ks, 'constant')
+                assert_array_equal(res, running_median(self.a, ks,
+                                                       'constant', 'ndimage'))
+        finally:
+            median._wavelet = wavelet
+        # 1500 points: 6 * log2(1500) ~ 63
+        assert_equal(calls, [101, 201])
+
+    def test_bad_args(self):
+        assert_raises(ValueError, running_median, self.a, 4)
+        assert_raises(ValueError, running_median, self.a, 501)
+        assert_raises(ValueError, running_median, self.a, 3, mode='edge')
+        assert_raises(ValueError, running_median, self.a, 3, method='sort')
+
+    def test_kth_smallest(self):
+        a = np.array([5., 1., 4., 2., 3.])
+        ranges = [(np.array([0, 1, 0]), np.array([5, 3, 1])),
+                  (np.array([0, 4, 3]), np.array([0, 5, 5]))]
+        assert_array_equal(kth_smallest(a, ranges, 1), [2., 3., 3.])
+        assert_equal(kth_smallest(a, ranges[:1], [4, 0, 0])[0], 5.)
@@ -0,0 +1,77 @@
+from hloopy import HLoop
+from hloopy.pipeline import Pipeline, run_pipeline, watch
+from hloopy.extract import Coercivity, Remanence, ExtractWriter
+from nose.tools import assert_equal, assert_true
+from os.path import join, realpath, dirname
+import asyncio
+import shutil
+import tempfile
+
+TESTPATH = realpath(dirname(__file__))
+
+
+class TestPipeline:
+    @classmethod
+    def setup(cls):
+        datapath = join(TESTPATH, 'data', 'poleup_poledown')
+        names = ('0deg_400G_down_0', '0deg_400G_up_0',
+                 '0deg_400G_down_1', '0deg_400G_up_1')
+        cls.fpaths = [join(datapath, n) for n in names]
+        cls.kwargs = dict(setas='x.y', sep='\t', skiprows=5)
+
+    def test_matches_serial(self):
+        for backend in ('thread', 'process'):
+            p = run_pipeline(self.fpaths + [join(TESTPATH, 'missing')],
+                             [Coercivity, Remanence], load_workers=2,
+                             extract_workers=2, queue_size=1,
+                             backend=backend, **self.kwargs)
+            assert_equal([f for f, _ in p.errors],
+                         [join(TESTPATH, 'missing')])
+            assert_equal(p.counts['write'], 4)
+            hc = p.writer.table.by_fpath(Coercivity)
+            for f in self.fpaths:
+                assert_equal(hc[f].avg_val,
+                             Coercivity(HLoop(f, **self.kwargs)).avg_val)
+
+    def test_stream_and_resume(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = join(tmp, 'extracts.tsv')
+            with ExtractWriter(path=path, flush_every=2) as w:
+                run_pipeline(self.fpaths[:2], [Coercivity], writer=w,
+                             **self.kwargs)
+            w = ExtractWriter(path=path)
+            p = run_pipeline(self.fpaths, [Coercivity], writer=w,
+                             **self.kwargs)
+            assert_equal(p.counts['discover'], 2)
+            assert_equal(len(w.store.read()), 4)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_watch(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            for f in self.fpaths[:3]:
+                shutil.copy(f, tmp)
+
+            async def collect():
+                return [f async for f in watch(tmp, interval=0.01,
+                                               idle_timeout=0.05)]
+            loop = asyncio.new_event_loop()
+            try:
+                found = loop.run_until_complete(collect())
+            finally:
+                loop.close()
+            assert_equal(len(found), 3)
+            p = Pipeline([Coercivity], **self.kwargs)
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(
+                    p.run(watch(tmp, interval=0.01, idle_timeout=0.05)))
+            finally:
+                loop.close()
+            assert_equal(len(p.writer.table), 3)
+            assert_true(all(f.startswith(tmp)
+                            for f in p.writer.table.fpaths))
+        finally:
+            shutil.rmtree(tmp)
@@ -1,3 +1,75 @@
 from hloopy.preprocess import *
 import numpy as np
 
+from numpy.testing import assert_allclose, assert_array_equal
+from nose.tools import assert_equal, assert_true
+from os.path import join
+import shutil
+import tempfile
+
+
+class TestCycleAverager:
+    @classmethod
+    def setup(cls):
+        rng = np.random.RandomState(0)
+        cls.cyclen = 50
+        i = np.arange(int(12.5 * cls.cyclen))
+        cls.y = np.sin(2 * np.pi * i / cls.cyclen) + 0.1 * rng.randn(len(i))
+
+    def expected(self, y, cyclen):
+        phase = np.floor(np.arange(len(y)) % cyclen).astype(int)
+        groups = [y[phase == p] for p in range(int(np.ceil(cyclen)))]
+        mean = np.array([g.mean() for g in groups])
+        err = np.array([g.std(ddof=1) / np.sqrt(len(g)) for g in groups])
+        return mean, err
+
+    def test_matches_direct(self):
+        for cyclen in (self.cyclen, 47.5):
+            avg = CycleAverager(cyclen)
+            rng = np.random.RandomState(1)
+            pos = 0
+            while pos < len(self.y):
+                n = rng.randint(1, 80)
+                avg.update(self.y[pos:pos + n])
+                pos += n
+            mean, err = self.expected(self.y, cyclen)
+            assert_allclose(avg.mean, mean, rtol=1e-12)
+            assert_allclose(avg.stderr(), err, rtol=1e-10)
+            assert_equal(avg.count.sum(), len(self.y))
+
+    def test_crop(self):
+        numcycles = len(self.y) / self.cyclen
+        cropped = crop(self.y, numcycles, precrop=2, postcrop=3)
+        mean, err = average_cycles_stream(
+            (self.y[i:i + 7] for i in range(0, len(self.y), 7)),
+            self.cyclen, precrop=2, postcrop=3)
+        emean, eerr = self.expected(cropped, self.cyclen)
+        assert_allclose(mean, emean, rtol=1e-12)
+        assert_allclose(err, eerr, rtol=1e-10)
+        # Whole cycles give the same mean as average_cycles.
+        whole = self.y[:12 * self.cyclen]
+        assert_allclose(average_cycles_stream(whole, self.cyclen)[0],
+                        whole.reshape(12, self.cyclen).mean(axis=0))
+
+    def test_file_columns(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            fpath = join(tmp, 'trace.txt')
+            x = np.arange(len(self.y)) % self.cyclen
+            np.savetxt(fpath, np.column_stack((x, self.y)), delimiter='\t')
+            chunks = read_chunks(fpath, sep='\t', header=None, chunksize=64)
+            mean, err = average_cycles_stream(chunks, self.cyclen)
+            assert_equal(mean.shape, (self.cyclen, 2))
+            assert_array_equal(mean[:, 0], np.arange(self.cyclen))
+            assert_allclose(err[:, 0], 0.0)
+            assert_allclose(mean[:, 1], self.expected(self.y, self.cyclen)[0],
+                            rtol=1e-12)
+            mm = np.memmap(join(tmp, 'y.bin'), dtype=float, mode='w+',
+                           shape=self.y.shape)
+            mm[:] = self.y
+            assert_allclose(average_cycles_stream(mm, self.cyclen)[1],
+                            self.expected(self.y, self.cyclen)[1],
+                            rtol=1e-10)
+            del mm
+        finally:
+            shutil.rmtree(tmp)
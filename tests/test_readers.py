@@ -0,0 +1,130 @@
+from hloopy import HLoop
+from hloopy import readers
+from nose.tools import assert_equal, assert_true, raises
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+testpath = os.path.realpath(os.path.dirname(__file__))
+PDN = os.path.join(testpath, 'data', 'poleup_poledown', '0deg_400G_down_0')
+SCAN = os.path.join(testpath, 'data', 'scan0', 'scan=0_x=0_y=0_averaged.txt')
+
+
+def test_numeric_matches_pandas():
+    kwargs = {'sep': '\t', 'skiprows': 5}
+    fast = readers.read_numeric(PDN, **kwargs)
+    slow = pd.read_csv(PDN, **kwargs)
+    assert_equal(list(fast.columns), list(slow.columns))
+    assert_true(np.allclose(fast.values, slow.values))
+
+
+def test_numeric_usecols_nrows():
+    df = readers.read_numeric(PDN, sep='\t', skiprows=5, usecols=[2, 0],
+                              nrows=10, dtype=np.float32)
+    assert_equal(df.shape, (10, 2))
+    assert_equal(df.values.dtype, np.float32)
+
+
+@raises(readers.UnsupportedOptions)
+def test_numeric_unsupported():
+    readers.read_numeric(PDN, sep=',', skiprows=5)
+
+
+def test_detect_format():
+    assert_equal(readers.detect_format(SCAN), 'scmoke')
+    assert_equal(readers.detect_format(PDN), 'numeric')
+
+
+def test_scmoke_header():
+    hl = HLoop(SCAN, read_func='auto', setas='x.y')
+    assert_true(hl.header.startswith('AppliedField(G)'))
+    assert_equal(hl.num_cols(), 3)
+    assert_equal(len(hl.x()), 10000)
+
+
+def test_auto_falls_back_to_pandas():
+    hl = HLoop(PDN, read_func='auto', sep='\t', skiprows=5, 
+               skipinitialspace=True)
+    assert_equal(hl.num_cols(), 3)
+
+
+def test_non_numeric_rows_fall_back_to_pandas():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fpath = os.path.join(tmpdir, 'data.txt')
+        with open(fpath, 'w') as f:
+            f.write('field\tkerr\n1\t2\n3\t4\nend of scan\t-\n')
+        kwargs = {'sep': '\t'}
+        try:
+            readers.read_numeric(fpath, **kwargs)
+        except readers.UnsupportedOptions:
+            pass
+        else:
+            raise AssertionError('read_numeric parsed the footer')
+        df = readers.read_auto(fpath, **kwargs)
+        assert_true(df.equals(pd.read_csv(fpath, **kwargs)))
+        assert_equal(df.iloc[2, 0], 'end of scan')
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_empty_fields_fall_back_to_pandas():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fpath = os.path.join(tmpdir, 'data.txt')
+        with open(fpath, 'w') as f:
+            f.write('x\ty\n1\t\n2\t3\n\t4\n')
+        try:
+            readers.read_numeric(fpath, sep='\t')
+        except readers.UnsupportedOptions:
+            pass
+        else:
+            raise AssertionError('read_numeric parsed the empty fields')
+        df = readers.read_auto(fpath, sep='\t')
+        np.testing.assert_array_equal(df.values,
+                                      [[1, np.nan], [2, 3], [np.nan, 4]])
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_numeric_sniffs_sep():
+    fast = readers.read_numeric(PDN, skiprows=5)
+    assert_true(fast.equals(readers.read_numeric(PDN, sep='\t',
+                                                 skiprows=5)))
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fpath = os.path.join(tmpdir, 'data.csv.txt')
+        with open(fpath, 'w') as f:
+            f.write('x,y\n1,2\n')
+        try:
+            readers.read_numeric(fpath)
+        except readers.UnsupportedOptions:
+            pass
+        else:
+            raise AssertionError('read_numeric parsed comma separated data')
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_binary_roundtrip():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        data = pd.read_csv(PDN, sep='\t', skiprows=5).values
+        npy = os.path.join(tmpdir, 'data.npy')
+        npz = os.path.join(tmpdir, 'data.npz')
+        np.save(npy, data)
+        np.savez(npz, field=data[:, 0], rot=data[:, 1])
+        hl = HLoop(npy, read_func='auto', setas='x.y')
+        assert_true(np.array_equal(hl.y(), data[:, 2]))
+        hl = HLoop(npz, read_func='auto', setas='yx')
+        assert_equal(list(hl.df.columns), ['field', 'rot'])
+        assert_true(np.array_equal(hl.y(), data[:, 0]))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+@raises(ValueError)
+def test_unknown_reader():
+    HLoop(PDN, read_func='nope')
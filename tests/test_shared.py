@@ -0,0 +1,70 @@
+from hloopy import HLoopStack
+from hloopy.shared import SharedStack, SHM_DIR
+from hloopy import shared as shared_module
+from nose.tools import assert_equal, assert_true, assert_false, raises
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pickle
+import os
+
+
+def _loop_sum(handle, i):
+    return handle.attach()[i].y().sum()
+
+
+class TestSharedStack:
+    @classmethod
+    def setup(cls):
+        rng = np.random.RandomState(0)
+        cls.stack = HLoopStack(rng.rand(6, 50), rng.rand(6, 50))
+
+    def test_attach(self):
+        for kind in ('shm', 'mmap'):
+            with SharedStack(self.stack, kind=kind) as shared:
+                handle = pickle.loads(pickle.dumps(shared.handle))
+                handle.detach()
+                attached = handle.attach()
+                assert_true(np.array_equal(attached.x, self.stack.x))
+                assert_false(attached.y.flags.writeable)
+                assert_true(len(pickle.dumps(handle)) < 1000)
+                handle.detach()
+
+    def test_handle_per_task(self):
+        stack = HLoopStack(self.stack.x, self.stack.y,
+                           fpaths=['loop{}'.format(i) for i in range(6)],
+                           meta=[{'header': 'x' * 1000}] * 6)
+        with SharedStack(stack, kind='mmap') as shared:
+            handle = shared.handle
+            assert_true(len(pickle.dumps(handle)) < 1000)
+            task = pickle.loads(pickle.dumps(handle.for_loops([4], ['loop4'])))
+            attached = task.attach()
+            assert_equal(attached[4].fpath, 'loop4')
+            assert_equal(attached[3].fpath, None)
+            assert_true(task.name in shared_module._attached)
+            attached = None
+            task.detach()
+            assert_false(task.name in shared_module._attached)
+
+    def test_workers(self):
+        with SharedStack(self.stack) as shared:
+            with ProcessPoolExecutor(2) as ex:
+                sums = list(ex.map(_loop_sum, [shared.handle] * 6, range(6)))
+        np.testing.assert_allclose(sums, self.stack.y.sum(axis=1))
+
+    def test_cleanup(self):
+        shared = SharedStack(self.stack)
+        path = os.path.join(SHM_DIR, shared.handle.name)
+        x = shared.stack.x
+        shared.close()
+        assert_true(shared.closed)
+        assert_false(os.path.exists(path))
+        # Views made before closing stay usable.
+        assert_equal(x.sum(), self.stack.x.sum())
+        shared = SharedStack(self.stack, kind='mmap')
+        path = shared.handle.name
+        del shared
+        assert_false(os.path.exists(path))
+
+    @raises(ValueError)
+    def test_bad_kind(self):
+        SharedStack(self.stack, kind='pipe')
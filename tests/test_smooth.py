@@ -0,0 +1,49 @@
+from hloopy.smooth import smooth, gaussian_kernel, savgol_kernel
+from hloopy.transformations import (gaussian_smooth, gaussian_smooth_batch,
+                                    savgol_smooth)
+from nose.tools import assert_equal, assert_raises
+from numpy.testing import assert_allclose, assert_array_equal
+from scipy.ndimage import gaussian_filter1d
+from scipy.signal import savgol_filter
+import numpy as np
+
+
+class TestSmooth:
+    @classmethod
+    def setup(cls):
+        rng = np.random.RandomState(0)
+        t = np.linspace(0, 2 * np.pi, 1000, endpoint=False)
+        cls.a = np.sin(t) + 0.1 * rng.randn(3, 1000)
+
+    def test_gaussian(self):
+        for width in (1.5, 5, 20, 400):
+            k = gaussian_kernel(width)
+            for method in ('direct', 'fft'):
+                res = smooth(self.a, k, method=method)
+                assert_allclose(res, gaussian_filter1d(self.a, width,
+                                                       mode='wrap'),
+                                atol=1e-12)
+                res = smooth(self.a, k, circular=False, method=method)
+                assert_allclose(res, gaussian_filter1d(self.a, width,
+                                                       mode='reflect'),
+                                atol=1e-12)
+
+    def test_savgol(self):
+        for window, order in ((5, 2), (51, 3)):
+            expected = savgol_filter(self.a, window, order, mode='wrap')
+            for method in ('auto', 'direct', 'fft'):
+                res = smooth(self.a, savgol_kernel(window, order),
+                             method=method)
+                assert_allclose(res, expected, atol=1e-12)
+
+    def test_transformations(self):
+        x = np.arange(1000.0)
+        gx, gy = gaussian_smooth(x, self.a[0], width=3)
+        assert_array_equal(gx, x)
+        assert_allclose(gy, smooth(self.a[0], gaussian_kernel(3)))
+        bx, by = gaussian_smooth_batch(np.tile(x, (3, 1)), self.a, width=3)
+        assert_allclose(by[0], gy, atol=1e-12)
+        sx, sy = savgol_smooth(self.a[1], x, window=7, axis='x')
+        assert_equal(sy is x, True)
+        assert_raises(ValueError, smooth, self.a, np.ones(4) / 4)
+        assert_raises(ValueError, gaussian_kernel, 0)
@@ -0,0 +1,59 @@
+from hloopy import HLoop, HLoopGrid, HLoopStack
+from nose.tools import assert_equal, assert_true, raises
+from os.path import join, realpath, dirname
+import numpy as np
+
+TESTPATH = realpath(dirname(__file__))
+
+
+class TestHLoopStack:
+    @classmethod
+    def setup(cls):
+        datapath = join(TESTPATH, 'data', 'poleup_poledown')
+        names = ('0deg_400G_down_0', '0deg_400G_up_0', 
+                 '0deg_400G_down_1', '0deg_400G_up_1')
+        cls.fpaths = [join(datapath, n) for n in names]
+        cls.hls = [HLoop(f, setas='x.y', sep='\t', skiprows=5) 
+                   for f in cls.fpaths]
+
+    def test_from_hloops(self):
+        stack = HLoopStack.from_hloops(self.hls)
+        assert_equal(len(stack), 4)
+        for hl, shl in zip(self.hls, stack):
+            assert_true(np.array_equal(hl.y(), shl.y()))
+            assert_equal(hl.fpath, shl.fpath)
+
+    def test_load(self):
+        stack = HLoopStack.load(self.fpaths + ['missing'], setas='x.y', 
+                                sep='\t', skiprows=5)
+        assert_equal(len(stack), 4)
+        assert_equal(len(stack.errors), 1)
+
+    def test_slice_is_view(self):
+        stack = HLoopStack.from_hloops(self.hls)
+        sub = stack[1:3]
+        assert_true(np.shares_memory(sub.x, stack.x))
+        assert_equal(sub[0].fpath, self.fpaths[1])
+
+    def test_ragged(self):
+        x = [np.arange(3.0), np.arange(5.0), np.arange(2.0)]
+        offsets = np.array([0, 3, 8, 10])
+        stack = HLoopStack(np.concatenate(x), np.concatenate(x), 
+                           offsets=offsets)
+        assert_true(stack.ragged)
+        assert_equal(list(stack.lengths()), [3, 5, 2])
+        sub = stack[1:]
+        assert_true(np.shares_memory(sub.loop_x(0), stack.x))
+        assert_true(np.array_equal(sub[0].x(), x[1]))
+        xp, yp = sub.padded(fill=-1)
+        assert_equal(xp.tolist(), [[0, 1, 2, 3, 4], [0, 1, -1, -1, -1]])
+        assert_true(np.array_equal(stack[::2][1].x(), x[2]))
+
+    def test_grid(self):
+        stack = HLoopStack.from_hloops(self.hls)
+        hg = HLoopGrid(stack)
+        assert_equal(hg.nloops, 4)
+
+    @raises(ValueError)
+    def test_shape_mismatch(self):
+        HLoopStack(np.zeros((2, 3)), np.zeros((2, 4)))
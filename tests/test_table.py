@@ -0,0 +1,79 @@
+from hloopy import HLoop, HLoopGrid, HLoopStack, ExtractTable
+from hloopy.extract import Coercivity, Remanence, Saturation, ExtractWriter
+from nose.tools import assert_equal, assert_true
+from os.path import join, realpath, dirname
+import numpy as np
+
+TESTPATH = realpath(dirname(__file__))
+
+
+class TestExtractTable:
+    @classmethod
+    def setup(cls):
+        datapath = join(TESTPATH, 'data', 'poleup_poledown')
+        names = ('0deg_400G_down_0', '0deg_400G_up_0',
+                 '0deg_400G_down_1', '0deg_400G_up_1')
+        cls.fpaths = [join(datapath, n) for n in names]
+        cls.hls = [HLoop(f, setas='x.y', sep='\t', skiprows=5)
+                   for f in cls.fpaths]
+
+    def test_rows_match_extracts(self):
+        table = ExtractTable()
+        for hl in self.hls:
+            table.extract(hl, Coercivity, Remanence)
+        assert_equal(len(table), 8)
+        for row, hl in zip(table[::2], self.hls):
+            e = Coercivity(hl)
+            assert_equal(row.label, 'coercivity')
+            assert_equal(row.label_short, 'Hc')
+            assert_equal(row.avg_val, e.avg_val)
+            np.testing.assert_array_equal(row.xs, e.xs)
+            np.testing.assert_array_equal(row.indices, e.indices)
+
+    def test_pivot_matches_writer(self):
+        table, writer = ExtractTable(), ExtractWriter()
+        for hl in self.hls:
+            table.extract(hl, Coercivity, Remanence)
+            writer.extract(hl, Coercivity, Remanence)
+        assert_true(table.pivot().equals(writer.to_df()))
+
+    def test_extract_stack(self):
+        stack = HLoopStack.from_hloops(self.hls)
+        table = ExtractTable(capacity=1)
+        table.extract_stack(stack, Coercivity, Saturation)
+        hc = table.values('coercivity')
+        np.testing.assert_array_equal(hc, Coercivity.batch(stack)['avg_val'])
+        sat = table.filter(label='Saturation')
+        assert_equal(len(sat), 4)
+        assert_true(sat[0].indices is None)
+
+    def test_filter(self):
+        table = ExtractTable()
+        table.extract_grid(HLoopGrid(self.hls), Coercivity)
+        assert_equal(len(table.filter(row=0)), 2)
+        assert_equal(len(table.filter(fpath=self.fpaths[1:3])), 2)
+        big = table.filter(vmin=30)
+        assert_true((big.data['avg_val'] >= 30).all())
+        df = table.to_df(coords=True)
+        assert_equal(list(df['fpath']), self.fpaths)
+        assert_true('x1' in df.columns)
+
+    def test_too_many_coords(self):
+        table = ExtractTable(ncoords=1)
+        e = Coercivity(self.hls[0])
+        table.add(e)
+        stack = HLoopStack.from_hloops(self.hls)
+        table.add_batch(Coercivity.batch(stack), self.fpaths)
+        assert_equal(len(table), 5)
+        assert_true((table.data['ncoords'] == 0).all())
+        assert_equal(table[0].avg_val, e.avg_val)
+        assert_true(table[0].indices is None)
+        # Between tables with different numbers of coordinates.
+        wide, default = ExtractTable(ncoords=3), ExtractTable()
+        default.add(e)
+        wide.extend(default)
+        np.testing.assert_array_equal(wide[0].xs, e.xs)
+        np.testing.assert_array_equal(wide[0].indices, e.indices)
+        table.extend(wide)
+        assert_equal(table.data['ncoords'][-1], 0)
+        assert_equal(table[-1].avg_val, e.avg_val)
@@ -0,0 +1,284 @@
+from hloopy import HLoop, HLoopStack
+from hloopy.transformations import *
+from nose.tools import assert_equal, assert_true, assert_raises
+from numpy.testing import assert_allclose, assert_array_equal
+from os.path import join, realpath, dirname
+import numpy as np
+
+TESTPATH = realpath(dirname(__file__))
+
+
+class TestTransformer:
+    @classmethod
+    def setup(cls):
+        datapath = join(TESTPATH, 'data', 'poleup_poledown')
+        cls.hl = HLoop(join(datapath, '0deg_400G_down_0'), setas='x.y',
+                       sep='\t', skiprows=5)
+        cls.x, cls.y = cls.hl.arrays()
+
+    def test_matches_steps(self):
+        steps = [(scale, {'xsc': 2.0, 'ysc': -3.0}),
+                 (translate, {'xtrans': 1.0, 'ytrans': 5.0}),
+                 (center, {'axis': 'y'}), invertx,
+                 (wrapped_medfilt, {'ks': 5}),
+                 (remove_offset, {'axis': 'x'}),
+                 (normalize, {'ylim': 1.0})]
+        x, y = self.x.copy(), self.y.copy()
+        for f, kw in [s if isinstance(s, tuple) else (s, {}) for s in steps]:
+            x, y = f(x.copy(), y.copy(), **kw)
+        t = Transformer(steps)
+        for i in range(2):
+            tx, ty = t(self.x, self.y)
+            assert_allclose(tx, x, rtol=1e-12, atol=1e-9)
+            assert_allclose(ty, y, rtol=1e-12, atol=1e-9)
+        # Earlier results are not overwritten by buffer reuse.
+        tx2, ty2 = t(self.x, self.y)
+        assert_array_equal(tx, tx2)
+        assert_true(not np.may_share_memory(tx, tx2))
+
+    def test_no_writes_to_input(self):
+        x, y = self.x.copy(), self.y.copy()
+        t = Transformer([center, (normalize, {'xlim': 2.0}),
+                         (amr_normalize, {'thresh': 1.5})])
+        t(x, y)
+        assert_array_equal(x, self.x)
+        assert_array_equal(y, self.y)
+        # Read-only arrays, as from HLoop.arrays(), are fine.
+        hl = t.apply(self.hl)
+        assert_equal(hl.fpath, self.hl.fpath)
+        assert_allclose(hl.y(), t(self.x, self.y)[1])
+
+    def test_out_and_unchanged_axis(self):
+        t = Transformer().then(scale, ysc=2.0)
+        x, y = t(self.x, self.y)
+        assert_true(x is self.x)
+        out = (np.empty_like(self.x), np.empty_like(self.y))
+        x, y = t(self.x, self.y, out=out)
+        assert_true(x is out[0] and y is out[1])
+        assert_array_equal(y, self.y * 2.0)
+
+    def test_apply_stack(self):
+        stack = HLoopStack(np.vstack([self.x, self.x]),
+                           np.vstack([self.y, -self.y]))
+        t = Transformer([center, second_half])
+        res = t.apply_stack(stack)
+        assert_equal(len(res), 2)
+        for i in range(2):
+            x, y = second_half(*center(stack.loop_x(i).copy(),
+                                       stack.loop_y(i).copy()))
+            assert_allclose(res.loop_y(i), y)
+            assert_array_equal(res.loop_x(i), x)
+
+
+class TestTransformedHLoop:
+    @classmethod
+    def setup(cls):
+        datapath = join(TESTPATH, 'data', 'poleup_poledown')
+        cls.hl = HLoop(join(datapath, '0deg_400G_down_0'), setas='x.y',
+                       sep='\t', skiprows=5)
+        cls.calls = []
+
+        def smooth(x, y, ks=3, **kwargs):
+            cls.calls.append(('smooth', ks))
+            return wrapped_medfilt(x, y, ks=ks)
+
+        def flat(x, y, threshold=200, **kwargs):
+            cls.calls.append(('flat', threshold))
+            return flatten_saturation(x, y, threshold=threshold)
+        cls.smooth, cls.flat = staticmethod(smooth), staticmethod(flat)
+
+    def test_incremental(self):
+        from hloopy.cache import TransformCache, ExtractCache
+        from hloopy.extract import Coercivity, cached_extract
+        tc, ec = TransformCache(), ExtractCache()
+        t = TransformedHLoop(self.hl, [(self.smooth, {'ks': 5}),
+                                       (self.flat, {'threshold': 300})],
+                             cache=tc)
+        x, y = flatten_saturation(*wrapped_medfilt(*self.hl.arrays(), ks=5),
+                                  threshold=300)
+        assert_allclose(t.y(), y)
+        hc = cached_extract(Coercivity, t, cache=ec).avg_val
+        del self.calls[:]
+        t.set_step(1, threshold=250)
+        t.y()
+        assert_equal(self.calls, [('flat', 250)])
+        assert_true(cached_extract(Coercivity, t, cache=ec) is not None)
+        assert_equal(ec.misses, 2)
+        del self.calls[:]
+        t.set_step(1, threshold=300)
+        t.arrays()
+        assert_equal(self.calls, [])
+        assert_equal(cached_extract(Coercivity, t, cache=ec).avg_val, hc)
+        assert_equal(ec.hits, 1)
+        # Derived loops share the common steps.
+        t.then(scale, ysc=2.0).y()
+        assert_equal(self.calls, [])
+
+    def test_source_changes(self):
+        from hloopy.branches import Branches
+        from hloopy.extract import Coercivity
+        hl = HLoop(self.hl.fpath, setas='x.y', sep='\t', skiprows=5)
+        t = TransformedHLoop(hl, [(self.smooth, {'ks': 3})])
+        hc = Coercivity(t).avg_val
+        t.branches()
+        t.df
+        hl.setas('y.x')
+        x, y = wrapped_medfilt(*hl.arrays(), ks=3)
+        assert_array_equal(t.arrays()[0], x)
+        assert_array_equal(t.branches().direction, Branches(x).direction)
+        assert_array_equal(t.df['y'].values, y)
+        assert_true(Coercivity(t).avg_val != hc)
+
+    def test_memory_cap(self):
+        from hloopy.cache import TransformCache
+        nbytes = 2 * self.hl.arrays()[0].nbytes
+        tc = TransformCache(max_bytes=nbytes)
+        t = TransformedHLoop(self.hl, [(self.smooth, {'ks': 3}),
+                                       (self.flat, {})], cache=tc)
+        t.y()
+        assert_equal(len(tc), 1)
+        assert_true(tc.nbytes <= nbytes)
+        del self.calls[:]
+        t.set_step(1, threshold=250)
+        t.y()
+        assert_equal(self.calls, [('smooth', 3), ('flat', 250)])
+
+
+class TestBatch:
+    @classmethod
+    def setup(cls):
+        datapath = join(TESTPATH, 'data', 'poleup_poledown')
+        names = ('0deg_400G_down_0', '0deg_400G_up_0', '0deg_400G_down_1')
+        hls = [HLoop(join(datapath, n), setas='x.y', sep='\t', skiprows=5)
+               for n in names]
+        n = min(len(hl.arrays()[0]) for hl in hls)
+        cls.x = np.vstack([hl.arrays()[0][:n] for hl in hls])
+        cls.y = np.vstack([hl.arrays()[1][:n] for hl in hls])
+
+    def check(self, func, batch, **kwargs):
+        x, y = self.x.copy(), self.y.copy()
+        bx, by = batch(x, y, **kwargs)
+        assert_array_equal(x, self.x)
+        assert_array_equal(y, self.y)
+        for i in range(len(x)):
+            ex, ey = func(x[i].copy(), y[i].copy(), **kwargs)
+            assert_array_equal(bx[i], ex)
+            assert_array_equal(by[i], ey)
+
+    def test_identical(self):
+        self.check(medfilt, medfilt_batch, ks=5)
+        self.check(wrapped_medfilt, wrapped_medfilt_batch, ks=7)
+        self.check(wrapped_medfilt, wrapped_medfilt_batch, ks=3, axis='x')
+        self.check(remove_offset, remove_offset_batch)
+        self.check(center, center_batch, axis='x')
+        self.check(center, center_batch)
+        self.check(normalize, normalize_batch, xlim=(0, 2), ylim=1.0,
+                   n_avg=10)
+        self.check(simple_normalize, simple_normalize_batch, n_avg=5)
+        self.check(simple_normalize, simple_normalize_batch, axis='x')
+
+    def test_threshold_crop(self):
+        mask = threshold_crop_batch(self.x, self.y, thresh=300.0)
+        for i in range(len(self.x)):
+            x, y = threshold_crop(self.x[i], self.y[i], thresh=300.0)
+            assert_array_equal(self.y[i][mask[i]], y)
+
+
+class TestFlattenSaturation:
+    @classmethod
+    def setup(cls):
+        datapath = join(TESTPATH, 'data', 'poleup_poledown')
+        hl = HLoop(join(datapath, '0deg_400G_down_0'), setas='x.y',
+                   sep='\t', skiprows=5)
+        cls.x, cls.y = hl.arrays()
+
+    def test_matches_curve_fit(self):
+        from scipy.optimize import curve_fit
+        for polarity, thresh in (('+', 200), ('-', -200)):
+            mask = self.x > thresh if polarity == '+' else self.x < thresh
+            popt, _ = curve_fit(line, self.x[mask], self.y[mask])
+            x, y, p = flatten_saturation(self.x, self.y, thresh, polarity,
+                                         full_output=True)
+            assert_allclose([p['slope'], p['intercept']], popt, rtol=1e-6)
+            assert_equal(p['n'], mask.sum())
+            assert_allclose(y, self.y - line(self.x, *popt), atol=1e-8)
+
+    def test_batch_both_tails(self):
+        x = np.tile(np.linspace(-400, 400, 801), (3, 1))
+        slopes = np.array([[1e-3], [-2e-3], [0.0]])
+        y = np.tanh(x / 5.0) + slopes * x + 0.5
+        mask = np.ones(x.shape, dtype=bool)
+        mask[:, -1] = False
+        y[:, -1] = 1e6  # excluded spike
+        fx, fy, p = flatten_saturation_batch(x, y, 300, 'both', mask=mask,
+                                             full_output=True)
+        assert_allclose(p['slope'], slopes[:, 0], atol=1e-9)
+        assert_allclose(p['intercept'], 0.5, atol=1e-9)
+        assert_allclose(p['intercept_pos'] - p['intercept_neg'], 2.0,
+                        atol=1e-9)
+        assert_allclose(fy[:, :-1], np.tanh(x[:, :-1] / 5.0), atol=1e-9)
+        # Rows match the per-loop function.
+        for i in range(3):
+            ey = flatten_saturation(x[i], y[i], 300, 'both', mask=mask[i])[1]
+            assert_allclose(fy[i], ey, rtol=1e-12)
+
+    def test_unfittable(self):
+        x = np.vstack([np.linspace(-1, 1, 11), np.linspace(-1, 10, 11)])
+        _, y, p = flatten_saturation_batch(x, x, threshold=5,
+                                           full_output=True)
+        assert_true(np.isnan(p['slope'][0]) and np.isnan(y[0]).all())
+        assert_allclose(y[1], 0.0, atol=1e-12)
+        assert_raises(ValueError, flatten_saturation, x[0], x[0], 5)
+
+
+class TestReentrant:
+    @classmethod
+    def setup(cls):
+        rng = np.random.RandomState(0)
+        cls.x = np.linspace(-400, 400, 2001)
+        cls.y = np.tanh(cls.x / 50.0) + 0.01 * rng.randn(len(cls.x)) + 0.3
+
+    def test_inputs_untouched(self):
+        steps = [(remove_offset, {}), (center, {'axis': 'x'}),
+                 (normalize, {'xlim': 1.0, 'ylim': (0, 2)}),
+                 (simple_normalize, {}), (amr_normalize, {})]
+        for f, kw in steps:
+            x, y = self.x.copy(), self.y.copy()
+            x.flags.writeable = y.flags.writeable = False
+            rx, ry = f(x, y, **kw)
+            assert_array_equal(x, self.x)
+            assert_array_equal(y, self.y)
+            # out= gives the same values, also in place.
+            out = (np.empty_like(x), np.empty_like(y))
+            ox, oy = f(x, y, out=out, **kw)
+            assert_true(ox is out[0] and oy is out[1])
+            assert_array_equal(oy, ry)
+            assert_array_equal(ox, rx)
+            x, y = self.x.copy(), self.y.copy()
+            ix, iy = f(x, y, out=(x, y), **kw)
+            assert_true(iy is y)
+            assert_array_equal(iy, ry)
+
+    def test_context(self):
+        a, b = TransformContext(), TransformContext()
+        for i in range(3):
+            ya = vertical_offset(self.x, self.y, dy=1.0, context=a)[1]
+        yb = vertical_offset(self.x, self.y, dy=1.0, context=b)[1]
+        assert_allclose(ya - self.y, 3.0)
+        assert_allclose(yb - self.y, 1.0)
+        t = Transformer([(vertical_offset, {'dy': 0.5})])
+        c = TransformContext()
+        t(self.x, self.y, context=c)
+        assert_equal(c.state['vertical_offset'], 0.5)
+
+    def test_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        t = Transformer([center, (wrapped_medfilt, {'ks': 5}),
+                         (normalize, {'ylim': 1.0}),
+                         (scale, {'xsc': 0.5})])
+        ys = [self.y * (i + 1) for i in range(16)]
+        serial = [t(self.x, y)[1] for y in ys]
+        with ThreadPoolExecutor(max_workers=4) as ex:
+            par = list(ex.map(lambda y: t(self.x, y)[1], ys))
+        for a, b in zip(serial, par):
+            assert_array_equal(a, b)